@@ -1,5 +1,4 @@
 import re
-import requests
 import socket
 import uuid
 import os
@@ -7,21 +6,30 @@ import shutil
 import json
 import tempfile
 import logging
-import glob
 import time
 import csv
-from datetime import datetime, timedelta
-from typing import Tuple, Optional, Dict, Any
-from DrissionPage import ChromiumPage, ChromiumOptions
-import pandas as pd
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Tuple, Optional, Dict, Any, Sequence, TYPE_CHECKING
 import random 
 import secrets
-import pytz
-from snowflake.connector import connect
-from snowflake.connector.pandas_tools import write_pandas
-from dotenv import load_dotenv,find_dotenv
 
-zone_dubai = pytz.timezone('Europe/Paris') 
+from everli_parsing import API_BASE, flatten_category_tree, leaf_categories, extract_vertical_list
+from everli_metrics import RunMetrics
+from everli_profiling import StageProfiler
+from everli_retry import PERMANENT, RetryPolicy, CircuitOpenError, RetryExhausted
+from everli_stores import load_store_manifest
+from everli_log_rotation import LogRotator
+from everli_targets import RequestPacer, ScrapeTarget, SharedResources
+
+if TYPE_CHECKING:
+    from DrissionPage import ChromiumPage
+
+# Heavy dependencies (DrissionPage, snowflake, pandas, pytz, requests, dotenv)
+# are imported inside the functions that need them so that workers and
+# analysis tools importing this module only pay for what they use.
+
+zone_name = 'Europe/Paris'
 user_name = 'eBench'
 device_name = 'R58TA1620HF'
 country = 'ITALY'
@@ -30,27 +38,49 @@ ctry = country
 scrapper_id = '0'
 scrapper_number = '1'
 
-dotenv_path = find_dotenv()
+SNOWFLAKE_DATABASE = 'PRICEPRODUCTSCRAPPERDB'
+SNOWFLAKE_SCHEMA = 'DBO'
 
-if dotenv_path:
+_zone = None
+_environment_loaded = False
 
-    print(f".env file found at: {dotenv_path}")
 
-    load_dotenv(dotenv_path) 
+def get_zone():
+    """Return the pytz timezone used for run timestamps"""
+    global _zone
+    if _zone is None:
+        import pytz
+        _zone = pytz.timezone(zone_name)
+    return _zone
 
-else:
 
-    print("No .env file found. Make sure it exists in the project directory.")
+def load_environment() -> None:
+    """Load the .env file once, on first use"""
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    _environment_loaded = True
+    from dotenv import load_dotenv, find_dotenv
+    dotenv_path = find_dotenv()
+    if dotenv_path:
+        print(f".env file found at: {dotenv_path}")
+        load_dotenv(dotenv_path) 
+    else:
+        print("No .env file found. Make sure it exists in the project directory.")
 
-SNOWFLAKE_CONFIG = {
-   'user': os.getenv('USER'),
-   'password': os.getenv('PASSWORD'),
-   'role': os.getenv('ROLE'),
-   'account': os.getenv('ACCOUNT'),
-   'database': os.getenv('DATABASE'),
-   'warehouse': os.getenv('WAREHOUSE'),
-   'schema': os.getenv('SCHEMA')
-}
+
+def get_snowflake_config() -> Dict[str, Optional[str]]:
+    """Build the Snowflake connection settings from the environment"""
+    load_environment()
+    return {
+       'user': os.getenv('USER'),
+       'password': os.getenv('PASSWORD'),
+       'role': os.getenv('ROLE'),
+       'account': os.getenv('ACCOUNT'),
+       'database': os.getenv('DATABASE'),
+       'warehouse': os.getenv('WAREHOUSE'),
+       'schema': os.getenv('SCHEMA')
+    }
  
 
 class SimplifiedTokenExtractor:    
@@ -79,8 +109,10 @@ class SimplifiedTokenExtractor:
             return None
 
 class HeaderManager:    
-    def __init__(self, logger):
+    def __init__(self, logger, api_country: str = 'ITA', whitelabel: str = 'it.everli.com'):
         self.logger = logger
+        self.api_country = api_country
+        self.whitelabel = whitelabel
         self.session_id = None
         self.device_fingerprint = None
     
@@ -132,9 +164,9 @@ class HeaderManager:
             'accept': 'application/json, text/plain, */*',
             'accept-language': 'en-GB,en-US;q=0.9,en;q=0.8',
             'if-none-match': 'W/"50d7e1bef6bfcedccfeec1e1b5e1fb9b"',
-            'origin': 'https://it.everli.com',
+            'origin': f'https://{self.whitelabel}',
             'priority': 'u=1, i',
-            'referer': 'https://it.everli.com/',
+            'referer': f'https://{self.whitelabel}/',
             'sec-ch-ua': '"Chromium";v="136", "Google Chrome";v="136", "Not.A/Brand";v="99"',
             'sec-ch-ua-mobile': '?0',
             'sec-ch-ua-platform': '"Windows"',
@@ -143,10 +175,10 @@ class HeaderManager:
             'sec-fetch-site': 'same-site',
             'user-agent': self.get_random_user_agent(),
             'x-s24-client': 'website/8.4.1',
-            'x-s24-country': 'ITA',
+            'x-s24-country': self.api_country,
             'x-s24-device-resolution': self.get_random_screen_resolution(),
             'x-s24-tracking': 'false',
-            'x-s24-whitelabel': 'it.everli.com',
+            'x-s24-whitelabel': self.whitelabel,
             'user-session': self.generate_session_id(),
             'x-device-id': self.generate_device_fingerprint(),
         }  
@@ -160,7 +192,8 @@ class HeaderManager:
 
 class StructuredLogger:
     """CSV-only structured logger for scraper operations"""
-    def __init__(self, log_dir: str, scraper_name: str, source: str, schedule: str, machine_id: str, job_id: int = 1):
+    def __init__(self, log_dir: str, scraper_name: str, source: str, schedule: str, machine_id: str, job_id: int = 1,
+                 rotator: Optional[LogRotator] = None):
         self.log_dir = log_dir
         self.scraper_name = scraper_name
         self.source = source
@@ -171,12 +204,17 @@ class StructuredLogger:
         self.last_step_time = self.start_time
         self.machine_ip = self._get_machine_ip()
         os.makedirs(log_dir, exist_ok=True)
-        self.csv_log_path = os.path.join(log_dir, f'scraper_logs_{datetime.now().strftime("%Y-%m-%d")}.csv')
+        today = datetime.now().strftime("%Y-%m-%d")
+        self.csv_log_path = rotator.active_path(today) if rotator else os.path.join(log_dir, f'scraper_logs_{today}.csv')
+        self.rotator = rotator
+        if rotator:
+            rotator.adopt_stale_files(self.csv_log_path)
         self._setup_csv_logger()
         self.current_category = ""
         self.current_subcategory = ""
         self.current_product_url = ""
         self.current_status = "in_progress"
+        self.profiler = None
     
     def _get_machine_ip(self) -> str:
         """Get the machine's IP address"""
@@ -206,6 +244,7 @@ class StructuredLogger:
             with open(self.csv_log_path, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=self.csv_fieldnames)
                 writer.writeheader()
+        self.csv_log_size = os.path.getsize(self.csv_log_path)
     
     def _get_caller_info(self):
         """Get information about the calling function"""
@@ -233,54 +272,62 @@ class StructuredLogger:
     def _log_to_csv(self, level: str, message: str, error_message: str = "", 
                 data_size: int = 0, inconsistent_data_count: int = 0):
         """Log structured data to CSV and print to console"""
-        caller_info = self._get_caller_info()
+        with self.profiler.stage('log') if self.profiler else nullcontext():
+            caller_info = self._get_caller_info()
         
-        step_total_seconds = time.time() - self.last_step_time
-        self.last_step_time = time.time()
-        step_minutes = int(step_total_seconds // 60)
-        step_seconds = int(step_total_seconds % 60)
-        step_duration = f"{step_minutes}m {step_seconds}s"
+            step_total_seconds = time.time() - self.last_step_time
+            self.last_step_time = time.time()
+            step_minutes = int(step_total_seconds // 60)
+            step_seconds = int(step_total_seconds % 60)
+            step_duration = f"{step_minutes}m {step_seconds}s"
         
-        total_seconds_from_start = time.time() - self.start_time
-        duration_from_start = self._format_duration(total_seconds_from_start)
-        final_error_message = error_message
-        should_populate_error = (
-            level in ["ERROR", "WARNING"] or 
-            any(keyword in message.lower() for keyword in [
-                'error', 'exception', 'failed', 'failure', 'timeout', 
-                'connection', 'unable', 'cannot', 'blocked', 'invalid']) )
-        if should_populate_error and not error_message:
-            final_error_message = message
-        log_entry = {
-            'asctime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'levelname': level,
-            'filename': caller_info['filename'],
-            'funcName': caller_info['funcName'],
-            'lineno': caller_info['lineno'],
-            'scraper_name': self.scraper_name,
-            'source': self.source,
-            'schedule': self.schedule,
-            'machine_id': self.machine_id,
-            'machine_ip': self.machine_ip,
-            'job_id': self.job_id,
-            'category': self.current_category,
-            'subcategory': self.current_subcategory,
-            'product_url': self.current_product_url,
-            'duration': step_duration,
-            'duration_from_start': duration_from_start,
-            'status': self.current_status,
-            'error_message': final_error_message,
-            'data_size': data_size,
-            'inconsistent_data_count': inconsistent_data_count,
-            'message': message
-        }
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')        
-        try:
-            with open(self.csv_log_path, 'a', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=self.csv_fieldnames)
-                writer.writerow(log_entry)
-        except Exception as e:
-            print(f"Failed to write to CSV log: {e}")
+            total_seconds_from_start = time.time() - self.start_time
+            duration_from_start = self._format_duration(total_seconds_from_start)
+            final_error_message = error_message
+            should_populate_error = (
+                level in ["ERROR", "WARNING"] or 
+                any(keyword in message.lower() for keyword in [
+                    'error', 'exception', 'failed', 'failure', 'timeout', 
+                    'connection', 'unable', 'cannot', 'blocked', 'invalid']) )
+            if should_populate_error and not error_message:
+                final_error_message = message
+            log_entry = {
+                'asctime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'levelname': level,
+                'filename': caller_info['filename'],
+                'funcName': caller_info['funcName'],
+                'lineno': caller_info['lineno'],
+                'scraper_name': self.scraper_name,
+                'source': self.source,
+                'schedule': self.schedule,
+                'machine_id': self.machine_id,
+                'machine_ip': self.machine_ip,
+                'job_id': self.job_id,
+                'category': self.current_category,
+                'subcategory': self.current_subcategory,
+                'product_url': self.current_product_url,
+                'duration': step_duration,
+                'duration_from_start': duration_from_start,
+                'status': self.current_status,
+                'error_message': final_error_message,
+                'data_size': data_size,
+                'inconsistent_data_count': inconsistent_data_count,
+                'message': message
+            }
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')        
+            try:
+                if not os.path.exists(self.csv_log_path):
+                    # Removed from under us (e.g. adopted as stale); start it again with its header
+                    self._setup_csv_logger()
+                with open(self.csv_log_path, 'a', newline='', encoding='utf-8') as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=self.csv_fieldnames)
+                    writer.writerow(log_entry)
+                    self.csv_log_size = csvfile.tell()
+                if self.rotator and self.rotator.should_rotate(self.csv_log_size):
+                    self.rotator.close_segment(self.csv_log_path)
+                    self._setup_csv_logger()
+            except Exception as e:
+                print(f"Failed to write to CSV log: {e}")
     
     def set_context(self, category: str = "", subcategory: str = "", 
                    product_url: str = "", status: str = ""):
@@ -329,15 +376,20 @@ class StructuredLogger:
         duration_formatted = self._format_duration(duration)
         self.log_info(f"Job {self.job_id} completed. Total duration: {duration_formatted}", 
                      data_size=total_data_size)
+        if self.rotator:
+            self.rotator.wait()
     
-    def log_success(self, message: str, data_size: int = 0):
+    def log_success(self, message: str, data_size: int = 0, inconsistent_data_count: int = 0):
         """Log successful operation"""
         self.set_context(status="success")
-        self.log_info(message, data_size=data_size)
+        self.log_info(message, data_size=data_size, inconsistent_data_count=inconsistent_data_count)
 
 class EverliRegistrationBot: 
     MAIL_TM_API = "https://api.mail.tm"
     LOG_DIR = "Everli_logs"
+    LOG_MAX_BYTES = 64 * 1024 * 1024
+    LOG_MAX_TOTAL_BYTES = 1024 * 1024 * 1024
+    LOG_RETENTION_DAYS = 7
     
     def __init__(self):
         self.machine_id = socket.gethostname()
@@ -348,27 +400,31 @@ class EverliRegistrationBot:
             source="it.everli.com",
             schedule="daily",  
             machine_id=self.machine_id,
-            job_id=self.job_id
+            job_id=self.job_id,
+            rotator=LogRotator(self.LOG_DIR, max_bytes=self.LOG_MAX_BYTES,
+                               max_total_bytes=self.LOG_MAX_TOTAL_BYTES, max_age_days=self.LOG_RETENTION_DAYS)
         )
         self.header_manager = HeaderManager(self.logger)
         self.authentication_token = None  
+        import requests
         self.session = requests.Session()  
         self.last_keep_alive = time.time()
+        self.api_base = API_BASE
+        self.browser_login = True
         self._cleanup_old_logs()
     
-    def _cleanup_old_logs(self, retention_days: int = 7) -> None:
+    def use_target(self, target: ScrapeTarget) -> None:
+        """Send the target's country and whitelabel headers and log under its whitelabel"""
+        self.header_manager.api_country = target.api_country
+        self.header_manager.whitelabel = target.whitelabel
+        self.logger.source = target.whitelabel
+        self.api_base = target.api_base
+    
+    def _cleanup_old_logs(self) -> None:
+        """Delete log segments past the retention age, then the oldest ones over the total size budget"""
         try:
-            cutoff_date = datetime.now() - timedelta(days=retention_days)
-            log_pattern = os.path.join(self.LOG_DIR, 'scraper_logs_*.csv')
-            for log_file in glob.glob(log_pattern):
-                try:
-                    file_date_str = os.path.basename(log_file).replace('scraper_logs_', '').replace('.csv', '')
-                    file_date = datetime.strptime(file_date_str, '%Y-%m-%d')
-                    if file_date < cutoff_date:
-                        os.remove(log_file)
-                        self.logger.log_info(f"Removed old log file: {log_file}")  
-                except (ValueError, OSError) as e:
-                        self.logger.log_warning(f"Could not process log file {log_file}: {e}") 
+            for log_file in self.logger.rotator.apply_retention(self.logger.csv_log_path):
+                self.logger.log_info(f"Removed old log file: {log_file}")
         except Exception as e:
                 self.logger.log_error(f"Error during log cleanup", e)
     
@@ -381,7 +437,7 @@ class EverliRegistrationBot:
     def refresh_authentication(self, max_retries: int = 3, base_delay: float = 5.0) -> bool:
         try:
             self.logger.log_info("Attempting to extend session with keep-alive request")
-            keep_alive_url = "https://api.everli.com/sm/api/v3/stores?latitude=45.46427&longitude=9.18951"
+            keep_alive_url = f"{self.api_base}/stores?latitude=45.46427&longitude=9.18951"
             headers = self.get_headers_for_request(self.authentication_token, keep_alive_url)
             params = {'skip': '0', 'take': '10'} 
             for attempt in range(max_retries):
@@ -411,14 +467,15 @@ class EverliRegistrationBot:
                     continue
             self.logger.log_info("Falling back to re-registration after keep-alive failures")
             try:
-                page, temp_profile = self.setup_browser()
-                page.get("https://it.everli.com/")
-                time.sleep(2)
-                self.logout_current_session(page)
-                page.quit()
-                if temp_profile and os.path.exists(temp_profile):
-                    shutil.rmtree(temp_profile)
-                    self.logger.log_info(f"Cleaned up temp profile before re-registration: {temp_profile}")
+                if self.browser_login:
+                    page, temp_profile = self.setup_browser()
+                    page.get("https://it.everli.com/")
+                    time.sleep(2)
+                    self.logout_current_session(page)
+                    page.quit()
+                    if temp_profile and os.path.exists(temp_profile):
+                        shutil.rmtree(temp_profile)
+                        self.logger.log_info(f"Cleaned up temp profile before re-registration: {temp_profile}")
             except Exception as e:
                 self.logger.log_warning(f"Failed to fully logout: {e}")
 
@@ -439,6 +496,7 @@ class EverliRegistrationBot:
     
     def create_temporary_email(self) -> Tuple[str, str, str]:
         """Create a temporary email account using Mail.tm API."""
+        import requests
         max_retries = 3
         base_delay = 3
         for attempt in range(max_retries):
@@ -482,6 +540,7 @@ class EverliRegistrationBot:
     
     def poll_for_confirmation_email(self, email_token: str, timeout: int = 300) -> str:
         """Poll Mail.tm for confirmation email with verification link."""
+        import requests
         deadline = time.time() + timeout
         poll_interval = 10
         
@@ -572,9 +631,10 @@ class EverliRegistrationBot:
                 time.sleep(2)
         raise Exception("'Continue with Email' button not found or not clickable")
     
-    def setup_browser(self) -> Tuple[ChromiumPage, str]:
+    def setup_browser(self) -> Tuple['ChromiumPage', str]:
         """Set up Chrome browser with temporary profile."""
         try:
+            from DrissionPage import ChromiumPage, ChromiumOptions
             temp_profile = tempfile.mkdtemp(prefix="everli_profile_")
             options = ChromiumOptions()
             options.headless(False)
@@ -782,19 +842,23 @@ class EverliRegistrationBot:
 
 def get_snowflake_connection():
     """Create and return a Snowflake connection"""
-    return connect(**SNOWFLAKE_CONFIG)
+    from snowflake.connector import connect
+    return connect(**get_snowflake_config())
 
-def initialize_source_file():
-    """Initialize source file in Snowflake and return source_file_ID"""
+def initialize_source_file(source: str = src, country_code: str = ctry, scraper_id: str = scrapper_id,
+                           connection=None):
+    """Initialize source file in Snowflake and return source_file_ID; a passed connection is left open"""
+    import pandas as pd
+    from snowflake.connector.pandas_tools import write_pandas
     
     # Get URL and source information from Snowflake
     query = f"""SELECT u.*,s.Source_name, c.Country_Code 
                 from Url u 
                 left join Source s on u.Source_ID=s.Source_ID 
                 left join Country c on u.Country_ID=c.Country_ID 
-                where u.active=1 and c.Country_Code='{ctry}' and s.Source_Name='{src}';"""
+                where u.active=1 and c.Country_Code='{country_code}' and s.Source_Name='{source}';"""
     
-    snowflake_cn = get_snowflake_connection()
+    snowflake_cn = connection or get_snowflake_connection()
     cursor = snowflake_cn.cursor()
     cursor.execute(query)
     
@@ -802,9 +866,9 @@ def initialize_source_file():
     df = df.reset_index(drop=True).reset_index()
     
     # Generate file name with timestamp
-    now = datetime.now(zone_dubai)
+    now = datetime.now(get_zone())
     nw = str(now.year) + 'y' + str(now.month) + 'm' + str(now.day) + 'd' + ' ' + str(now.hour) + 'h' + str(now.minute) + 'm' + str(now.second) + 's'
-    f_name = nw + 'multitest' + src.replace(' ', '') + '' + ctry + '_' + scrapper_id + '.csv'
+    f_name = nw + 'multitest' + source.replace(' ', '') + '' + country_code + '_' + scraper_id + '.csv'
     
     source_1 = str(df['SOURCE_ID'].values[0])
     country_1 = str(df['COUNTRY_ID'].values[0])
@@ -817,8 +881,8 @@ def initialize_source_file():
     })
     
     # Write to Snowflake
-    schema = 'DBO'
-    database = 'PRICEPRODUCTSCRAPPERDB'
+    schema = SNOWFLAKE_SCHEMA
+    database = SNOWFLAKE_DATABASE
     table_name = 'SOURCE_FILE'
     
     success, num_chunks, num_rows, _ = write_pandas(
@@ -835,222 +899,451 @@ def initialize_source_file():
     df_fname = cursor.fetch_pandas_all()
     source_file_ID = df_fname['SOURCE_FILE_ID'].values[0]
     
-    snowflake_cn.close()
+    if connection is None:
+        snowflake_cn.close()
     return source_file_ID, source_1, country_1
 
-def get_area_data(source_1, country_1):
+def get_area_data(source_1, country_1, scraper_id: str = scrapper_id, scraper_number: str = scrapper_number,
+                  connection=None):
     """Get area data from Snowflake based on source and country"""
+    import pandas as pd
     query = f"""SELECT * from area 
                 where area_id in (
                     select area_id from Area_Source_Country 
                     where source_id={source_1} and country_id={country_1}
                 );"""
     
-    snowflake_cn = get_snowflake_connection()
+    snowflake_cn = connection or get_snowflake_connection()
     cursor = snowflake_cn.cursor()
     cursor.execute(query)
     
     df_zone = pd.DataFrame.from_records(iter(cursor), columns=[x[0] for x in cursor.description])
     df_zone = df_zone.reset_index(drop=True).reset_index()
-    df_zone = df_zone[df_zone['index'] % int(scrapper_number) == int(scrapper_id)].reset_index(drop=True)
+    df_zone = df_zone[df_zone['index'] % int(scraper_number) == int(scraper_id)].reset_index(drop=True)
     
-    snowflake_cn.close()
+    if connection is None:
+        snowflake_cn.close()
     return df_zone
 
-def load_stores_data():
-    """Load and filter stores data based on scraper configuration"""
+def load_stores_data(seller_list_path: str = 'Everli_Italy_Seller_List_Needed.csv',
+                     scraper_id: str = scrapper_id, scraper_number: str = scrapper_number):
+    """Load and filter store records based on scraper configuration"""
     try:
-        stores = pd.read_csv('Everli_Italy_Seller_List_Needed.csv')
+        stores = load_store_manifest(seller_list_path)
     except FileNotFoundError:
-        print("Warning: Everli_Italy_Seller_List_Needed.csv not found. Please ensure the file exists.")
-        stores = pd.DataFrame()  # Empty dataframe as fallback
+        print(f"Warning: {seller_list_path} not found. Please ensure the file exists.")
+        stores = []
     
-    if not stores.empty:
-        stores = stores.reset_index()
-        stores = stores[stores['index'] % int(scrapper_number) == int(scrapper_id)].reset_index(drop=True)
-    
-    return stores
+    return [store for index, store in enumerate(stores)
+            if index % int(scraper_number) == int(scraper_id)]
+
+def load_products_file(csv_path: str, table_name: str, chunk_size: int = 100000) -> int:
+    """Upload a products CSV into a Snowflake table and return the number of rows written.
+
+    Rows are loaded per (source_file_id, store_link) through StoreLoader, so
+    stores already loaded into the table are skipped and rerunning the load
+    never uploads a store twice.
+    """
+    import pandas as pd
+    from snowflake.connector.pandas_tools import write_pandas
+    from everli_run_registry import StoreLoader
+
+    snowflake_cn = get_snowflake_connection()
+
+    def write(rows) -> int:
+        success, num_chunks, num_rows, _ = write_pandas(
+            conn=snowflake_cn,
+            df=rows.reset_index(drop=True),
+            table_name=table_name.upper(),
+            database=SNOWFLAKE_DATABASE,
+            schema=SNOWFLAKE_SCHEMA,
+            auto_create_table=True
+        )
+        return num_rows
+
+    total_rows = 0
+    try:
+        loader = StoreLoader(snowflake_cn, table_name.upper(), write)
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size, dtype=str):
+            chunk.columns = [col.upper().replace('.', '_') for col in chunk.columns]
+            total_rows += loader.add(chunk)
+        loader.finish()
+        if loader.skipped:
+            print(f"Skipped {len(loader.skipped)} stores already loaded into {table_name.upper()}")
+    finally:
+        snowflake_cn.close()
+    return total_rows
 
-def main_execution():
-    """Enhanced main execution with Snowflake integration"""
+class StoreCutShort(Exception):
+    """A store stopped early by the circuit breaker or the retry budget"""
+
+    def __init__(self, next_category: int):
+        super().__init__(f"store stopped before category {next_category}")
+        self.next_category = next_category
+
+def save_checkpoint(checkpoint_file: str, checkpoint: Dict[str, Any]) -> None:
+    with open(checkpoint_file, 'w') as f:
+        json.dump(checkpoint, f)
+
+def main_execution(record_path: Optional[str] = None, replay_path: Optional[str] = None,
+                   output_dir: str = '.', api_base: str = API_BASE, request_pause: Optional[float] = None,
+                   stub_services: bool = False, seller_list_path: str = 'Everli_Italy_Seller_List_Needed.csv',
+                   profile_stages: Sequence[str] = (), profile_top_n: int = 25, profile_memory: bool = True,
+                   raw_archive: bool = False, price_history_path: Optional[str] = None,
+                   normalize_workers: int = 0, memory_limit_mb: Optional[float] = None,
+                   arrow_output: bool = False, category_plan_path: Optional[str] = None,
+                   full_sweep_every: int = 7, target: Optional[ScrapeTarget] = None, shared: Optional[SharedResources] = None):
+    """Enhanced main execution with Snowflake integration.
+
+    record_path saves every API response to a fixture archive; replay_path
+    serves a recorded archive instead of the network, with the browser
+    login and Snowflake calls stubbed out, so a run can be reproduced
+    offline into output_dir. stub_services stubs the browser login and
+    Snowflake calls while still fetching, keep-alive requests included,
+    from api_base, e.g. a local stub server.
+    profile_stages turns on cProfile/tracemalloc for those stages, with
+    per-store dumps under Everli_logs/profiles/. raw_archive keeps every
+    raw response under <output_dir>/Everli_raw/<run_id>/ for later reparsing.
+    price_history_path folds each store's output into that price history
+    database. normalize_workers > 0 decodes and normalizes category listings
+    in that many worker processes while the loop keeps fetching.
+    memory_limit_mb spills a store's category frames to disk as the
+    process nears that RSS; peak RSS per store is logged either way.
+    target replaces the module-level source, country, seller list and
+    output settings, and shared (see everli_targets.run_targets) reuses
+    another run's bot, metrics and Snowflake connection. arrow_output also
+    writes each store's products as Feather v2 under
+    Data_Products_Eveli_arrow/ for memory-mapped reads (everli_arrow).
+    category_plan_path orders each store's categories by the sizes seen in
+    earlier runs and defers ones that keep coming back empty, requesting
+    everything every full_sweep_every runs (everli_category_plan).
+    Returns the run's RunMetrics.
+    """
+    from everli_replay import FixtureArchive
+    if target is None:
+        target = ScrapeTarget('default', source=src, country=ctry, seller_list=seller_list_path,
+                              output_dir=output_dir, api_base=api_base, scraper_id=scrapper_id,
+                              scraper_number=scrapper_number)
     # Initialize Snowflake data
-    print(f"Initializing scraper {scrapper_id} of {scrapper_number} for {src} in {country}")
-    print(f"Using timezone: {zone_dubai}")
+    print(f"Initializing scraper {target.scraper_id} of {target.scraper_number} for {target.source} in {target.country}")
+    print(f"Using timezone: {get_zone()}")
     print(f"Device: {device_name}, User: {user_name}")
     
-    # Initialize source file and get IDs
-    source_file_ID, source_1, country_1 = initialize_source_file()
-    print(f"Source file ID: {source_file_ID}")
-    
-    # Get area data
-    df_zone = get_area_data(source_1, country_1)
-    print(f"Found {len(df_zone)} areas to process")
+    replay_archive = FixtureArchive(replay_path) if replay_path else None
+    record_archive = FixtureArchive(record_path, 'w') if record_path else None
+    try:
+        return _run_stores(record_archive, replay_archive, target, shared,
+                           request_pause, stub_services,
+                           profile_stages, profile_top_n, profile_memory, raw_archive, price_history_path,
+                           normalize_workers, memory_limit_mb, arrow_output, category_plan_path, full_sweep_every)
+    finally:
+        for archive in (record_archive, replay_archive):
+            if archive is not None:
+                archive.close()
+
+
+def _run_stores(record_archive, replay_archive, target: ScrapeTarget, shared: Optional[SharedResources],
+                request_pause: Optional[float], stub_services: bool,
+                profile_stages: Sequence[str], profile_top_n: int, profile_memory: bool,
+                raw_archive: bool, price_history_path: Optional[str], normalize_workers: int,
+                memory_limit_mb: Optional[float], arrow_output: bool, category_plan_path: Optional[str],
+                full_sweep_every: int):
+    import pandas as pd
+    from everli_replay import RecordingSession, ReplaySession
+    from everli_normalize import products_after_checkpoint, normalize_products, add_store_columns, append_products_csv
+    from everli_validation import ProductValidator, write_quarantine
+    from everli_raw_archive import RAW_ARCHIVE_DIR, RawArchiveWriter, store_archive_path
+    from everli_price_history import PriceHistory
+    from everli_parallel import NormalizePool
+    from everli_memory import SPILL_DIR, MemoryBudget
+    from everli_arrow import ARROW_DIR, StoreArrowWriter
+    from everli_run_registry import RunRegistry, record_run
+    from everli_category_plan import CategoryPlanner
+
+    offline_services = stub_services or replay_archive is not None
+    output_dir, api_base = target.output_dir, target.api_base
+    connection = shared.snowflake_connection() if shared and not offline_services else None
+    os.makedirs(output_dir, exist_ok=True)
+    run_registry = RunRegistry(output_dir)
+
+    # Initialize source file and get IDs, reusing the running run's on resume
+    if stub_services:
+        create_source_file = lambda: (0, None, None)
+    elif replay_archive is not None:
+        run_metadata = replay_archive.read_run_metadata()
+        create_source_file = lambda: (run_metadata.get('source_file_ID', 0), run_metadata.get('source_1'),
+                                      run_metadata.get('country_1'))
+        print(f"Replaying {replay_archive.path} (recorded source file ID: {run_metadata.get('source_file_ID', 0)})")
+    else:
+        create_source_file = lambda: initialize_source_file(
+            target.source, target.country, target.scraper_id, connection=connection)
+    (source_file_ID, source_1, country_1), resumed = run_registry.start(create_source_file, target.source,
+                                                                        target.country)
+    if resumed:
+        print(f"Resuming run {run_registry.run['run_id']} under source file ID: {source_file_ID}")
+    elif not offline_services:
+        print(f"Source file ID: {source_file_ID}")
+    if not offline_services:
+        # Get area data
+        df_zone = get_area_data(source_1, country_1, target.scraper_id, target.scraper_number, connection=connection)
+        print(f"Found {len(df_zone)} areas to process")
+    if record_archive is not None:
+        record_archive.write_run_metadata({'source_file_ID': int(source_file_ID), 'source_1': source_1, 'country_1': country_1})
     
     # Load stores data
-    stores = load_stores_data()
-    if stores.empty:
+    stores = load_stores_data(target.seller_list, target.scraper_id, target.scraper_number)
+    if not stores:
         print("No stores data found. Exiting.")
-        return
+        return None
     
     print(f"Processing {len(stores)} stores")
     
     start_index = 0
     stores_done = []
-    master_csv_path = "Data_Products_Eveli.csv"
-    checkpoint_file = "Everli_checkpoint.json"
-    data_products = pd.DataFrame()
+    master_csv_path = os.path.join(output_dir, "Data_Products_Eveli.csv")
+    quarantine_csv_path = os.path.join(output_dir, "Data_Products_Eveli_quarantine.csv")
+    checkpoint_file = os.path.join(output_dir, "Everli_checkpoint.json")
+    arrow_dir = os.path.join(output_dir, ARROW_DIR) if arrow_output else None
     
-    bot = EverliRegistrationBot()
-    bot.logger.log_job_start()
+    if shared:
+        bot = shared.bot
+    else:
+        bot = EverliRegistrationBot()
+        bot.logger.log_job_start()
+    bot.use_target(target)
     total_data_size = 0
+    validator = ProductValidator()
+
+    def sync_run_registry() -> None:
+        if offline_services:
+            return
+        try:
+            registry_cn = connection or get_snowflake_connection()
+            try:
+                record_run(registry_cn, run_registry.run, bot.machine_id)
+            finally:
+                if connection is None:
+                    registry_cn.close()
+        except Exception as e:
+            bot.logger.log_warning(f"Could not record run {run_registry.run['run_id']} in Snowflake: {e}")
 
+    sync_run_registry()
     checkpoint = {'store_index': 0, 'category_index': 0, 'last_processed_product_id': None}
-    if os.path.exists(checkpoint_file):
+    if run_registry.previous_status == 'completed' and os.path.exists(checkpoint_file):
+        bot.logger.log_info(f"Ignoring the checkpoint of completed run; starting source file {source_file_ID}")
+    elif os.path.exists(checkpoint_file):
         try:
             with open(checkpoint_file, 'r') as f:
                 checkpoint = json.load(f)
             start_index = checkpoint['store_index']
         except Exception as e:
             bot.logger.log_warning(f"Failed to load checkpoint: {e}. Starting from scratch.")
+    if resumed and run_registry.partial_indexes():
+        # Stores cut short earlier in this run come before the checkpointed one
+        start_index = min(start_index, run_registry.partial_indexes()[0])
 
     # Obtain authentication token
-    authentication_token = bot.register_and_confirm()
+    if shared and bot.authentication_token:
+        authentication_token = bot.authentication_token
+    elif offline_services:
+        # Only the browser login is stubbed; keep-alive requests still go to api_base
+        bot.register_and_confirm = lambda: f"stub-{uuid.uuid4().hex}"
+        bot.browser_login = False
+        authentication_token = bot.authentication_token = bot.register_and_confirm()
+        if replay_archive is not None:
+            # A recorded run has no keep-alive responses to replay
+            def refresh_stub_token(*args, **kwargs) -> bool:
+                bot.authentication_token = bot.register_and_confirm()
+                return True
+            bot.refresh_authentication = refresh_stub_token
+    else:
+        authentication_token = bot.register_and_confirm()
     if not authentication_token or authentication_token == 'null':
         bot.logger.log_error("Failed to obtain valid vAuthToken. Exiting.")
-        bot.logger.log_job_end(total_data_size)
-        return
+        if not shared:
+            bot.logger.log_job_end(total_data_size)
+        return None
 
     bot.logger.log_success(f"vAuthToken obtained successfully: {authentication_token}")
     headers = bot.get_headers_for_request(authentication_token)
+    metrics = shared.metrics if shared else RunMetrics(bot.LOG_DIR, bot.job_id)
+    profiler = StageProfiler(bot.LOG_DIR, bot.job_id, profile_stages, top_n=profile_top_n, memory=profile_memory)
+    if profiler.enabled:
+        bot.logger.profiler = profiler
+        bot.logger.log_info(f"Profiling stages {sorted(profiler.stages)} into {profiler.output_dir}")
+    run_clock = lambda: datetime.now(get_zone()).strftime("%Y-%m-%d %H:%M:%S")
+    if replay_archive is not None:
+        http_client = ReplaySession(replay_archive)
+        run_clock = lambda: http_client.last_recorded_at
+        retry_policy = RetryPolicy(bot.logger, metrics=metrics, sleep=lambda delay: None)
+        request_pause = 0 if request_pause is None else request_pause
+    else:
+        http_client = bot.session
+        if record_archive is not None:
+            http_client = RecordingSession(bot.session, record_archive, run_clock)
+            # nw is the timestamp stored with the response, which the replay reads back
+            run_clock = lambda: http_client.last_recorded_at
+        retry_policy = RetryPolicy(bot.logger, metrics=metrics)
+        request_pause = 1.5 if request_pause is None else request_pause
+    pacer = RequestPacer(target.request_interval(request_pause))
+
+    def reauthenticate() -> bool:
+        nonlocal headers
+        if bot.refresh_authentication():
+            headers = bot.get_headers_for_request(bot.authentication_token)
+            return True
+        return False
+
+    raw_run_dir = os.path.join(output_dir, RAW_ARCHIVE_DIR, run_registry.run['run_id']) if raw_archive else None
+    if raw_run_dir:
+        bot.logger.log_info(f"Archiving raw responses to {raw_run_dir}")
+    price_history = PriceHistory(price_history_path) if price_history_path else None
+    normalize_pool = NormalizePool(normalize_workers) if normalize_workers else None
+    if normalize_pool:
+        bot.logger.log_info(f"Normalizing category listings in {normalize_workers} worker processes")
+    memory_budget = MemoryBudget(os.path.join(output_dir, SPILL_DIR),
+                                 int(memory_limit_mb * 1024 * 1024) if memory_limit_mb else None)
+    category_planner = CategoryPlanner(category_plan_path, full_sweep_every) if category_plan_path else None
+    if memory_limit_mb:
+        bot.logger.log_info(f"Memory budget {memory_limit_mb} MB: spilling category results to {memory_budget.spill_root}")
+    last_body = b''
+
+    def fetch_json(url: str, params: Optional[Dict[str, str]] = None, endpoint: str = 'other',
+                   decode: bool = True) -> Optional[Dict[str, Any]]:
+        nonlocal last_body
+        pacer.wait()
+        with profiler.stage('fetch'), metrics.timer('http_request_seconds', endpoint=endpoint):
+            response = http_client.get(url, params=params, headers=headers, timeout=120)
+        metrics.inc('http_responses_total', endpoint=endpoint, status=response.status_code)
+        metrics.inc('http_response_bytes_total', len(response.content), endpoint=endpoint)
+        response.raise_for_status()
+        last_body = response.content
+        if not decode:
+            return None
+        with profiler.stage('parse'), metrics.timer('stage_seconds', stage='decode'):
+            return response.json()
+
+    def collect_category(sub_cat: str, subcategory_products, product_size: Optional[int] = None) -> None:
+        nonlocal total_products_processed, total_data_size
+        products_processed_in_category = len(subcategory_products)
+        total_products_processed += products_processed_in_category
+        metrics.inc('products_total', products_processed_in_category)
+        metrics.inc('categories_total', status='ok')
+
+        if not subcategory_products.empty:
+            spill_path = memory_budget.add(subcategory_products)
+            if spill_path:
+                metrics.inc('spills_total')
+                bot.logger.log_info(f"Spilled category results to {spill_path} "
+                                    f"(RSS {memory_budget.sampled_peak / 1024 ** 2:.0f} MB peak)")
+            if product_size is None:
+                product_size = len(subcategory_products.to_csv(index=False).encode('utf-8'))
+            total_data_size += product_size
+            bot.logger.log_success(f"Processed {products_processed_in_category} products from category {sub_cat}", 
+                                 data_size=product_size)
+        else:
+            bot.logger.log_info(f"No products processed from category {sub_cat} (likely checkpoint resumption)")
 
     while start_index < len(stores):
         i = start_index
         start_time = datetime.now()
         
-        current_store_name = stores['name'].iloc[i]
-        current_store_id = stores['id'].iloc[i]
+        store = stores[i]
+        current_store_name = store['name']
+        current_store_id = store['id']
+        if run_registry.store_written(i, current_store_id):
+            bot.logger.log_info(f"Store {i} ({current_store_name}) already written under source file "
+                                f"{source_file_ID}, skipping")
+            start_index += 1
+            checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
+            save_checkpoint(checkpoint_file, checkpoint)
+            continue
+        partial = run_registry.partial_store(i, current_store_id)
+        if partial and (checkpoint.get('store_index') != i
+                        or checkpoint.get('category_index', 0) < partial['next_category']):
+            checkpoint = {'store_index': i, 'category_index': partial['next_category'],
+                          'last_processed_product_id': None, 'spill_parts': partial['spill_parts']}
+            bot.logger.log_info(f"Store {i} was cut short; continuing from category {partial['next_category']}")
         bot.logger.log_info(f"Processing Store {i} - {current_store_name} (ID:{current_store_id})")
+        profiler.begin_store(i, current_store_id)
+        memory_budget.begin_store(i, checkpoint.get('spill_parts', []) if checkpoint.get('store_index') == i else [])
+        raw_writer = None
+        if raw_run_dir:
+            raw_writer = RawArchiveWriter(store_archive_path(raw_run_dir, i, current_store_id), store, source_file_ID)
+        cut_short = False
 
         try:
             product_full_batch = pd.DataFrame()
-            area_id = stores['area_id'].iloc[i]
-            url_id = stores['Url_id'].iloc[i]
-            currency_id = stores['currency_id'].iloc[i]
-            country_id = stores['country_id'].iloc[i]
-            src_id = stores['src_id'].iloc[i]
-            store_link = stores['link'].iloc[i].replace('everli://app', '')
-            store_name = stores['name'].iloc[i]
-            store_id = stores['id'].iloc[i]
-            
-            page = f"https://api.everli.com/sm/api/v3/{store_link}/categories/tree"
-            
-            resp = requests.get(page, headers=headers)
-            if resp.status_code == 429:
-                bot.logger.log_error("Got 429 error at store level. Refreshing token and retrying.")
-                if bot.refresh_authentication():
-                    authentication_token = bot.authentication_token
-                    headers = bot.get_headers_for_request(authentication_token)
-                    continue
-                else:
-                    raise Exception("Failed to refresh authentication token")
-            
-            if resp.status_code != 200:
-                raise Exception(f"Blocked or invalid token (status {resp.status_code})")
+            store_link = store['link'].replace('everli://app', '')
+            store_id = store['id']
             
-            categories_json = resp.json()
-            categories_list = []
-            
-            for h in range(len(categories_json['data']['menu'])):
-                if 'items' in categories_json['data']['menu'][h]:
-                    ind = h
-                    cat_list = categories_json['data']['menu'][ind]['items']
-                    for cat in cat_list:
-                        parent_name = cat['name']
-                        categories_list.append({'name': parent_name, 'link': cat['link'], 'parent_name': ''})
-                        for sub_cat in cat.get('branch', []):
-                            categories_list.append({'name': sub_cat['name'], 'link': sub_cat['link'], 'parent_name': parent_name})
-            
-            categories_df = pd.DataFrame(categories_list)
-            categories_df = categories_df[categories_df['parent_name'] != ''].reset_index(drop=True)
+            page = f"{api_base}/{store_link}/categories/tree"
+            categories_json = retry_policy.execute(
+                lambda: fetch_json(page, endpoint='categories_tree'), page, on_auth=reauthenticate,
+                description=f"categories tree of store {i}")
+            if raw_writer:
+                raw_writer.add('tree', last_body, url=page)
+            categories_df = pd.DataFrame(leaf_categories(flatten_category_tree(categories_json)))
             bot.logger.log_success(f"Categories found: {len(categories_df)}")
+            if category_planner:
+                categories_df, plan_info = category_planner.plan(store['link'], categories_df)
+                bot.logger.log_info(f"Category plan for store {i} (run {plan_info['run']}"
+                                    f"{', full sweep' if plan_info['full_sweep'] else ''}): "
+                                    f"requesting {plan_info['planned']} of {plan_info['categories']}, "
+                                    f"{plan_info['deferred']} deferred, {plan_info['sampled']} empty ones sampled, "
+                                    f"{plan_info['new']} new")
             
-            products_from_all_categories = pd.DataFrame()
+            pending_categories = []
             
             j = checkpoint.get('category_index', 0)
             total_products_found = 0
             total_products_processed = 0
             
             while j < len(categories_df):
+                subcategory_products = pd.DataFrame()
                 try:
-                    bot.logger.log_info(f"Scraping category {j+1}/{len(categories_df)} - {categories_df.loc[j, 'name']}")
                     cat = categories_df.loc[j, 'parent_name']
                     sub_cat = categories_df.loc[j, 'name']
                     bot.logger.set_context(category=cat, subcategory=sub_cat)
+                    bot.logger.log_info(f"Scraping category {j+1}/{len(categories_df)} - {sub_cat}")
                     
                     cat_link = categories_df.loc[j, 'link'].replace('#/', '')
+                    cat_url = f"{api_base}/{cat_link}"
                     params = {'take': '100000000', 'skip': '0'}
-                    time.sleep(1.5)
-                    
-                    prod_resp = requests.get(f"https://api.everli.com/sm/api/v3/{cat_link}", params=params, headers=headers)
-                    
-                    if prod_resp.status_code == 429:
-                        bot.logger.log_debug(f"429 error at category {j} — refreshing token and retrying")
-                        if bot.refresh_authentication():
-                            authentication_token = bot.authentication_token
-                            headers = bot.get_headers_for_request(authentication_token)
-                            continue
-                        else:
-                            raise Exception("Failed to refresh authentication token")
-                    
-                    prod_resp.raise_for_status()
-                    prod_data = prod_resp.json()
-                    subcategory_products = pd.DataFrame()
                     
-                    product_list = []
-                    for block in prod_data['data']['body']:
-                        if block.get('widget_type') == 'vertical-list':
-                            product_list.extend(block.get('list', []))
-                    
-                    total_products_found += len(product_list)
-                    
-                    start_processing = True if not checkpoint.get('last_processed_product_id') else False
-                    products_processed_in_category = 0
-                    
-                    for product in product_list:
-                        product_id = str(product.get('id'))
-                        
-                        if not start_processing:
-                            if product_id == checkpoint.get('last_processed_product_id'):
-                                start_processing = True
-                                continue  
-                            else:
-                                continue  
-                        
-                        product_df = pd.json_normalize([product])
-                        product_df['cat_name_org'] = cat
-                        product_df['sub_cat_name_org'] = sub_cat
-                        product_df['nw'] = datetime.now(zone_dubai).strftime("%Y-%m-%d %H:%M:%S")
-                        subcategory_products = pd.concat([subcategory_products, product_df])
-                        products_processed_in_category += 1
-                        total_products_processed += 1
+                    prod_data = retry_policy.execute(
+                        lambda: fetch_json(cat_url, params, endpoint='category_listing', decode=not normalize_pool),
+                        cat_url, on_auth=reauthenticate, description=f"category {j} of store {i}")
+                    nw = run_clock()
+                    if raw_writer:
+                        raw_writer.add('category', last_body, url=cat_url, cat=cat, sub_cat=sub_cat, nw=nw)
 
-                    if not subcategory_products.empty:
-                        products_from_all_categories = pd.concat([products_from_all_categories, subcategory_products])
-                        product_size = len(subcategory_products.to_csv(index=False).encode('utf-8'))
-                        total_data_size += product_size
-                        bot.logger.log_success(f"Processed {products_processed_in_category} products from category {sub_cat}", 
-                                             data_size=product_size)
+                    if normalize_pool:
+                        future = normalize_pool.submit(last_body, cat, sub_cat, nw,
+                                                       checkpoint.get('last_processed_product_id'))
+                        pending_categories.append((j, sub_cat, future))
                     else:
-                        bot.logger.log_info(f"No products processed from category {sub_cat} (likely checkpoint resumption)")
+                        with profiler.stage('parse'), metrics.timer('stage_seconds', stage='parse'):
+                            product_list = extract_vertical_list(prod_data)
+
+                        total_products_found += len(product_list)
+                        if category_planner:
+                            category_planner.record(store['link'], categories_df.loc[j, 'link'], len(product_list))
+
+                        with profiler.stage('normalize'), metrics.timer('stage_seconds', stage='normalize'):
+                            pending_products = products_after_checkpoint(product_list, checkpoint.get('last_processed_product_id'))
+                            subcategory_products = normalize_products(pending_products, cat, sub_cat, nw)
+                        collect_category(sub_cat, subcategory_products)
                     
                     checkpoint = {
                         'store_index': i,
                         'category_index': j + 1,
-                        'last_processed_product_id': None
+                        'last_processed_product_id': None,
+                        'spill_parts': list(memory_budget.parts)
                     }
-                    with open(checkpoint_file, 'w') as f:
-                        json.dump(checkpoint, f)
+                    save_checkpoint(checkpoint_file, checkpoint)
                     bot.logger.log_debug(f"Updated checkpoint: store {i}, category {j+1}")
+                    metrics.maybe_export()
                     j += 1
                     
                 except Exception as e:
@@ -1061,112 +1354,176 @@ def main_execution():
                         checkpoint['last_processed_product_id'] = last_product_id
                         bot.logger.log_info(f"Saved checkpoint at product {last_product_id}")
                     
-                    with open(checkpoint_file, 'w') as f:
-                        json.dump(checkpoint, f)
+                    save_checkpoint(checkpoint_file, checkpoint)
                     bot.logger.log_debug(f"Checkpoint saved due to error: {checkpoint}")
                     
-                    if "429" in str(e):
-                        bot.logger.log_error("Got 429 error at category level. Refreshing token.")
-                        if bot.refresh_authentication():
-                            authentication_token = bot.authentication_token
-                            headers = bot.get_headers_for_request(authentication_token)
-                            time.sleep(5)
-                            continue
-                        else:
-                            bot.logger.log_error("Failed to refresh authentication token. Moving to next store.")
-                            start_index += 1
-                            checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
-                            with open(checkpoint_file, 'w') as f:
-                                json.dump(checkpoint, f)
-                            break
-                    else:
-                        bot.logger.log_info("Retrying category after error...")
-                        if bot.refresh_authentication():
-                            authentication_token = bot.authentication_token
-                            headers = bot.get_headers_for_request(authentication_token)
-                            time.sleep(5)
-                            continue
-                        else:
-                            bot.logger.log_error("Failed to refresh authentication token. Moving to next store.")
-                            start_index += 1
-                            checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
-                            with open(checkpoint_file, 'w') as f:
-                                json.dump(checkpoint, f)
-                            break
+                    if isinstance(e, CircuitOpenError) or retry_policy.budget.exhausted():
+                        bot.logger.log_error(f"Stopping store {i} early: {retry_policy.summary()}")
+                        cut_short = True
+                        break
+                    bot.logger.log_warning(f"Skipping category {j} of store {i}")
+                    metrics.inc('categories_total', status='skipped')
+                    checkpoint = {'store_index': i, 'category_index': j + 1, 'last_processed_product_id': None,
+                                  'spill_parts': list(memory_budget.parts)}
+                    j += 1
+
+            for pending_j, pending_sub_cat, future in pending_categories:
+                try:
+                    with profiler.stage('normalize'), metrics.timer('stage_seconds', stage='normalize'):
+                        products_found, subcategory_products, product_size = normalize_pool.result(future)
+                except Exception as e:
+                    bot.logger.log_error(f"Error normalizing category {pending_j} of store {i}: {str(e)}")
+                    metrics.inc('categories_total', status='skipped')
+                    continue
+                total_products_found += products_found
+                if category_planner:
+                    category_planner.record(store['link'], categories_df.loc[pending_j, 'link'], products_found)
+                collect_category(pending_sub_cat, subcategory_products, product_size)
+
+            if cut_short:
+                raise StoreCutShort(checkpoint['category_index'])
 
             bot.logger.log_info(f"STORE {i} ({current_store_name}) COMPLETED:")
             bot.logger.log_info(f"  - Total products found: {total_products_found}")
             bot.logger.log_info(f"  - Total products processed: {total_products_processed}")
+            if category_planner:
+                category_planner.finish_store(store['link'], categories_df, plan_info)
+                requested = max(len(categories_df), 1)
+                seconds_saved = plan_info['deferred'] * (datetime.now() - start_time).total_seconds() / requested
+                metrics.inc('category_requests_saved_total', plan_info['deferred'])
+                metrics.inc('category_seconds_saved_total', seconds_saved)
+                bot.logger.log_info(f"  - Category requests saved by plan: {plan_info['deferred']} "
+                                    f"(~{seconds_saved:.0f}s)")
 
-            if not products_from_all_categories.empty:
-                product_full_batch = products_from_all_categories.copy()
-                product_full_batch['store_name'] = store_name
-                product_full_batch['store_id'] = store_id
-                product_full_batch['source_file_id'] = source_file_ID 
-                product_full_batch['url_id'] = url_id
-                product_full_batch['currency_id'] = currency_id
-                product_full_batch['area_id'] = area_id
-                product_full_batch['country_id'] = country_id
-                product_full_batch['src_id'] = src_id
-                
-                product_full_batch.to_csv(
-                    master_csv_path,
-                    mode='a',
-                    index=False,
-                    header=not os.path.exists(master_csv_path)
-                )
-                data_products = pd.concat([data_products, product_full_batch], ignore_index=True)
-                batch_size = len(product_full_batch.to_csv(index=False).encode('utf-8'))
-                bot.logger.log_success(f"Appended {len(product_full_batch)} products to {master_csv_path}", 
-                                     data_size=batch_size)
+            if memory_budget.parts or memory_budget.frames:
+                # Spilled parts go through validation and the writers one at a time, so the store is
+                # never held whole; duplicate_id is checked per subcategory, which a part never splits
+                written_count, inconsistent_count, check_counts, history_counts = 0, 0, {}, {}
+                csv_size_before = os.path.getsize(master_csv_path) if os.path.exists(master_csv_path) else 0
+                arrow_writer = StoreArrowWriter(arrow_dir, i, current_store_id) if arrow_dir else None
+                store_history = price_history
+                for product_batch in memory_budget.batches():
+                    add_store_columns(product_batch, store, source_file_ID)
+
+                    with profiler.stage('validate'), metrics.timer('stage_seconds', stage='validate'):
+                        product_batch, quarantined, batch_counts = validator.validate(product_batch)
+                    for check_name, count in batch_counts.items():
+                        check_counts[check_name] = check_counts.get(check_name, 0) + count
+                    if len(quarantined):
+                        inconsistent_count += len(quarantined)
+                        with profiler.stage('write'):
+                            write_quarantine(quarantined, quarantine_csv_path)
+                    del quarantined
+
+                    with profiler.stage('write'), metrics.timer('stage_seconds', stage='write'):
+                        append_products_csv(product_batch, master_csv_path)
+                    written_count += len(product_batch)
+                    if arrow_writer:
+                        try:
+                            with profiler.stage('write'), metrics.timer('stage_seconds', stage='arrow'):
+                                arrow_writer.write(product_batch)
+                        except Exception as e:
+                            arrow_writer.abort()
+                            arrow_writer = None
+                            bot.logger.log_warning(f"Could not write Arrow output for store {i}: {e}")
+                    if store_history:
+                        try:
+                            with profiler.stage('write'), metrics.timer('stage_seconds', stage='price_history'):
+                                batch_history = store_history.ingest(product_batch)
+                            for key, count in batch_history.items():
+                                history_counts[key] = history_counts.get(key, 0) + count
+                        except Exception as e:
+                            store_history = None
+                            bot.logger.log_warning(f"Could not update price history for store {i}: {e}")
+                    del product_batch
+
+                metrics.inc('products_quarantined_total', inconsistent_count)
+                if inconsistent_count:
+                    bot.logger.log_warning(f"Quarantined {inconsistent_count} inconsistent products for store {i} to {quarantine_csv_path}: {check_counts}",
+                                         inconsistent_data_count=inconsistent_count)
+                run_registry.mark_store_written(i, current_store_id, written_count)
+                if arrow_writer:
+                    try:
+                        arrow_path = arrow_writer.close()
+                        bot.logger.log_debug(f"Wrote store {i} products to {arrow_path}")
+                    except Exception as e:
+                        arrow_writer.abort()
+                        bot.logger.log_warning(f"Could not write Arrow output for store {i}: {e}")
+                batch_size = os.path.getsize(master_csv_path) - csv_size_before
+                metrics.inc('output_bytes_total', batch_size)
+                bot.logger.log_success(f"Appended {written_count} products to {master_csv_path}", 
+                                     data_size=batch_size, inconsistent_data_count=inconsistent_count)
+                if history_counts:
+                    bot.logger.log_info(f"Price history for store {i}: {history_counts}")
                 stores_done.append(i)
             else:
+                run_registry.mark_store_written(i, current_store_id, 0)
                 bot.logger.log_warning(f"No new data saved for store {i}: no products found")
 
             duration = round((datetime.now() - start_time).total_seconds() / 60, 2)
             bot.logger.log_info(f"Duration for store {i}: {duration} min")
-            
-            start_index += 1
-            checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
-            with open(checkpoint_file, 'w') as f:
-                json.dump(checkpoint, f)
+            metrics.observe('store_seconds', (datetime.now() - start_time).total_seconds())
+            metrics.inc('stores_total', status='ok')
                 
         except Exception as e:
-            bot.logger.log_error(f"Critical error at store {i}: {str(e)}")
-            checkpoint['store_index'] = i
-            with open(checkpoint_file, 'w') as f:
-                json.dump(checkpoint, f)
-            
-            if "429" in str(e):
-                bot.logger.log_error("Got 429 error at store level. Refreshing token and retrying.")
-                if bot.refresh_authentication():
-                    authentication_token = bot.authentication_token
-                    headers = bot.get_headers_for_request(authentication_token)
-                    time.sleep(5)
-                    continue
-                else:
-                    bot.logger.log_error("Failed to refresh authentication token. Moving to next store.")
-                    start_index += 1
-                    checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
-                    with open(checkpoint_file, 'w') as f:
-                        json.dump(checkpoint, f)
+            out_of_retries = (isinstance(e, RetryExhausted) and e.error_class != PERMANENT
+                              and retry_policy.budget.exhausted())
+            if isinstance(e, (StoreCutShort, CircuitOpenError)) or out_of_retries:
+                # Keep what was fetched and finish the store when the run is resumed
+                next_category = e.next_category if isinstance(e, StoreCutShort) else checkpoint.get('category_index', 0)
+                if memory_budget.frames:
+                    memory_budget.spill()
+                run_registry.mark_store_partial(i, current_store_id, next_category, memory_budget.parts)
+                cut_short = True
+                bot.logger.log_warning(f"Store {i} cut short at category {next_category}; resuming this run "
+                                       f"continues it from there")
+                metrics.inc('stores_total', status='partial')
             else:
-                bot.logger.log_info("Retrying store after error...")
-                if bot.refresh_authentication():
-                    authentication_token = bot.authentication_token
-                    headers = bot.get_headers_for_request(authentication_token)
-                    time.sleep(5)
-                    continue
-                else:
-                    bot.logger.log_error("Failed to refresh authentication token. Moving to next store.")
-                    start_index += 1
-                    checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
-                    with open(checkpoint_file, 'w') as f:
-                        json.dump(checkpoint, f)
+                if partial:
+                    run_registry.drop_store(i)
+                bot.logger.log_error(f"Critical error at store {i}: {str(e)}")
+                bot.logger.log_error(f"Moving to next store. {retry_policy.summary()}")
+                metrics.inc('stores_total', status='failed')
+
+        if raw_writer:
+            raw_writer.close()
+        memory_stats = memory_budget.end_store(keep_parts=cut_short)
+        metrics.set_gauge('peak_rss_bytes', memory_budget.run_peak)
+        bot.logger.log_info(f"Peak memory for store {i}: {memory_stats['peak_rss_mb']} MB "
+                            f"({memory_stats['spilled_parts']} spilled parts, {memory_stats['spilled_rows']} rows)")
+        hotspots_path = profiler.end_store()
+        if hotspots_path:
+            bot.logger.log_info(f"Profile for store {i} written to {hotspots_path}")
+        start_index += 1
+        checkpoint = {'store_index': start_index, 'category_index': 0, 'last_processed_product_id': None}
+        save_checkpoint(checkpoint_file, checkpoint)
 
-    bot.logger.log_job_end(total_data_size)
+    bot.logger.log_info(retry_policy.summary())
+    if category_planner:
+        bot.logger.log_info(f"Category plan saved {metrics.counter_total('category_requests_saved_total'):.0f} requests "
+                            f"(~{metrics.counter_total('category_seconds_saved_total'):.0f}s); "
+                            f"history in {category_planner.path}")
+    if not run_registry.finish():
+        bot.logger.log_warning(f"Stores {run_registry.partial_indexes()} were cut short; run {run_registry.run['run_id']} "
+                               f"stays resumable from {output_dir}")
+    sync_run_registry()
+    if price_history:
+        price_history.close()
+    if normalize_pool:
+        normalize_pool.shutdown()
+    hotspots_path = profiler.finish()
+    if hotspots_path:
+        bot.logger.profiler = None
+        bot.logger.log_info(f"Run hotspot summary written to {hotspots_path}")
+    if shared:
+        shared.total_data_size += total_data_size
+    else:
+        metrics.export()
+        bot.logger.log_info(f"Run metrics exported to {metrics.json_path} and {metrics.prometheus_path}")
+        bot.logger.log_job_end(total_data_size)
     print(f"Scraping completed. Total stores processed: {len(stores_done)}")
     print(f"Total data size: {total_data_size} bytes")
+    return metrics
 
 
 if __name__ == "__main__":
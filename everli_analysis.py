@@ -0,0 +1,206 @@
+"""Store, category and machine summaries built from StructuredLogger CSV logs.
+
+load_logs parses any number of scraper_logs_<date>.csv files, rotated
+segments and their .csv.gz archives into one typed frame; pass the log
+directory to get every file in order. annotate_logs then tags every row
+with the store and category it was logged under, and pulls the numbers
+out of the scraper's messages with vectorized string operations. Each
+regex runs only on rows whose message has the matching prefix, so a month
+of logs takes seconds.
+"""
+import csv
+import glob
+import gzip
+import os
+from typing import Iterable, List
+
+import pandas as pd
+
+from everli_log_rotation import log_paths
+
+SUMMARY_FIELDS = ["store_name", "store_id", "num_categories", "num_products", "duration_in_minutes"]
+
+LOG_DTYPES = {
+    'levelname': 'category', 'machine_id': 'category', 'machine_ip': 'category', 'job_id': 'category',
+    'category': 'string', 'subcategory': 'string', 'data_size': 'Int64', 'inconsistent_data_count': 'Int64',
+    'message': 'string',
+}
+
+# (column, message prefix, regex, dtype) extracted by annotate_logs
+MESSAGE_FIELDS = [
+    ('store_index', 'Processing Store ', r'^Processing Store (\d+) - ', 'Int64'),
+    ('store_name', 'Processing Store ', r'^Processing Store \d+ - (.+) \(ID:\d+\)$', 'string'),
+    ('store_id', 'Processing Store ', r'\(ID:(\d+)\)$', 'Int64'),
+    ('categories_found', 'Categories found: ', r'^Categories found: (\d+)', 'Int64'),
+    ('scraped_category', 'Scraping category ', r'^Scraping category \d+/\d+ - (.*)$', 'string'),
+    ('category_products', 'Processed ', r'^Processed (\d+) products from category', 'Int64'),
+    ('store_products', 'Appended ', r'^Appended (\d+) products', 'Int64'),
+    ('store_minutes', 'Duration for store ', r'^Duration for store \d+: ([\d.]+) min', 'Float64'),
+]
+
+
+def _csv_engine() -> str:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'c'
+    return 'pyarrow'
+
+
+def _expand(pattern: str) -> List[str]:
+    if os.path.isdir(pattern):
+        return log_paths(pattern)
+    return sorted(glob.glob(pattern)) or [pattern]
+
+
+def load_logs(paths: Iterable[str]) -> pd.DataFrame:
+    """Read the analysed columns of StructuredLogger CSVs (paths, glob patterns or log directories) into one typed frame"""
+    engine = _csv_engine()
+    frames = []
+    for pattern in paths:
+        for path in _expand(pattern):
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), [])
+            columns = [column for column in ['asctime', *LOG_DTYPES] if column in header]
+            frame = pd.read_csv(path, usecols=columns, dtype={c: LOG_DTYPES[c] for c in columns if c != 'asctime'},
+                                keep_default_na=False, na_values=[''], engine=engine, encoding='utf-8')
+            frame['log_file'] = path
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=['asctime', *LOG_DTYPES, 'log_file'])
+    logs = pd.concat(frames, ignore_index=True)
+    for column, dtype in LOG_DTYPES.items():
+        if column not in logs.columns:
+            logs[column] = pd.NA
+        logs[column] = logs[column].astype(dtype)
+    logs['asctime'] = pd.to_datetime(logs['asctime'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    return logs
+
+
+def _extract(message: pd.Series, prefix: str, pattern: str, dtype: str) -> pd.Series:
+    result = pd.Series(pd.NA, index=message.index, dtype=dtype)
+    candidates = message.str.startswith(prefix, na=False)
+    if candidates.any():
+        values = message[candidates].str.extract(pattern, expand=False)
+        result[candidates] = values if dtype == 'string' else pd.to_numeric(values).astype(dtype)
+    return result
+
+
+def annotate_logs(logs: pd.DataFrame) -> pd.DataFrame:
+    """Tag rows with their store and category and extract per-message numbers"""
+    logs = logs.copy()
+    message = logs['message'].astype('string')
+    for column, prefix, pattern, dtype in MESSAGE_FIELDS:
+        logs[column] = _extract(message, prefix, pattern, dtype)
+
+    by_job = logs.groupby('job_id', observed=True, sort=False)
+    for column in ('store_index', 'store_name', 'store_id'):
+        logs[column] = by_job[column].ffill()
+
+    # A category runs from its "Scraping category" line to the next one, or to the store summary lines
+    store_start = logs['store_index'].notna() & message.str.startswith('Processing Store ', na=False)
+    store_end = message.str.startswith('STORE ', na=False)
+    logs['parent_category'] = logs['category'].where(logs['scraped_category'].notna())
+    for column in ('scraped_category', 'parent_category'):
+        marker = logs[column].mask(store_start | store_end, '')
+        logs[column] = marker.groupby(logs['job_id'], observed=True, sort=False).ffill().replace('', pd.NA)
+
+    logs['is_error'] = logs['levelname'] == 'ERROR'
+    logs['is_warning'] = logs['levelname'] == 'WARNING'
+    logs['is_retry'] = message.str.contains('. Retrying in ', regex=False, na=False)
+    logs['is_reauth'] = message.str.endswith('refreshing authentication', na=False)
+    logs['is_skip'] = message.str.startswith('Skipping category ', na=False)
+    logs['is_category_start'] = message.str.startswith('Scraping category ', na=False)
+    return logs
+
+
+def _counts(grouped):
+    return grouped.agg(
+        errors=('is_error', 'sum'),
+        warnings=('is_warning', 'sum'),
+        retries=('is_retry', 'sum'),
+        reauthentications=('is_reauth', 'sum'),
+    )
+
+
+def store_summary(logs: pd.DataFrame) -> pd.DataFrame:
+    """One row per (job, store): categories, products, duration, errors and retries"""
+    logs = logs[logs['store_index'].notna()]
+    appended = logs['store_products'].notna()
+    logs = logs.assign(quarantined=logs['inconsistent_data_count'].where(appended, 0),
+                       output_bytes=logs['data_size'].where(appended, 0))
+    keys = ['job_id', 'store_index', 'store_id', 'store_name']
+    grouped = logs.groupby(keys, observed=True, sort=False, dropna=False)
+    summary = grouped.agg(
+        date=('asctime', 'min'),
+        machine_id=('machine_id', 'first'),
+        num_categories=('categories_found', 'max'),
+        categories_scraped=('is_category_start', 'sum'),
+        categories_skipped=('is_skip', 'sum'),
+        num_products=('store_products', 'sum'),
+        quarantined=('quarantined', 'sum'),
+        output_bytes=('output_bytes', 'sum'),
+        duration_in_minutes=('store_minutes', 'max'),
+    ).join(_counts(grouped))
+    summary['date'] = summary['date'].dt.date
+    return summary.reset_index().sort_values(['date', 'job_id', 'store_index'], kind='stable', ignore_index=True)
+
+
+def category_summary(logs: pd.DataFrame) -> pd.DataFrame:
+    """One row per (job, store, category): products, time spent, errors and retries"""
+    logs = logs[logs['store_index'].notna() & logs['scraped_category'].notna()]
+    keys = ['job_id', 'store_id', 'store_name', 'parent_category', 'scraped_category']
+    grouped = logs.groupby(keys, observed=True, sort=False, dropna=False)
+    summary = grouped.agg(
+        started=('asctime', 'min'),
+        finished=('asctime', 'max'),
+        num_products=('category_products', 'sum'),
+        skipped=('is_skip', 'any'),
+    ).join(_counts(grouped))
+    summary['seconds'] = (summary.pop('finished') - summary['started']).dt.total_seconds()
+    summary = summary.reset_index().rename(columns={'parent_category': 'category', 'scraped_category': 'subcategory'})
+    return summary.sort_values(['started', 'job_id'], kind='stable', ignore_index=True)
+
+
+def machine_summary(logs: pd.DataFrame) -> pd.DataFrame:
+    """One row per machine: jobs, stores, products, store minutes, errors and retries"""
+    stores = store_summary(logs)
+    per_store = stores.groupby('machine_id', observed=True).agg(
+        stores=('store_id', 'size'),
+        num_products=('num_products', 'sum'),
+        store_minutes=('duration_in_minutes', 'sum'),
+        mean_store_minutes=('duration_in_minutes', 'mean'),
+    )
+    grouped = logs.groupby('machine_id', observed=True)
+    summary = grouped.agg(
+        machine_ip=('machine_ip', 'last'),
+        jobs=('job_id', 'nunique'),
+        first_seen=('asctime', 'min'),
+        last_seen=('asctime', 'max'),
+    ).join(_counts(grouped)).join(per_store)
+    return summary.reset_index()
+
+
+SUMMARIES = {'store': store_summary, 'category': category_summary, 'machine': machine_summary}
+
+
+def summarize_logs(paths: Iterable[str], by: str = 'store') -> pd.DataFrame:
+    """Load, annotate and summarize logs at the store, category or machine level"""
+    return SUMMARIES[by](annotate_logs(load_logs(paths)))
+
+
+def summarize_log(log_path: str) -> List[list]:
+    """Per-store [store_name, store_id, num_categories, num_products, duration_in_minutes] rows for one log"""
+    summary = summarize_logs([log_path])
+    summary = summary.astype(object).where(summary.notna(), None)
+    return summary[SUMMARY_FIELDS].values.tolist()
+
+
+def write_summary(rows: List[list], output_csv_path: str = "everli_store_summary.csv") -> str:
+    """Write summary rows with a header and return the output path"""
+    with open(output_csv_path, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(SUMMARY_FIELDS)
+        writer.writerows(rows)
+    return output_csv_path
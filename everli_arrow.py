@@ -0,0 +1,154 @@
+"""Arrow IPC (Feather v2) copy of a run's products, opened memory-mapped.
+
+With arrow_output set, main_execution streams every store's validated
+batches into <output_dir>/Data_Products_Eveli_arrow/store_<i>_<store_id>.arrow
+next to the CSV append. One file per store keeps each store's own columns (the
+CSV forces every store under the first store's header) and makes a resumed
+store overwrite its file instead of appending twice. Files are written
+uncompressed by default so open_run can memory-map them: the returned
+pyarrow Table points into the page cache, columns are read only when
+touched and opening a multi-GB run takes milliseconds. Stores whose
+column types differ (an all-null column, ints in one store and floats in
+another) are unified with Arrow's permissive type promotion.
+"""
+import glob
+import os
+import re
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+ARROW_DIR = 'Data_Products_Eveli_arrow'
+STORE_FILE = re.compile(r'^store_(\d+)_(.+)\.arrow$')
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.feather  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Arrow output requires pyarrow (pip install pyarrow)") from e
+    return pa
+
+
+def store_arrow_path(arrow_dir: str, store_index: int, store_id) -> str:
+    return os.path.join(arrow_dir, f"store_{store_index}_{store_id}.arrow")
+
+
+def to_arrow_table(frame: pd.DataFrame):
+    """Convert a products frame, storing columns Arrow cannot type (mixed objects, nested cells) as text"""
+    pa = _require_pyarrow()
+    from everli_parallel import flatten_nested
+    frame = flatten_nested(frame.copy())
+    arrays = []
+    for column in frame.columns:
+        values = frame[column]
+        try:
+            arrays.append(pa.array(values, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            arrays.append(pa.array(values.map(str, na_action='ignore'), type=pa.string(), from_pandas=True))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in frame.columns])
+
+
+class StoreArrowWriter:
+    """Appends a store's batches to one Feather v2 file, replacing an earlier attempt's on close"""
+
+    def __init__(self, arrow_dir: str, store_index: int, store_id, compression: Optional[str] = None):
+        self.pa = _require_pyarrow()
+        os.makedirs(arrow_dir, exist_ok=True)
+        self.path = store_arrow_path(arrow_dir, store_index, store_id)
+        self.compression = None if compression in (None, 'uncompressed') else compression
+        self.writer = None
+        self.schema = None
+
+    def _open(self, schema) -> None:
+        options = self.pa.ipc.IpcWriteOptions(compression=self.compression)
+        self.writer = self.pa.ipc.new_file(self.path + '.tmp', schema, options=options)
+        self.schema = schema
+
+    def _promote(self, schema) -> None:
+        # A later batch typed a column differently (all-null so far, ints then floats): rewrite what
+        # was written under the widened schema, memory-mapped so it is not read into memory
+        pa = self.pa
+        unified = pa.unify_schemas([self.schema, schema], promote_options='permissive')
+        self.writer.close()
+        os.replace(self.path + '.tmp', self.path + '.old')
+        written = pa.ipc.open_file(pa.memory_map(self.path + '.old', 'r'))
+        self._open(unified)
+        for index in range(written.num_record_batches):
+            self.writer.write_table(pa.Table.from_batches([written.get_batch(index)]).cast(unified))
+        del written
+        os.remove(self.path + '.old')
+
+    def write(self, frame: pd.DataFrame) -> None:
+        table = to_arrow_table(frame)
+        if self.writer is None:
+            self._open(table.schema)
+        elif not table.schema.equals(self.schema):
+            if self.pa.unify_schemas([self.schema, table.schema], promote_options='permissive') != self.schema:
+                self._promote(table.schema)
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+
+    def close(self) -> Optional[str]:
+        """Finish the file and move it into place; None when no batch was written"""
+        if self.writer is None:
+            return None
+        self.writer.close()
+        self.writer = None
+        os.replace(self.path + '.tmp', self.path)
+        return self.path
+
+    def abort(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        for path in (self.path + '.tmp', self.path + '.old'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def write_store_arrow(frame: pd.DataFrame, arrow_dir: str, store_index: int, store_id,
+                      compression: Optional[str] = None) -> str:
+    """Write one store's products as a Feather v2 file, replacing an earlier attempt's"""
+    writer = StoreArrowWriter(arrow_dir, store_index, store_id, compression)
+    writer.write(frame)
+    return writer.close()
+
+
+def run_arrow_files(path: str) -> List[str]:
+    """Store files of a run (an output dir, its arrow dir or a single .arrow file), in store order"""
+    if os.path.isfile(path):
+        return [path]
+    arrow_dir = os.path.join(path, ARROW_DIR) if os.path.isdir(os.path.join(path, ARROW_DIR)) else path
+    files = [(STORE_FILE.match(os.path.basename(p)), p) for p in glob.glob(os.path.join(arrow_dir, 'store_*.arrow'))]
+    return [p for _, p in sorted((int(match.group(1)), p) for match, p in files if match)]
+
+
+def open_run(path: str, columns: Optional[Sequence[str]] = None, store_ids: Optional[Sequence] = None):
+    """Memory-map a run's Arrow files into one pyarrow Table without copying column data"""
+    pa = _require_pyarrow()
+    tables = []
+    wanted = {str(store_id) for store_id in store_ids} if store_ids is not None else None
+    for file_path in run_arrow_files(path):
+        match = STORE_FILE.match(os.path.basename(file_path))
+        if wanted is not None and (not match or match.group(2) not in wanted):
+            continue
+        table = pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+        if columns is not None:
+            table = table.select([column for column in columns if column in table.column_names])
+        tables.append(table)
+    if not tables:
+        return pa.table({column: pa.array([], type=pa.null()) for column in columns or []})
+    return pa.concat_tables(tables, promote_options='permissive')
+
+
+def read_run_frame(path: str, columns: Optional[Sequence[str]] = None,
+                   store_ids: Optional[Sequence] = None) -> pd.DataFrame:
+    """open_run converted to a pandas DataFrame (this step copies the columns it converts)"""
+    return open_run(path, columns, store_ids).to_pandas()
+
+
+def is_arrow_run(path: str) -> bool:
+    return path.endswith('.arrow') or os.path.isdir(os.path.join(path, ARROW_DIR)) or \
+        (os.path.isdir(path) and bool(glob.glob(os.path.join(path, 'store_*.arrow'))))
@@ -0,0 +1,182 @@
+"""Benchmarks for the CPU side of the Everli scraper.
+
+Synthetic categories/tree and category-listing payloads shaped like the
+live API are pushed through the same functions main_execution uses, one
+category at a time: tree flattening, vertical-list extraction,
+normalization, validation and the CSV append. Each stage is timed, then
+the path is re-run under tracemalloc for each stage's peak allocation. Results are saved as
+JSON per git version under bench_results/ so they can be compared
+between versions.
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from everli_fixtures import make_listing_payload, make_tree_payload
+from everli_parsing import flatten_category_tree, leaf_categories, extract_vertical_list
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+PRODUCTS_PER_CATEGORY = 2000
+RESULTS_DIR = 'bench_results'
+STAGES = ('flatten_tree', 'extract_products', 'normalize', 'validate', 'write_csv')
+
+
+def iter_listing_payloads(num_products: int,
+                          products_per_category: int = PRODUCTS_PER_CATEGORY) -> Iterator[Dict[str, Any]]:
+    """Yield category listings one at a time so large stores are never fully in memory as JSON"""
+    produced = 0
+    while produced < num_products:
+        size = min(products_per_category, num_products - produced)
+        yield make_listing_payload(size, first_id=100000 + produced)
+        produced += size
+
+
+@contextmanager
+def _measure(stage: str, stage_seconds: Dict[str, float], stage_peaks: Optional[Dict[str, int]]):
+    """Add the block's time to stage_seconds and, under tracemalloc, its peak allocation to stage_peaks"""
+    if stage_peaks is not None:
+        tracemalloc.reset_peak()
+        held, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds[stage] += time.perf_counter() - started
+        if stage_peaks is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            stage_peaks[stage] = max(stage_peaks.get(stage, 0), peak - held)
+
+
+def run_store_path(num_products: int, output_dir: str, stage_seconds: Optional[Dict[str, float]] = None,
+                   stage_peaks: Optional[Dict[str, int]] = None) -> int:
+    """Push one synthetic store through the store-processing path, adding per-stage time.
+
+    With stage_peaks (and tracemalloc tracing), each stage's peak allocation
+    above the memory held when it started is recorded too.
+    """
+    import pandas as pd
+    from everli_normalize import normalize_products, append_products_csv
+    from everli_validation import ProductValidator
+
+    stage_seconds = stage_seconds if stage_seconds is not None else {stage: 0.0 for stage in STAGES}
+    num_categories = max(1, -(-num_products // PRODUCTS_PER_CATEGORY))
+    tree = make_tree_payload(-(-num_categories // 5))
+
+    with _measure('flatten_tree', stage_seconds, stage_peaks):
+        categories = leaf_categories(flatten_category_tree(tree))
+
+    frames = []
+    for index, listing in enumerate(iter_listing_payloads(num_products)):
+        category = categories[index % len(categories)]
+        with _measure('extract_products', stage_seconds, stage_peaks):
+            product_list = extract_vertical_list(listing)
+
+        with _measure('normalize', stage_seconds, stage_peaks):
+            frames.append(normalize_products(product_list, category['parent_name'], category['name'],
+                                             '2025-01-01 00:00:00'))
+
+    batch = pd.concat(frames, ignore_index=True)
+    with _measure('validate', stage_seconds, stage_peaks):
+        batch, _, _ = ProductValidator().validate(batch)
+
+    csv_path = os.path.join(output_dir, 'Data_Products_Eveli.csv')
+    with _measure('write_csv', stage_seconds, stage_peaks):
+        append_products_csv(batch, csv_path)
+    os.remove(csv_path)
+    return len(batch)
+
+
+def bench_size(num_products: int, repeat: int = 3, profile_memory: bool = True) -> Dict[str, Any]:
+    """Best-of-repeat time per stage and, optionally, tracemalloc peaks per stage and for the whole path"""
+    best = {stage: float('inf') for stage in STAGES}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(repeat):
+            stage_seconds = {stage: 0.0 for stage in STAGES}
+            run_store_path(num_products, output_dir, stage_seconds)
+            best = {stage: min(best[stage], stage_seconds[stage]) for stage in STAGES}
+        result = {
+            'products': num_products,
+            'stage_ms': {stage: round(seconds * 1000, 3) for stage, seconds in best.items()},
+            'total_ms': round(sum(best.values()) * 1000, 3),
+        }
+        if profile_memory:
+            stage_peaks: Dict[str, int] = {}
+            tracemalloc.start()
+            run_store_path(num_products, output_dir, {stage: 0.0 for stage in STAGES}, stage_peaks)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result['peak_memory_mb'] = round(peak / 1024 / 1024, 2)
+            result['stage_peak_mb'] = {stage: round(stage_peaks.get(stage, 0) / 1024 / 1024, 2) for stage in STAGES}
+    result['products_per_second'] = round(num_products / max(sum(best.values()), 1e-9))
+    return result
+
+
+def current_version() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_suite(sizes=DEFAULT_SIZES, repeat: int = 3, profile_memory: bool = True) -> Dict[str, Any]:
+    return {
+        'version': current_version(),
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'results': [bench_size(size, repeat=repeat, profile_memory=profile_memory) for size in sizes],
+    }
+
+
+def save_results(suite: Dict[str, Any], results_dir: str = RESULTS_DIR) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = suite['timestamp'].replace(' ', '_').replace(':', '')
+    path = os.path.join(results_dir, f"bench_{stamp}_{suite['version']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(suite, f, indent=2)
+    return path
+
+
+def latest_results(results_dir: str = RESULTS_DIR, exclude: Optional[str] = None) -> Optional[str]:
+    if not os.path.isdir(results_dir):
+        return None
+    paths = sorted(os.path.join(results_dir, name) for name in os.listdir(results_dir) if name.endswith('.json'))
+    paths = [path for path in paths if path != exclude]
+    return paths[-1] if paths else None
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.2) -> List[str]:
+    """List stages that got slower than baseline by more than threshold (relative)"""
+    regressions = []
+    baseline_by_size = {result['products']: result for result in baseline['results']}
+    for result in current['results']:
+        previous = baseline_by_size.get(result['products'])
+        if not previous:
+            continue
+        for stage, elapsed_ms in result['stage_ms'].items():
+            before = previous['stage_ms'].get(stage)
+            if before and before >= 1 and elapsed_ms > before * (1 + threshold):
+                regressions.append(f"{stage} @ {result['products']} products: {before} ms -> {elapsed_ms} ms "
+                                   f"(+{round((elapsed_ms / before - 1) * 100)}%) vs {baseline['version']}")
+    return regressions
+
+
+def format_suite(suite: Dict[str, Any]) -> str:
+    lines = [f"Version {suite['version']} ({suite['timestamp']})"]
+    for result in suite['results']:
+        memory = f", peak {result['peak_memory_mb']} MB" if 'peak_memory_mb' in result else ''
+        lines.append(f"{result['products']} products: {result['total_ms']} ms total, "
+                     f"{result['products_per_second']} products/s{memory}")
+        stage_peaks = result.get('stage_peak_mb', {})
+        for stage, elapsed_ms in result['stage_ms'].items():
+            memory = f", peak {stage_peaks[stage]} MB" if stage in stage_peaks else ''
+            lines.append(f"  {stage}: {elapsed_ms} ms{memory}")
+    return '\n'.join(lines)
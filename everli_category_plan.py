@@ -0,0 +1,131 @@
+"""Per-store category plans learned from earlier runs.
+
+Many leaf categories of a store's categories/tree come back empty run
+after run, and each still costs a listing request plus the request pause.
+CategoryPlanner keeps, per store link and category link, how many
+products the listing returned (an exponential moving average), how many
+runs in a row it was empty and the run it was last requested in. plan() reorders a
+store's flattened categories_df by expected size, largest first, and
+defers categories empty for min_empty_runs runs in a row. A sample_fraction
+of the deferred ones is still requested each run, oldest checked first,
+and every full_sweep_every-th run of a store requests everything, so a
+category that starts listing products again is picked up. Observations
+are kept in memory until finish_store, so a store resumed from its
+checkpoint gets the same plan and category indexes. Savings (requests not
+made) are accumulated per store in the plan file and reported by
+summarize_plan. Stores are keyed by their link rather than their id,
+since one store id can be listed under several locations with different
+assortments.
+"""
+import json
+import math
+import os
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+import pandas as pd
+
+PLAN_FILE = 'Everli_category_plan.json'
+EXPECTED_ALPHA = 0.5
+
+
+class CategoryPlanner:
+    """Orders and prunes each store's categories from the history in a JSON plan file"""
+
+    def __init__(self, path: str = PLAN_FILE, full_sweep_every: int = 7, min_empty_runs: int = 3,
+                 sample_fraction: float = 0.2):
+        self.path = path
+        self.full_sweep_every = full_sweep_every
+        self.min_empty_runs = min_empty_runs
+        self.sample_fraction = sample_fraction
+        self.stores: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.stores = json.load(f).get('stores', {})
+        self.pending: Dict[str, Dict[str, int]] = {}
+
+    def _save(self) -> None:
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'stores': self.stores}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def _store(self, store_link: str) -> Dict[str, Any]:
+        return self.stores.setdefault(store_link, {'runs': 0, 'requests_saved': 0, 'last_full_sweep': None,
+                                                      'categories': {}})
+
+    def plan(self, store_link: str, categories_df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """categories_df reordered by expected size with deferred categories dropped, and what was decided"""
+        history = self._store(store_link)
+        self.pending[store_link] = {}
+        run = history['runs'] + 1
+        full_sweep = self.full_sweep_every <= 1 or history['runs'] % self.full_sweep_every == 0
+        if categories_df.empty or 'link' not in categories_df.columns:
+            # An empty tree leaves nothing to plan
+            return categories_df, {'run': run, 'full_sweep': full_sweep, 'categories': len(categories_df),
+                                   'planned': 0, 'deferred': 0, 'sampled': 0, 'new': 0}
+        known = categories_df['link'].map(history['categories'])
+        stats = pd.DataFrame({
+            'expected': known.map(lambda entry: entry['expected'] if isinstance(entry, dict) else math.inf),
+            'empty_runs': known.map(lambda entry: entry['empty_runs'] if isinstance(entry, dict) else 0),
+            'last_checked': known.map(lambda entry: entry['last_checked'] if isinstance(entry, dict) else 0),
+        }, index=categories_df.index)
+        empty = stats['empty_runs'] >= self.min_empty_runs
+        keep = pd.Series(True, index=categories_df.index)
+        sampled = 0
+        if not full_sweep and empty.any():
+            sampled = max(1, math.ceil(self.sample_fraction * empty.sum())) if self.sample_fraction > 0 else 0
+            probes = stats[empty].sort_values('last_checked', kind='stable').index[:sampled]
+            keep = ~empty | categories_df.index.isin(probes)
+        # Unseen categories first (expected = inf), then largest expected size; ties keep tree order
+        order = stats[keep].sort_values('expected', ascending=False, kind='stable').index
+        info = {
+            'run': run,
+            'full_sweep': full_sweep,
+            'categories': len(categories_df),
+            'planned': len(order),
+            'deferred': int((~keep).sum()),
+            'sampled': int(sampled),
+            'new': int(known.isna().sum()),
+        }
+        return categories_df.loc[order].reset_index(drop=True), info
+
+    def record(self, store_link: str, link: str, products_found: int) -> None:
+        self.pending.setdefault(store_link, {})[link] = int(products_found)
+
+    def finish_store(self, store_link: str, categories_df: pd.DataFrame, info: Dict[str, Any]) -> None:
+        """Fold the store's observations into its history and save the plan file"""
+        history = self._store(store_link)
+        run = info['run']
+        names = dict(zip(categories_df['link'], categories_df['name'])) if 'link' in categories_df.columns else {}
+        for link, found in self.pending.pop(store_link, {}).items():
+            entry = history['categories'].setdefault(link, {'name': names.get(link, ''), 'expected': found,
+                                                            'empty_runs': 0, 'last_checked': run})
+            entry['expected'] = round(EXPECTED_ALPHA * found + (1 - EXPECTED_ALPHA) * entry['expected'], 2)
+            entry['empty_runs'] = entry['empty_runs'] + 1 if found == 0 else 0
+            entry['last_checked'] = run
+        history['runs'] = run
+        history['requests_saved'] += info['deferred']
+        if info['full_sweep']:
+            history['last_full_sweep'] = run
+        history['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        self._save()
+
+
+def summarize_plan(path: str = PLAN_FILE, min_empty_runs: int = 3) -> pd.DataFrame:
+    """Per store: runs, categories known, categories currently deferred and requests saved so far"""
+    with open(path, 'r', encoding='utf-8') as f:
+        stores = json.load(f).get('stores', {})
+    rows = []
+    for store_link, history in stores.items():
+        categories = history['categories'].values()
+        rows.append({
+            'store_link': store_link,
+            'runs': history['runs'],
+            'last_full_sweep': history['last_full_sweep'],
+            'categories': len(categories),
+            'empty': sum(entry['empty_runs'] >= min_empty_runs for entry in categories),
+            'expected_products': round(sum(entry['expected'] for entry in categories)),
+            'requests_saved': history['requests_saved'],
+        })
+    return pd.DataFrame(rows, columns=['store_link', 'runs', 'last_full_sweep', 'categories', 'empty',
+                                       'expected_products', 'requests_saved'])
@@ -0,0 +1,311 @@
+"""Command line entry point for the Everli scraper.
+
+    python everli_cli.py scrape [--record fixtures.zip | --replay fixtures.zip --output-dir replay_out]
+    python everli_cli.py run-targets everli_jobs.json
+    python everli_cli.py scrape --category-plan Everli_category_plan.json
+    python everli_cli.py plan-report Everli_category_plan.json
+    python everli_cli.py compare replay_out_v1 replay_out_v2
+    python everli_cli.py reparse Everli_raw/<run_id> --output-dir reparsed
+    python everli_cli.py prices Data_Products_Eveli.csv --output price_comparison.csv
+    python everli_cli.py history ingest Data_Products_Eveli.csv
+    python everli_cli.py history changes 9000 --since 2025-06-10
+    python everli_cli.py compact 'runs/*/Data_Products_Eveli.csv' --dataset everli_dataset
+    python everli_cli.py loadtest --stores 3 --products 5000 --rate-429 0.05 --token-ttl 30
+    python everli_cli.py load Data_Products_Eveli.csv --table EVERLI_PRODUCTS
+    python everli_cli.py analyze Everli_logs --by category --output categories.csv
+    python everli_cli.py bench --sizes 1k,100k,1m
+
+Subcommands import their dependencies when they run, so everything except
+scrape starts without loading the browser or Snowflake drivers.
+"""
+import argparse
+import sys
+
+
+def cmd_scrape(args) -> int:
+    from Automated_everli import main_execution
+    profile_stages = args.profile_stages if args.profile else ()
+    main_execution(record_path=args.record, replay_path=args.replay, output_dir=args.output_dir,
+                   profile_stages=profile_stages, profile_top_n=args.profile_top,
+                   profile_memory=not args.profile_no_memory, raw_archive=args.raw_archive,
+                   price_history_path=args.price_history, normalize_workers=args.normalize_workers,
+                   memory_limit_mb=args.memory_limit_mb, arrow_output=args.arrow,
+                   category_plan_path=args.category_plan, full_sweep_every=args.full_sweep_every)
+    return 0
+
+
+def cmd_run_targets(args) -> int:
+    from everli_targets import load_job_config, run_targets
+    statuses = run_targets(load_job_config(args.config), raw_archive=args.raw_archive,
+                           price_history_path=args.price_history, normalize_workers=args.normalize_workers,
+                           memory_limit_mb=args.memory_limit_mb, arrow_output=args.arrow,
+                           category_plan_path=args.category_plan, full_sweep_every=args.full_sweep_every)
+    for name, status in statuses.items():
+        print(f"{name}: {status}")
+    return 0 if all(status == 'ok' for status in statuses.values()) else 1
+
+
+def cmd_plan_report(args) -> int:
+    from everli_category_plan import summarize_plan
+    summary = summarize_plan(args.plan)
+    print(summary.to_string(index=False))
+    print(f"{summary['requests_saved'].sum()} category requests saved across {len(summary)} stores")
+    return 0
+
+
+def cmd_compare(args) -> int:
+    from everli_replay import compare_outputs
+    differences = compare_outputs(args.dir_a, args.dir_b)
+    for difference in differences:
+        print(difference)
+    print("Outputs identical" if not differences else f"{len(differences)} output files differ")
+    return 1 if differences else 0
+
+
+def cmd_load(args) -> int:
+    from Automated_everli import load_products_file
+    num_rows = load_products_file(args.csv_path, args.table, chunk_size=args.chunk_size)
+    print(f"Loaded {num_rows} rows from {args.csv_path} into {args.table.upper()}")
+    return 0
+
+
+def cmd_analyze(args) -> int:
+    from everli_analysis import summarize_logs
+    summary = summarize_logs(args.log_paths, by=args.by)
+    summary.to_csv(args.output, index=False)
+    print(f"Summarized {len(summary)} {args.by} rows into {args.output}")
+    return 0
+
+
+def parse_sizes(value: str):
+    multipliers = {'k': 1000, 'm': 1000000}
+    sizes = []
+    for size in value.split(','):
+        size = size.strip().lower()
+        if size[-1:] in multipliers:
+            sizes.append(int(float(size[:-1]) * multipliers[size[-1]]))
+        else:
+            sizes.append(int(size))
+    return sizes
+
+
+def cmd_bench(args) -> int:
+    import json
+    from everli_bench import run_suite, save_results, latest_results, compare_results, format_suite
+    suite = run_suite(args.sizes, repeat=args.repeat, profile_memory=not args.no_memory)
+    print(format_suite(suite))
+    if args.no_save:
+        return 0
+    baseline_path = args.compare or latest_results(args.results_dir)
+    results_path = save_results(suite, args.results_dir)
+    print(f"Results saved to {results_path}")
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), suite, threshold=args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+def cmd_loadtest(args) -> int:
+    import json
+    from everli_stub_server import StubConfig, run_load_test
+    config = StubConfig(products_per_store=args.products, categories=args.categories, branches=args.branches,
+                        latency_median_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                        rate_429=args.rate_429, rate_5xx=args.rate_5xx, token_ttl=args.token_ttl, seed=args.seed)
+    report = run_load_test(config, num_stores=args.stores, request_pause=args.pause, output_dir=args.output_dir)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def cmd_reparse(args) -> int:
+    from everli_raw_archive import reparse_run
+    totals = reparse_run(args.run_dir, args.output_dir)
+    print(f"Reparsed {totals['products']} products from {totals['stores']} stores into {args.output_dir} "
+          f"({totals['quarantined']} quarantined)")
+    return 0
+
+
+def cmd_compact(args) -> int:
+    from everli_compaction import compact
+    totals = compact(args.inputs, args.dataset)
+    print(f"Compacted {totals['rows_read']} rows from {totals['files']} files into {args.dataset} "
+          f"({totals['partitions_written']} partitions written)")
+    return 0
+
+
+def cmd_prices(args) -> int:
+    from everli_price_index import build_index
+    index = build_index(args.csv_paths)
+    comparison = index.comparison(min_stores=args.min_stores, value=args.value)
+    comparison.to_csv(args.output, index=False)
+    print(f"Matched {index.shape[0]} products across {index.shape[1]} stores; "
+          f"{len(comparison)} sold in {args.min_stores}+ stores written to {args.output}")
+    print(index.store_levels(min_stores=args.min_stores, value=args.value).to_string(index=False))
+    if args.save_index:
+        print(f"Index saved to {index.save(args.save_index)}")
+    return 0
+
+
+def cmd_history(args) -> int:
+    from datetime import datetime, timedelta
+    from everli_price_history import PriceHistory
+    import pandas as pd
+    with PriceHistory(args.db) as history:
+        if args.action == 'ingest':
+            for csv_path in args.csv_paths:
+                print(f"{csv_path}: {history.ingest_csv(csv_path)}")
+            return 0
+        if args.action == 'product':
+            result = history.history(args.product_id, store_id=args.store)
+        elif args.action == 'seen':
+            result = history.seen(args.product_id, store_id=args.store)
+        else:
+            since = args.since or (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+            result = history.changes(args.store_id, since, until=args.until,
+                                     include_availability=args.availability)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(result.to_string(index=False) if not result.empty else "No matching history")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="everli", description="Everli scraper tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scrape = subparsers.add_parser("scrape", help="Run the scraper over the seller list")
+    replay_group = scrape.add_mutually_exclusive_group()
+    replay_group.add_argument("--record", metavar="ARCHIVE", help="Save every API response to a fixture archive")
+    replay_group.add_argument("--replay", metavar="ARCHIVE", help="Serve API responses from a fixture archive, offline")
+    scrape.add_argument("--output-dir", default=".", help="Where the products CSV and checkpoint are written")
+    scrape.add_argument("--raw-archive", action="store_true",
+                        help="Keep compressed raw responses under Everli_raw/<run_id>/ for reparse")
+    scrape.add_argument("--normalize-workers", type=int, default=0, metavar="N",
+                        help="Decode and normalize category listings in N worker processes")
+    scrape.add_argument("--memory-limit-mb", type=float, metavar="MB",
+                        help="Spill category results to disk as the process nears this RSS")
+    scrape.add_argument("--arrow", action="store_true",
+                        help="Also write each store's products as Feather v2 under Data_Products_Eveli_arrow/")
+    scrape.add_argument("--category-plan", metavar="PLAN",
+                        help="Order categories by past sizes and defer ones that keep coming back empty")
+    scrape.add_argument("--full-sweep-every", type=int, default=7, metavar="N",
+                        help="With --category-plan, request every category on every Nth run of a store")
+    scrape.add_argument("--price-history", metavar="DB", help="Fold each store's output into a price history database")
+    scrape.add_argument("--profile", action="store_true",
+                        help="Profile stages per store into Everli_logs/profiles/<job_id>/")
+    scrape.add_argument("--profile-stages", type=lambda value: [stage.strip() for stage in value.split(',')],
+                        default=['fetch', 'parse', 'normalize', 'write', 'log'],
+                        help="Comma-separated stages: fetch,parse,normalize,validate,write,log")
+    scrape.add_argument("--profile-top", type=int, default=25, help="Functions listed per stage in hotspot summaries")
+    scrape.add_argument("--profile-no-memory", action="store_true", help="Skip tracemalloc snapshots")
+    scrape.set_defaults(func=cmd_scrape)
+
+    run_targets = subparsers.add_parser("run-targets",
+                                        help="Scrape every target of a job config in one process")
+    run_targets.add_argument("config", help="JSON job config listing the targets (see everli_targets)")
+    run_targets.add_argument("--raw-archive", action="store_true")
+    run_targets.add_argument("--normalize-workers", type=int, default=0, metavar="N")
+    run_targets.add_argument("--memory-limit-mb", type=float, metavar="MB")
+    run_targets.add_argument("--price-history", metavar="DB")
+    run_targets.add_argument("--arrow", action="store_true")
+    run_targets.add_argument("--category-plan", metavar="PLAN")
+    run_targets.add_argument("--full-sweep-every", type=int, default=7, metavar="N")
+    run_targets.set_defaults(func=cmd_run_targets)
+
+    plan_report = subparsers.add_parser("plan-report", help="Summarize learned category plans per store")
+    plan_report.add_argument("plan", nargs="?", default="Everli_category_plan.json")
+    plan_report.set_defaults(func=cmd_plan_report)
+
+    compare = subparsers.add_parser("compare", help="Byte-for-byte comparison of two runs' output CSVs")
+    compare.add_argument("dir_a")
+    compare.add_argument("dir_b")
+    compare.set_defaults(func=cmd_compare)
+
+    load = subparsers.add_parser("load", help="Upload a products CSV into Snowflake")
+    load.add_argument("csv_path")
+    load.add_argument("--table", required=True, help="Target Snowflake table")
+    load.add_argument("--chunk-size", type=int, default=100000)
+    load.set_defaults(func=cmd_load)
+
+    analyze = subparsers.add_parser("analyze", help="Summarize scraper logs per store, category or machine")
+    analyze.add_argument("log_paths", nargs="+", help="Log CSV or .csv.gz paths, glob patterns or log directories")
+    analyze.add_argument("--by", choices=["store", "category", "machine"], default="store")
+    analyze.add_argument("--output", default="everli_store_summary.csv")
+    analyze.set_defaults(func=cmd_analyze)
+
+    bench = subparsers.add_parser("bench", help="Benchmark the store-processing path on synthetic payloads")
+    bench.add_argument("--sizes", type=parse_sizes, default=[1000, 100000, 1000000],
+                       help="Comma-separated product counts, e.g. 1k,100k,1m")
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    bench.add_argument("--results-dir", default="bench_results")
+    bench.add_argument("--compare", help="Baseline results file (default: latest in --results-dir)")
+    bench.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown reported as a regression")
+    bench.add_argument("--no-save", action="store_true")
+    bench.add_argument("--fail-on-regression", action="store_true")
+    bench.set_defaults(func=cmd_bench)
+
+    reparse = subparsers.add_parser("reparse", help="Rebuild product output from a raw response archive")
+    reparse.add_argument("run_dir", help="Everli_raw/<run_id> directory written by scrape --raw-archive")
+    reparse.add_argument("--output-dir", default="reparsed")
+    reparse.set_defaults(func=cmd_reparse)
+
+    prices = subparsers.add_parser("prices", help="Compare matched products' prices across stores")
+    prices.add_argument("csv_paths", nargs="+", help="Products CSVs or Arrow output directories of one run")
+    prices.add_argument("--output", default="price_comparison.csv")
+    prices.add_argument("--min-stores", type=int, default=2, help="Only compare products sold in this many stores")
+    prices.add_argument("--value", choices=["unit_price", "price"], default="unit_price",
+                        help="Compare price per kg/litre or shelf price")
+    prices.add_argument("--save-index", metavar="NPZ", help="Also save the sparse index for later queries")
+    prices.set_defaults(func=cmd_prices)
+
+    history = subparsers.add_parser("history", help="Per-product price history across runs")
+    history.add_argument("--db", default="everli_price_history.sqlite")
+    history_actions = history.add_subparsers(dest="action", required=True)
+    ingest = history_actions.add_parser("ingest", help="Fold products CSVs into the history, oldest first")
+    ingest.add_argument("csv_paths", nargs="+")
+    product = history_actions.add_parser("product", help="Price segments of one product")
+    product.add_argument("product_id", type=int)
+    product.add_argument("--store", type=int)
+    seen = history_actions.add_parser("seen", help="First and last time stores listed a product")
+    seen.add_argument("product_id", type=int)
+    seen.add_argument("--store", type=int)
+    changes = history_actions.add_parser("changes", help="Products whose price changed in a store")
+    changes.add_argument("store_id", type=int)
+    changes.add_argument("--since", help="YYYY-MM-DD (default: 7 days ago)")
+    changes.add_argument("--until", help="YYYY-MM-DD, exclusive")
+    changes.add_argument("--availability", action="store_true", help="Also report availability changes")
+    history.set_defaults(func=cmd_history)
+
+    compact = subparsers.add_parser("compact", help="Merge product CSVs into a partitioned Parquet dataset")
+    compact.add_argument("inputs", nargs="+", help="Product CSVs, Arrow output directories or glob patterns")
+    compact.add_argument("--dataset", default="everli_dataset", help="Dataset directory, created if missing")
+    compact.set_defaults(func=cmd_compact)
+
+    loadtest = subparsers.add_parser("loadtest", help="Run the scraper against a local stub Everli API")
+    loadtest.add_argument("--stores", type=int, default=3)
+    loadtest.add_argument("--products", type=int, default=5000, help="Products per store")
+    loadtest.add_argument("--categories", type=int, default=10)
+    loadtest.add_argument("--branches", type=int, default=5, help="Subcategories per category")
+    loadtest.add_argument("--latency-ms", type=float, default=20.0, help="Median response latency")
+    loadtest.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal latency spread")
+    loadtest.add_argument("--rate-429", type=float, default=0.0)
+    loadtest.add_argument("--rate-5xx", type=float, default=0.0)
+    loadtest.add_argument("--token-ttl", type=float, default=None, help="Seconds before a token starts getting 401")
+    loadtest.add_argument("--pause", type=float, default=0.0, help="Pause between category requests")
+    loadtest.add_argument("--seed", type=int, default=None)
+    loadtest.add_argument("--output-dir", default=None)
+    loadtest.set_defaults(func=cmd_loadtest)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
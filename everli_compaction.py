@@ -0,0 +1,288 @@
+"""Compaction of scraped product CSVs into a partitioned Parquet dataset.
+
+Appended Data_Products_Eveli.csv files and per-run outputs are merged
+into <dataset>/date=YYYY-MM-DD/store_id=<id>/location_id=<id>/part.parquet
+with:
+
+- one partition per store location: a store id can be listed under several
+  locations (store_link), each with its own prices; rows without a
+  store_link, from output written before it existed, go to
+  date=.../store_id=<id>/part.parquet
+- a unified schema: the union of all columns, identifiers as nullable
+  integers, prices as floats, nw as a timestamp, everything else as text
+- duplicates dropped on (store_link, id, nw), keeping the latest file's row
+- rows sorted by id and nw inside each partition
+- _manifest.json holding row counts and min/max statistics per file, so
+  queries over months skip partitions without opening them
+
+The scraper appends every store under the first store's CSV header, so a
+store with other columns leaves rows whose width does not match it, or
+rows of the same width whose values sit under the wrong names. A CSV is
+checked against the products schema before it is loaded: the header must
+hold id and nw with the store columns in the order the scraper writes
+them, and identifiers, prices and nw must parse in every row. The real
+column names of such rows are not in the file, so a CSV failing either
+check is refused rather than loaded misaligned or partially; the run's
+Arrow output (scrape --arrow) keeps each store's own columns and is
+compacted instead.
+
+Requires pyarrow.
+"""
+import csv
+import glob
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from everli_validation import to_number
+
+MANIFEST_NAME = '_manifest.json'
+ID_COLUMNS = ('id', 'store_id', 'source_file_id', 'url_id', 'currency_id', 'area_id', 'country_id', 'src_id')
+PRICE_COLUMNS = ('price', 'full_price')
+REQUIRED_COLUMNS = ('id', 'nw')
+# Written by everli_normalize.add_store_columns after nw, in this order
+STORE_COLUMNS = ('store_name', 'store_id', 'store_link', 'source_file_id', 'url_id', 'currency_id', 'area_id',
+                 'country_id', 'src_id')
+DEDUP_KEY = ('store_id', 'store_link', 'id', 'nw')
+LOCATION_PATTERN = re.compile(r'/locations/(\d+)/')
+SORT_KEY = ('id', 'nw')
+
+
+def _require_pyarrow() -> None:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Compaction needs pyarrow: pip install pyarrow") from e
+
+
+def _misaligned(path: str, rows: int, line: int, detail: str) -> ValueError:
+    return ValueError(f"{path}: {rows} rows (first at line {line}) {detail}, so their columns are unknown; "
+                      f"compact the run's Arrow output (scrape --arrow) instead")
+
+
+def check_products_schema(path: str, frame: pd.DataFrame, lines: List[int]) -> None:
+    """Raise ValueError unless the header and every row's typed values fit the products schema"""
+    header = list(frame.columns)
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"{path}: not a products CSV, the header has no {missing} column")
+    positions = [header.index(column) for column in ('nw',) + STORE_COLUMNS if column in header]
+    if positions != sorted(positions):
+        raise ValueError(f"{path}: the header's nw and store columns are not in the order the scraper writes "
+                         f"them ({', '.join(column for column in ('nw',) + STORE_COLUMNS if column in header)})")
+    unparsed = pd.Series(False, index=frame.index)
+    for column in header:
+        values = frame[column]
+        if column in ID_COLUMNS:
+            parsed = pd.to_numeric(values, errors='coerce')
+        elif column in PRICE_COLUMNS:
+            # Stricter than to_number, which would read 'Product 0' as 0
+            cleaned = values.astype(str).str.replace(r'[\s€$£]', '', regex=True).str.replace(',', '.', regex=False)
+            parsed = pd.to_numeric(cleaned, errors='coerce')
+        elif column == 'nw':
+            parsed = pd.to_datetime(values, errors='coerce', format='ISO8601')
+        else:
+            continue
+        unparsed |= values.notna() & parsed.isna()
+    if unparsed.any():
+        raise _misaligned(path, int(unparsed.sum()), lines[int(unparsed.to_numpy().argmax())],
+                          "hold values that do not parse as the header's id, price or nw columns")
+
+
+def read_products_csv(path: str) -> pd.DataFrame:
+    """Read a products CSV as text, raising ValueError when its rows do not fit the header"""
+    csv.field_size_limit(sys.maxsize)
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return pd.DataFrame()
+        rows, lines, misaligned = [], [], []
+        for line, row in enumerate(reader, start=2):
+            if len(row) == len(header):
+                rows.append(row)
+                lines.append(line)
+            elif row:
+                misaligned.append(line)
+    if misaligned:
+        raise _misaligned(path, len(misaligned), misaligned[0], f"do not match the {len(header)}-column header")
+    frame = pd.DataFrame(rows, columns=[column.strip() for column in header], dtype=object)
+    frame = frame.loc[:, ~frame.columns.duplicated()].replace('', None)
+    check_products_schema(path, frame, lines)
+    return frame
+
+
+def read_products(path: str) -> pd.DataFrame:
+    """Products of a CSV or of a run's Arrow output"""
+    from everli_arrow import is_arrow_run, read_run_frame
+    return read_run_frame(path) if is_arrow_run(path) else read_products_csv(path)
+
+
+def unify_types(frame: pd.DataFrame) -> pd.DataFrame:
+    """Apply the dataset schema: integer ids, float prices, timestamp nw, text otherwise"""
+    frame = frame.copy()
+    for column in frame.columns:
+        if column in ID_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').round().astype('Int64')
+        elif column in PRICE_COLUMNS:
+            frame[column] = to_number(frame[column])
+        elif column == 'nw':
+            frame[column] = pd.to_datetime(frame[column], errors='coerce')
+        else:
+            frame[column] = frame[column].astype('string')
+    return frame
+
+
+def _dedup_and_sort(frame: pd.DataFrame) -> pd.DataFrame:
+    key = [column for column in DEDUP_KEY if column in frame.columns]
+    frame = frame.drop_duplicates(subset=key or None, keep='last')
+    sort_key = [column for column in SORT_KEY if column in frame.columns]
+    if sort_key:
+        frame = frame.sort_values(sort_key, kind='stable')
+    return frame.reset_index(drop=True)
+
+
+def _file_stats(frame: pd.DataFrame) -> Dict[str, List[Any]]:
+    stats = {}
+    for column in frame.columns:
+        series = frame[column].dropna()
+        if series.empty or not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)):
+            continue
+        low, high = series.min(), series.max()
+        if pd.api.types.is_datetime64_any_dtype(series):
+            low, high = low.isoformat(), high.isoformat()
+        else:
+            low, high = (int(low), int(high)) if pd.api.types.is_integer_dtype(series) else (float(low), float(high))
+        stats[column] = [low, high]
+    return stats
+
+
+def load_manifest(dataset_dir: str) -> Dict[str, Any]:
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'files': {}, 'columns': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(dataset_dir: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def location_of(store_link: str) -> str:
+    """Location id of a store link, '' for rows without one"""
+    if not store_link:
+        return ''
+    match = LOCATION_PATTERN.search(store_link)
+    return match.group(1) if match else re.sub(r'\W+', '_', store_link)
+
+
+def _write_partition(dataset_dir: str, date: str, store_id, store_link: str, frame: pd.DataFrame,
+                     manifest: Dict[str, Any]) -> int:
+    location = location_of(store_link)
+    location_dir = [f"location_id={location}"] if location else []
+    relative_path = os.path.join(f"date={date}", f"store_id={store_id}", *location_dir, 'part.parquet')
+    path = os.path.join(dataset_dir, relative_path)
+    if os.path.exists(path):
+        existing = pd.read_parquet(path)
+        frame = pd.concat([existing, frame], ignore_index=True)
+    frame = _dedup_and_sort(unify_types(frame))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_parquet(path + '.tmp', index=False, engine='pyarrow')
+    os.replace(path + '.tmp', path)
+    manifest['files'][relative_path] = {
+        'date': date,
+        'store_id': None if store_id == 'unknown' else int(store_id),
+        'store_link': store_link or None,
+        'rows': len(frame),
+        'stats': _file_stats(frame),
+    }
+    return len(frame)
+
+
+def compact(input_paths: Iterable[str], dataset_dir: str) -> Dict[str, int]:
+    """Merge product CSVs or Arrow outputs into the partitioned dataset, returning row counts"""
+    _require_pyarrow()
+    os.makedirs(dataset_dir, exist_ok=True)
+    manifest = load_manifest(dataset_dir)
+    columns = set(manifest.get('columns', []))
+    totals = {'files': 0, 'rows_read': 0, 'partitions_written': 0}
+    for pattern in input_paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            frame = unify_types(read_products(path))
+            totals['files'] += 1
+            totals['rows_read'] += len(frame)
+            if frame.empty:
+                continue
+            columns.update(frame.columns)
+            unknown = pd.Series('unknown', index=frame.index)
+            dates = frame['nw'].dt.strftime('%Y-%m-%d').fillna('unknown') if 'nw' in frame.columns else unknown
+            stores = frame['store_id'].astype('string').fillna('unknown') if 'store_id' in frame.columns else unknown
+            links = (frame['store_link'].astype('string').fillna('') if 'store_link' in frame.columns
+                     else pd.Series('', index=frame.index))
+            groups = frame.groupby([dates.rename('date'), stores.rename('store'), links.rename('link')], sort=True)
+            for (date, store_id, store_link), partition in groups:
+                _write_partition(dataset_dir, date, store_id, store_link, partition, manifest)
+                totals['partitions_written'] += 1
+    manifest['columns'] = sorted(columns)
+    _save_manifest(dataset_dir, manifest)
+    return totals
+
+
+def select_files(manifest: Dict[str, Any], store_ids: Optional[Iterable[int]] = None,
+                 date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 ranges: Optional[Dict[str, List[Optional[float]]]] = None) -> List[str]:
+    """Pick dataset files whose partition and min/max stats can match the filters"""
+    store_ids = set(store_ids) if store_ids is not None else None
+    selected = []
+    for relative_path, entry in sorted(manifest['files'].items()):
+        if store_ids is not None and entry['store_id'] not in store_ids:
+            continue
+        if date_from and entry['date'] != 'unknown' and entry['date'] < date_from:
+            continue
+        if date_to and entry['date'] != 'unknown' and entry['date'] > date_to:
+            continue
+        skip = False
+        for column, (low, high) in (ranges or {}).items():
+            if column not in entry['stats']:
+                continue
+            file_low, file_high = entry['stats'][column]
+            if (low is not None and file_high < low) or (high is not None and file_low > high):
+                skip = True
+                break
+        if not skip:
+            selected.append(relative_path)
+    return selected
+
+
+def query(dataset_dir: str, store_ids: Optional[Iterable[int]] = None, date_from: Optional[str] = None,
+          date_to: Optional[str] = None, product_ids: Optional[Iterable[int]] = None,
+          ranges: Optional[Dict[str, List[Optional[float]]]] = None,
+          columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Load matching rows, reading only the files the manifest cannot rule out"""
+    _require_pyarrow()
+    manifest = load_manifest(dataset_dir)
+    ranges = dict(ranges or {})
+    product_ids = list(product_ids) if product_ids is not None else None
+    if product_ids:
+        ranges.setdefault('id', [min(product_ids), max(product_ids)])
+    frames = []
+    for relative_path in select_files(manifest, store_ids, date_from, date_to, ranges):
+        frame = pd.read_parquet(os.path.join(dataset_dir, relative_path), columns=columns)
+        if product_ids is not None and 'id' in frame.columns:
+            frame = frame[frame['id'].isin(product_ids)]
+        for column, (low, high) in ranges.items():
+            if column in frame.columns:
+                if low is not None:
+                    frame = frame[frame[column] >= low]
+                if high is not None:
+                    frame = frame[frame[column] <= high]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
@@ -0,0 +1,45 @@
+"""Synthetic Everli API payloads shared by the benchmark and the stub server.
+
+Both build categories/tree and category-listing responses with the same
+shape as the live API, so the payload builders live here rather than in
+either consumer.
+"""
+from typing import Any, Dict
+
+
+def make_tree_payload(num_categories: int, branches_per_category: int = 5,
+                      location_id='11331', store_id='5232') -> Dict[str, Any]:
+    """Build a categories/tree response with the same shape as the live API"""
+    prefix = f'#/locations/{location_id}/stores/{store_id}/categories'
+    items = []
+    for c in range(num_categories):
+        items.append({
+            'name': f'Category {c}',
+            'link': f'{prefix}/{c}',
+            'branch': [
+                {'name': f'Subcategory {c}.{b}', 'link': f'{prefix}/{c}/{b}'}
+                for b in range(branches_per_category)
+            ]
+        })
+    return {'data': {'menu': [{'title': 'header'}, {'items': items}]}}
+
+
+def make_listing_payload(num_products: int, first_id: int = 100000) -> Dict[str, Any]:
+    """Build a category listing response holding num_products products"""
+    products = []
+    for p in range(num_products):
+        price = round(1 + (p % 500) / 100, 2)
+        products.append({
+            'id': first_id + p,
+            'name': f'Product {p}',
+            'price': price,
+            'full_price': round(price + 0.5, 2),
+            'unit_price': f'{round(price * 2, 2)} €/kg',
+            'quantity': '500 g',
+            'brand': f'Brand {p % 50}',
+            'available': p % 17 != 0,
+        })
+    return {'data': {'body': [
+        {'widget_type': 'breadcrumb', 'list': []},
+        {'widget_type': 'vertical-list', 'list': products},
+    ]}}
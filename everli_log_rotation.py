@@ -0,0 +1,254 @@
+"""Size-based rotation, background compression and retention of scraper logs.
+
+Each process appends to its own Everli_logs/scraper_logs_<date>_<owner>.csv
+(owner is p<pid>), so sharded scrapers sharing the directory never rename
+a file another process is still writing. Once the file passes max_bytes it
+is renamed to the process's next closed segment,
+scraper_logs_<date>_<owner>.<n>.csv, and a fresh file with the CSV header
+takes its place. Closed segments are gzipped on a background thread into
+scraper_logs_<date>_<owner>.<n>.csv.gz. Files another process left behind
+(not written to for STALE_SECONDS) are closed and compressed at startup.
+Everli_logs/log_segments.json indexes every closed segment with its date,
+sequence number, raw and compressed size and state; processes update it
+under a lock file. Retention deletes
+segments older than max_age_days, then the oldest segments until the
+directory is under max_total_bytes; it never waits on the background
+compressions, and active files and segments still queued for compression
+are left alone. everli_analysis reads .csv.gz segments directly.
+"""
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+INDEX_NAME = 'log_segments.json'
+STALE_SECONDS = 3600
+LOG_FILE = re.compile(r'^scraper_logs_(\d{4}-\d{2}-\d{2})(?:_([A-Za-z0-9]+))?(?:\.(\d+))?\.csv(\.gz)?$')
+
+
+def parse_log_name(name: str) -> Optional[Dict[str, Any]]:
+    """Date, owner, segment number (None for an active file) and compression of a log file name"""
+    match = LOG_FILE.match(name)
+    if not match:
+        return None
+    date, owner, seq, gz = match.groups()
+    return {'date': date, 'owner': owner, 'seq': int(seq) if seq else None, 'compressed': bool(gz)}
+
+
+def log_name(date: str, owner: Optional[str] = None, seq: Optional[int] = None) -> str:
+    return f"scraper_logs_{date}{'_' + owner if owner else ''}{'.' + str(seq) if seq is not None else ''}.csv"
+
+
+def log_paths(log_dir: str) -> List[str]:
+    """Every log file in the directory, closed segments and active files, oldest first"""
+    entries = []
+    for name in os.listdir(log_dir) if os.path.isdir(log_dir) else []:
+        parsed = parse_log_name(name)
+        if parsed:
+            # An active file holds the newest rows of its date, so it sorts after that date's segments
+            seq = parsed['seq'] if parsed['seq'] is not None else float('inf')
+            entries.append((parsed['date'], seq, parsed['owner'] or '', os.path.join(log_dir, name)))
+    return [path for _, _, _, path in sorted(entries)]
+
+
+class LogRotator:
+    """Rotates the active log by size and compresses and prunes closed segments"""
+
+    def __init__(self, log_dir: str, max_bytes: int = 64 * 1024 * 1024,
+                 max_total_bytes: int = 1024 * 1024 * 1024, max_age_days: int = 7, compress: bool = True,
+                 owner: Optional[str] = None):
+        self.log_dir = log_dir
+        self.owner = owner or f"p{os.getpid()}"
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.max_age_days = max_age_days
+        self.compress = compress
+        self.index_path = os.path.join(log_dir, INDEX_NAME)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='log-compress')
+        self.pending: List[Future] = []
+        self.compressing: Set[str] = set()
+
+    def active_path(self, date: str) -> str:
+        """This process's log file for a date"""
+        return os.path.join(self.log_dir, log_name(date, self.owner))
+
+    @contextmanager
+    def _index_lock(self):
+        """Serialize index updates across this process's threads and other processes"""
+        lock_path = self.index_path + '.lock'
+        with self.lock:
+            while True:
+                try:
+                    fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    break
+                except FileExistsError:
+                    try:
+                        if time.time() - os.path.getmtime(lock_path) > 30:
+                            os.remove(lock_path)  # left by a process killed while holding it
+                    except OSError:
+                        pass
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                os.close(fd)
+                os.remove(lock_path)
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return {segment['name']: segment for segment in json.load(f)['segments']}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _save_index(self, segments: Dict[str, Dict[str, Any]]) -> None:
+        ordered = sorted(segments.values(), key=lambda segment: (segment['date'], segment['seq'], segment['name']))
+        with open(self.index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'segments': ordered}, f, indent=1)
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def _update_index(self, name: str, **fields) -> None:
+        with self._index_lock():
+            segments = self._load_index()
+            if fields.pop('remove', False):
+                segments.pop(name, None)
+            else:
+                segments.setdefault(name, {'name': name}).update(fields)
+            self._save_index(segments)
+
+    def segments(self) -> List[Dict[str, Any]]:
+        with self._index_lock():
+            return sorted(self._load_index().values(),
+                          key=lambda segment: (segment['date'], segment['seq'], segment['name']))
+
+    def _next_seq(self, date: str, owner: Optional[str]) -> int:
+        seqs = [parsed['seq'] for parsed in map(parse_log_name, os.listdir(self.log_dir))
+                if parsed and parsed['date'] == date and parsed['owner'] == owner and parsed['seq'] is not None]
+        return max(seqs, default=0) + 1
+
+    def should_rotate(self, size: int) -> bool:
+        return self.max_bytes > 0 and size >= self.max_bytes
+
+    def close_segment(self, path: str) -> Optional[str]:
+        """Rename a log file to the next closed segment of its date and queue its compression"""
+        parsed = parse_log_name(os.path.basename(path))
+        if parsed is None or not os.path.exists(path):
+            return None
+        seq = self._next_seq(parsed['date'], parsed['owner'])
+        name = log_name(parsed['date'], parsed['owner'], seq)
+        segment_path = os.path.join(self.log_dir, name)
+        os.replace(path, segment_path)
+        self._update_index(name, date=parsed['date'], seq=seq, owner=parsed['owner'],
+                           bytes=os.path.getsize(segment_path),
+                           compressed_bytes=None, state='closed', closed_at=datetime.now().isoformat(timespec='seconds'))
+        if self.compress:
+            self._queue_compression(segment_path)
+        return segment_path
+
+    def _queue_compression(self, segment_path: str) -> None:
+        with self.lock:
+            self.compressing.add(os.path.abspath(segment_path))
+        self.pending.append(self.executor.submit(self._compress, segment_path))
+
+    def _compress(self, segment_path: str) -> Optional[str]:
+        try:
+            return self._compress_segment(segment_path)
+        finally:
+            with self.lock:
+                self.compressing.discard(os.path.abspath(segment_path))
+
+    def _compress_segment(self, segment_path: str) -> Optional[str]:
+        gz_path = segment_path + '.gz'
+        tmp_path = f"{gz_path}.{os.getpid()}.tmp"
+        try:
+            with open(segment_path, 'rb') as source, gzip.open(tmp_path, 'wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            raw_bytes = os.path.getsize(segment_path)
+        except FileNotFoundError:
+            # Pruned by another process's retention meanwhile
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._update_index(os.path.basename(segment_path), remove=True)
+            return None
+        compressed_bytes = os.path.getsize(tmp_path)
+        os.replace(tmp_path, gz_path)
+        try:
+            os.remove(segment_path)
+        except FileNotFoundError:
+            pass
+        name = os.path.basename(segment_path)
+        parsed = parse_log_name(name)
+        with self._index_lock():
+            segments = self._load_index()
+            closed_at = segments.pop(name, {}).get('closed_at') or datetime.now().isoformat(timespec='seconds')
+            segments[name + '.gz'] = {'name': name + '.gz', 'date': parsed['date'], 'seq': parsed['seq'],
+                                      'owner': parsed['owner'], 'bytes': raw_bytes,
+                                      'compressed_bytes': compressed_bytes,
+                                      'state': 'compressed', 'closed_at': closed_at}
+            self._save_index(segments)
+        return gz_path
+
+    def adopt_stale_files(self, active_path: str, now: Optional[float] = None) -> None:
+        """Close and compress files that crashed or finished processes left behind.
+
+        Another process's file counts as left behind once it has not been
+        written to for STALE_SECONDS; files still in use are left alone.
+        """
+        now = now or time.time()
+        for name in sorted(os.listdir(self.log_dir)):
+            parsed = parse_log_name(name)
+            path = os.path.join(self.log_dir, name)
+            if parsed is None or parsed['compressed'] or os.path.abspath(path) == os.path.abspath(active_path):
+                continue
+            try:
+                if now - os.path.getmtime(path) < STALE_SECONDS:
+                    continue
+            except OSError:
+                continue
+            if parsed['seq'] is None:
+                self.close_segment(path)
+            elif self.compress:
+                self._update_index(name, date=parsed['date'], seq=parsed['seq'], owner=parsed['owner'],
+                                   bytes=os.path.getsize(path), compressed_bytes=None, state='closed',
+                                   closed_at=datetime.now().isoformat(timespec='seconds'))
+                self._queue_compression(path)
+
+    def apply_retention(self, active_path: str, now: Optional[datetime] = None) -> List[str]:
+        """Delete closed or compressed segments past max_age_days, then the oldest until under max_total_bytes"""
+        cutoff = ((now or datetime.now()) - timedelta(days=self.max_age_days)).strftime('%Y-%m-%d')
+        with self.lock:
+            busy = self.compressing | {os.path.abspath(active_path)}
+        paths = log_paths(self.log_dir)
+        # Compressions keep running meanwhile, so files may vanish between listing and reading them
+        sizes = {path: os.path.getsize(path) if os.path.exists(path) else 0 for path in paths}
+        total = sum(sizes.values())
+        removed = []
+        for path in paths:
+            parsed = parse_log_name(os.path.basename(path))
+            # Active files, this process's and other processes', are never deleted
+            if parsed['seq'] is None or os.path.abspath(path) in busy:
+                continue
+            if parsed['date'] >= cutoff and total <= self.max_total_bytes:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._update_index(os.path.basename(path), remove=True)
+            total -= sizes[path]
+            removed.append(path)
+        return removed
+
+    def wait(self) -> None:
+        """Block until queued compressions finish"""
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
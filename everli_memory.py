@@ -0,0 +1,185 @@
+"""Memory budget for the scrape loop: RSS tracking and spill-to-disk of category frames.
+
+main_execution hands every normalized category frame to MemoryBudget.add
+instead of keeping a plain list. The budget samples the process RSS and
+sums the frames' in-memory size; when RSS reaches SPILL_FRACTION of the
+limit, or the held frames reach BATCH_FRACTION of it, the held frames are
+written to a columnar part file (Arrow IPC, pickle when Arrow cannot hold
+them) under <output_dir>/Everli_spill/store_<i>/ and dropped. batches()
+reads the parts back one at a time at store end, cast to the columns and
+dtypes the whole store would have had in one frame, so validation and the
+writers stream them without holding the store in memory. Part paths go into the
+checkpoint, so a run killed mid-store picks its spilled categories up
+again on resume. Peak RSS per store comes from the kernel's high-water
+mark (reset at each store start) where available, else from the samples.
+"""
+import gc
+import os
+import shutil
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from everli_parallel import decode_frame, encode_frame
+
+SPILL_DIR = 'Everli_spill'
+SPILL_FRACTION = 0.8
+BATCH_FRACTION = 0.25
+PART_SUFFIXES = {'arrow': '.arrow', 'pickle': '.pkl'}
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """High-water RSS in bytes since the process start or the last reset_peak_rss()"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark (Linux); False when unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def frame_bytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def _part_kind(path: str) -> str:
+    return 'pickle' if path.endswith(PART_SUFFIXES['pickle']) else 'arrow'
+
+
+def read_part(path: str) -> pd.DataFrame:
+    with open(path, 'rb') as f:
+        return decode_frame(_part_kind(path), f.read())
+
+
+def part_head(path: str) -> pd.DataFrame:
+    """First row of a part file (none when it is empty), read without decoding the rest of an Arrow part"""
+    if _part_kind(path) == 'pickle':
+        return read_part(path).iloc[:1]
+    import pyarrow as pa
+    reader = pa.ipc.open_stream(pa.memory_map(path, 'r'))
+    try:
+        first = reader.read_next_batch().slice(0, 1)
+    except StopIteration:
+        return reader.schema.empty_table().to_pandas()
+    return pa.Table.from_batches([first], schema=reader.schema).to_pandas()
+
+
+def align_frame(frame: pd.DataFrame, dtypes: pd.Series) -> pd.DataFrame:
+    """Give a batch the store-wide column order and dtypes a single concat would have produced"""
+    frame = frame.reindex(columns=dtypes.index)
+    mismatched = {column: dtype for column, dtype in dtypes.items() if frame[column].dtype != dtype}
+    return frame.astype(mismatched) if mismatched else frame
+
+
+class MemoryBudget:
+    """Holds a store's category frames within limit_bytes, spilling them to part files"""
+
+    def __init__(self, spill_root: str, limit_bytes: Optional[int] = None):
+        self.spill_root = spill_root
+        self.limit_bytes = limit_bytes
+        self.store_dir = None
+        self.frames: List[pd.DataFrame] = []
+        self.parts: List[str] = []
+        self.held_bytes = 0
+        self.spilled_rows = 0
+        self.sampled_peak = 0
+        self.exact_peak = False
+        self.run_peak = 0
+
+    def begin_store(self, store_index: int, resume_parts: Sequence[str] = ()) -> None:
+        """Start tracking a store, re-attaching part files a previous attempt spilled"""
+        self.store_dir = os.path.join(self.spill_root, f'store_{store_index}')
+        self.frames, self.held_bytes, self.spilled_rows = [], 0, 0
+        self.parts = [path for path in resume_parts if os.path.exists(path)]
+        self.exact_peak = reset_peak_rss()
+        self.sampled_peak = current_rss()
+
+    def sample(self) -> int:
+        rss = current_rss()
+        self.sampled_peak = max(self.sampled_peak, rss)
+        return rss
+
+    def should_spill(self, rss: int) -> bool:
+        if not self.limit_bytes or not self.frames:
+            return False
+        return rss >= self.limit_bytes * SPILL_FRACTION or self.held_bytes >= self.limit_bytes * BATCH_FRACTION
+
+    def add(self, frame: pd.DataFrame) -> Optional[str]:
+        """Hold a category frame; returns the part path when this pushed the budget into a spill"""
+        self.frames.append(frame)
+        self.held_bytes += frame_bytes(frame)
+        if self.should_spill(self.sample()):
+            return self.spill()
+        return None
+
+    def spill(self) -> str:
+        """Write the held frames to the next part file and release them"""
+        batch = pd.concat(self.frames, ignore_index=True)
+        kind, payload = encode_frame(batch)
+        os.makedirs(self.store_dir, exist_ok=True)
+        path = os.path.join(self.store_dir, f'part-{len(self.parts):05d}{PART_SUFFIXES[kind]}')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(payload)
+        os.replace(path + '.tmp', path)
+        self.parts.append(path)
+        self.spilled_rows += len(batch)
+        self.frames, self.held_bytes = [], 0
+        del batch, payload
+        gc.collect()
+        return path
+
+    def batches(self) -> Iterator[pd.DataFrame]:
+        """Each spilled part, then the held frames as one batch, in the order they were added"""
+        if not self.parts and not self.frames:
+            return
+        # One row per part and frame is enough to work out the store-wide columns and dtypes
+        heads = [part_head(path) for path in self.parts] + [frame.iloc[:1] for frame in self.frames]
+        dtypes = pd.concat(heads, ignore_index=True).dtypes
+        del heads
+        for path in self.parts:
+            yield align_frame(read_part(path), dtypes)
+        if self.frames:
+            yield align_frame(pd.concat(self.frames, ignore_index=True), dtypes)
+
+    def end_store(self, keep_parts: bool = False) -> Dict[str, Any]:
+        """Drop the store's frames and, unless keep_parts, its part files; report its peak RSS and spills"""
+        self.sample()
+        peak = max(peak_rss(), self.sampled_peak) if self.exact_peak else self.sampled_peak
+        self.run_peak = max(self.run_peak, peak)
+        stats = {'peak_rss_mb': round(peak / 1024 ** 2, 1), 'spilled_parts': len(self.parts),
+                 'spilled_rows': self.spilled_rows}
+        if not keep_parts and self.store_dir and os.path.isdir(self.store_dir):
+            shutil.rmtree(self.store_dir, ignore_errors=True)
+            try:
+                os.rmdir(self.spill_root)
+            except OSError:
+                pass
+        self.frames, self.parts, self.held_bytes = [], [], 0
+        return stats
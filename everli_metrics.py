@@ -0,0 +1,176 @@
+"""Run metrics for the Everli scraper.
+
+Counters, gauges and fixed-bucket histograms kept in memory and exported
+as a JSON summary plus a Prometheus textfile (for node_exporter's textfile
+collector), at the end of a run and periodically while it is running.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 600.0, 3600.0)
+METRIC_PREFIX = 'everli_'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs]
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[index] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile as the upper bound of the bucket that holds it"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets, self.bucket_counts):
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+class RunMetrics:
+    """In-process metrics registry for one scraper run"""
+
+    def __init__(self, log_dir: str, job_id: str, export_interval: float = 60.0):
+        self.log_dir = log_dir
+        self.job_id = job_id
+        self.export_interval = export_interval
+        self.started = time.time()
+        self.last_export = self.started
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        os.makedirs(log_dir, exist_ok=True)
+        self.json_path = os.path.join(log_dir, f'metrics_{time.strftime("%Y-%m-%d")}_{job_id}.json')
+        self.prometheus_path = os.path.join(log_dir, 'everli_metrics.prom')
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the wall time of the with-block into histogram name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter_total(self, name: str) -> float:
+        return sum(self.counters.get(name, {}).values())
+
+    def _update_derived(self) -> None:
+        elapsed = max(time.time() - self.started, 1e-9)
+        self.set_gauge('run_elapsed_seconds', round(elapsed, 3))
+        self.set_gauge('products_per_second', round(self.counter_total('products_total') / elapsed, 3))
+
+    def to_dict(self) -> Dict[str, object]:
+        self._update_derived()
+
+        def flatten(series, value_of):
+            return [{'labels': dict(key), **value_of(value)} for key, value in series.items()]
+
+        return {
+            'job_id': self.job_id,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'exported': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'counters': {name: flatten(series, lambda v: {'value': v}) for name, series in self.counters.items()},
+            'gauges': {name: flatten(series, lambda v: {'value': v}) for name, series in self.gauges.items()},
+            'histograms': {name: flatten(series, Histogram.summary) for name, series in self.histograms.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        self._update_derived()
+        job = {'job_id': self.job_id}
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} counter')
+            for key, value in series.items():
+                lines.append(f'{METRIC_PREFIX}{name}{_format_labels(key, job)} {value}')
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} gauge')
+            for key, value in series.items():
+                lines.append(f'{METRIC_PREFIX}{name}{_format_labels(key, job)} {value}')
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} histogram')
+            for key, histogram in series.items():
+                for bound, cumulative in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'{METRIC_PREFIX}{name}_bucket{_format_labels(key, {**job, "le": str(bound)})} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}{name}_bucket{_format_labels(key, {**job, "le": "+Inf"})} {histogram.count}')
+                lines.append(f'{METRIC_PREFIX}{name}_sum{_format_labels(key, job)} {histogram.sum}')
+                lines.append(f'{METRIC_PREFIX}{name}_count{_format_labels(key, job)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _write_atomic(path: str, content: str) -> None:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def export(self) -> None:
+        """Write the JSON summary and the Prometheus textfile"""
+        self._write_atomic(self.json_path, json.dumps(self.to_dict(), indent=2, default=str))
+        self._write_atomic(self.prometheus_path, self.to_prometheus())
+        self.last_export = time.time()
+
+    def maybe_export(self) -> bool:
+        """Export if export_interval seconds have passed since the last export"""
+        if time.time() - self.last_export < self.export_interval:
+            return False
+        self.export()
+        return True
@@ -0,0 +1,51 @@
+"""Turning parsed Everli products into output rows."""
+import os
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+def products_after_checkpoint(product_list: List[Dict[str, Any]],
+                              last_processed_product_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Drop products up to and including the checkpointed one when resuming a category"""
+    if not last_processed_product_id:
+        return product_list
+    for index, product in enumerate(product_list):
+        if str(product.get('id')) == last_processed_product_id:
+            return product_list[index + 1:]
+    return []
+
+
+def normalize_products(product_list: List[Dict[str, Any]], cat: str, sub_cat: str, nw: str) -> pd.DataFrame:
+    """Flatten one category's products into a frame in a single json_normalize call"""
+    if not product_list:
+        return pd.DataFrame()
+    products_df = pd.json_normalize(product_list)
+    products_df['cat_name_org'] = cat
+    products_df['sub_cat_name_org'] = sub_cat
+    products_df['nw'] = nw
+    return products_df
+
+
+def add_store_columns(products_df: pd.DataFrame, store: Dict[str, Any], source_file_ID) -> pd.DataFrame:
+    """Tag a store's products with the store and run identifiers written to the output"""
+    products_df['store_name'] = store['name']
+    products_df['store_id'] = store['id']
+    products_df['store_link'] = store['link']
+    products_df['source_file_id'] = source_file_ID
+    products_df['url_id'] = store['Url_id']
+    products_df['currency_id'] = store['currency_id']
+    products_df['area_id'] = store['area_id']
+    products_df['country_id'] = store['country_id']
+    products_df['src_id'] = store['src_id']
+    return products_df
+
+
+def append_products_csv(products_df: pd.DataFrame, csv_path: str) -> None:
+    """Append rows to the master CSV, writing the header only for a new file"""
+    products_df.to_csv(
+        csv_path,
+        mode='a',
+        index=False,
+        header=not os.path.exists(csv_path)
+    )
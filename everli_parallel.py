@@ -0,0 +1,89 @@
+"""Process-pool parsing and normalization of category listings.
+
+With normalize_workers set, main_execution hands each category's raw
+response body to a worker process instead of decoding and flattening it in
+the scraping loop. The worker decodes the JSON, extracts the vertical
+list, drops products up to the checkpoint and runs normalize_products,
+then returns the frame as an Arrow IPC stream, so only the raw bytes go in
+and a columnar buffer comes back; no DataFrame is pickled either way.
+Frames Arrow cannot represent (mixed-type object columns) fall back to
+pickle. Nested lists and dicts are turned into the text to_csv would have
+written for them, so the output CSV matches the in-process path byte for
+byte. Validation stays per store in the main process because the
+duplicate-id check spans categories. The size logged for a pooled
+category is that of the encoded frame, so the main process never
+serializes it again just to measure it.
+"""
+import json
+import pickle
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from everli_parsing import extract_vertical_list
+from everli_normalize import products_after_checkpoint, normalize_products
+
+
+def flatten_nested(frame: pd.DataFrame) -> pd.DataFrame:
+    """Replace list/dict cells with str(), which is what to_csv writes for them"""
+    for column in frame.columns[frame.dtypes == object]:
+        values = frame[column]
+        nested = values.map(lambda value: isinstance(value, (list, dict)))
+        if nested.any():
+            frame[column] = values.where(~nested, values[nested].map(str))
+    return frame
+
+
+def encode_frame(frame: pd.DataFrame) -> Tuple[str, bytes]:
+    """Serialize a frame as ('arrow', IPC stream) or, when Arrow cannot hold it, ('pickle', bytes)"""
+    frame = flatten_nested(frame)
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return 'pickle', pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return 'pickle', pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return 'arrow', sink.getvalue().to_pybytes()
+
+
+def decode_frame(kind: str, payload: bytes) -> pd.DataFrame:
+    if kind == 'pickle':
+        return pickle.loads(payload)
+    import pyarrow as pa
+    return pa.ipc.open_stream(payload).read_all().to_pandas()
+
+
+def normalize_category(body: bytes, cat: str, sub_cat: str, nw: str,
+                       last_processed_product_id: Optional[str]) -> Tuple[int, str, bytes]:
+    """Worker entry point: raw listing body to (products found, encoded normalized frame)"""
+    product_list = extract_vertical_list(json.loads(body))
+    pending = products_after_checkpoint(product_list, last_processed_product_id)
+    kind, payload = encode_frame(normalize_products(pending, cat, sub_cat, nw))
+    return len(product_list), kind, payload
+
+
+class NormalizePool:
+    """Process pool running normalize_category on raw listing bodies"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, body: bytes, cat: str, sub_cat: str, nw: str,
+               last_processed_product_id: Optional[str]) -> Future:
+        return self.executor.submit(normalize_category, body, cat, sub_cat, nw, last_processed_product_id)
+
+    @staticmethod
+    def result(future: Future) -> Tuple[int, pd.DataFrame, int]:
+        """Wait for a submitted category, returning (products found, normalized frame, encoded size in bytes)"""
+        found, kind, payload = future.result()
+        return found, decode_frame(kind, payload), len(payload)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
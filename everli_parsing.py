@@ -0,0 +1,36 @@
+"""Parsing helpers for Everli API payloads.
+
+Only the standard library is used here so worker processes and analysis
+tools can import the parsing path without loading pandas or a browser.
+"""
+from typing import Any, Dict, List
+
+API_BASE = "https://api.everli.com/sm/api/v3"
+
+
+def flatten_category_tree(categories_json: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Flatten a categories/tree response into name/link/parent_name records"""
+    categories_list = []
+    for block in categories_json['data']['menu']:
+        if 'items' not in block:
+            continue
+        for cat in block['items']:
+            parent_name = cat['name']
+            categories_list.append({'name': parent_name, 'link': cat['link'], 'parent_name': ''})
+            for sub_cat in cat.get('branch', []):
+                categories_list.append({'name': sub_cat['name'], 'link': sub_cat['link'], 'parent_name': parent_name})
+    return categories_list
+
+
+def leaf_categories(categories_list: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Keep only subcategories, which are the ones that list products"""
+    return [cat for cat in categories_list if cat['parent_name'] != '']
+
+
+def extract_vertical_list(prod_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Collect the products of every vertical-list widget in a category listing"""
+    product_list = []
+    for block in prod_data['data']['body']:
+        if block.get('widget_type') == 'vertical-list':
+            product_list.extend(block.get('list', []))
+    return product_list
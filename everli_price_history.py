@@ -0,0 +1,291 @@
+"""Local price history of every (store_link, product_id), kept as run-length segments.
+
+Each segment is a stretch of runs over which a product's price, full price
+and availability stayed the same: it records when the stretch started, the
+last run that saw it and how many observations it covers. The open
+segment's last_seen and count live on the product row, so a run that sees
+the same values writes one row per product and the store grows with
+changes rather than with runs. Lookups go through SQLite primary keys and
+indexes:
+
+- history(product_id): every segment, across stores or for one store
+- changes(store_id, since): products whose price changed in a store since a date
+- seen(product_id): first and last time each store listed the product
+
+Observations must arrive in time order per product; rows not newer than
+what the store already holds are ignored, so re-ingesting a file is a no-op.
+
+Stores are keyed by store_link because one store id can be listed under
+several locations with their own prices; products files written before
+store_link existed are keyed by their store id instead. Queries still
+select by store_id and return every location of it.
+"""
+import os
+import sqlite3
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+from everli_validation import to_number
+
+DEFAULT_PATH = 'everli_price_history.sqlite'
+VALUE_COLUMNS = ('price', 'full_price', 'available')
+MISSING = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    store_link TEXT NOT NULL,
+    store_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    price REAL,
+    full_price REAL,
+    available TEXT,
+    started TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    observations INTEGER NOT NULL,
+    PRIMARY KEY (store_link, product_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS segments_store_started ON segments (store_id, started);
+CREATE TABLE IF NOT EXISTS products (
+    store_link TEXT NOT NULL,
+    store_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    name TEXT,
+    current_seq INTEGER NOT NULL,
+    current_observations INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    PRIMARY KEY (store_link, product_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS products_product ON products (product_id);
+"""
+
+
+def _observations(products: pd.DataFrame) -> pd.DataFrame:
+    """The columns the history keeps, typed, without rows lacking ids or a timestamp"""
+    def column(name: str) -> pd.Series:
+        return products[name] if name in products.columns else pd.Series(pd.NA, index=products.index)
+
+    frame = pd.DataFrame({
+        'store_id': pd.to_numeric(column('store_id'), errors='coerce'),
+        'product_id': pd.to_numeric(column('id'), errors='coerce'),
+        'price': to_number(column('price')),
+        'full_price': to_number(column('full_price')),
+        'available': column('available').astype('string'),
+        'name': column('name').astype('string'),
+        'nw': column('nw').astype('string'),
+    }).dropna(subset=['store_id', 'product_id', 'nw'])
+    frame['store_id'] = frame['store_id'].astype('int64')
+    frame['product_id'] = frame['product_id'].astype('int64')
+    store_link = column('store_link').reindex(frame.index)
+    store_link = store_link.where(store_link.notna(), frame['store_id'].astype(str))
+    frame.insert(0, 'store_link', store_link.astype(str).astype(object))
+    return frame
+
+
+def _differs(a: pd.DataFrame, b: pd.DataFrame) -> pd.Series:
+    """Row-wise: do any of the value columns differ, treating missing values as equal"""
+    differs = pd.Series(False, index=a.index)
+    for column in VALUE_COLUMNS:
+        left = a[column].astype(object).where(a[column].notna(), MISSING)
+        right = b[column].astype(object).where(b[column].notna(), MISSING)
+        differs |= left.to_numpy() != right.to_numpy()
+    return differs
+
+
+class PriceHistory:
+    """SQLite-backed run-length price history"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self._migrate()
+        self.connection.executescript(SCHEMA)
+
+    def _migrate(self) -> None:
+        """Re-key a history created before store_link, keeping its rows under their store id"""
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(segments)")]
+        if not columns or 'store_link' in columns:
+            return
+        with self.connection:
+            for table in ('segments', 'products'):
+                self.connection.execute(f"ALTER TABLE {table} RENAME TO {table}_v0")
+            self.connection.execute("DROP INDEX IF EXISTS segments_store_started")
+            self.connection.execute("DROP INDEX IF EXISTS products_product")
+            self.connection.executescript(SCHEMA)
+            for table in ('segments', 'products'):
+                self.connection.execute(f"INSERT INTO {table} SELECT CAST(store_id AS TEXT), * FROM {table}_v0")
+                self.connection.execute(f"DROP TABLE {table}_v0")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> 'PriceHistory':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _current(self, store_links: Iterable[str]) -> pd.DataFrame:
+        """Open segment of every product already known in the given stores"""
+        frames = []
+        for store_link in store_links:
+            frames.append(pd.read_sql_query(
+                "SELECT p.store_link, p.product_id, p.current_seq, p.current_observations, p.first_seen, "
+                "p.last_seen, s.price, s.full_price, s.available "
+                "FROM products p JOIN segments s ON s.store_link = p.store_link AND s.product_id = p.product_id "
+                "AND s.seq = p.current_seq WHERE p.store_link = ?", self.connection, params=(str(store_link),)))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def ingest(self, products: pd.DataFrame) -> Dict[str, int]:
+        """Fold a products frame (one or many runs) into the history, returning counts"""
+        observations = _observations(products)
+        counts = {'rows': len(products), 'stale': 0, 'extended': 0, 'new_segments': 0, 'new_products': 0}
+        if observations.empty:
+            return counts
+        keys = ['store_link', 'product_id']
+        current = self._current(observations['store_link'].unique())
+        if current.empty:
+            current = pd.DataFrame(columns=keys + ['current_seq', 'current_observations', 'first_seen',
+                                                    'last_seen', *VALUE_COLUMNS])
+        current = current.astype({'store_link': object, 'product_id': 'int64', 'available': 'string'})
+        current['price'] = current['price'].astype(float)
+        current['full_price'] = current['full_price'].astype(float)
+
+        observations = observations.merge(current[keys + ['last_seen']], on=keys, how='left')
+        fresh = observations['last_seen'].isna() | (observations['nw'] > observations['last_seen'])
+        counts['stale'] = int((~fresh).sum())
+        observations = (observations[fresh].drop(columns='last_seen')
+                        .sort_values(keys + ['nw'], kind='stable').reset_index(drop=True))
+        if observations.empty:
+            return counts
+
+        # Run-length encode the batch: a new segment starts at each product's first row or on a value change
+        previous = observations.shift(1)
+        first_of_key = (observations['store_link'].ne(previous['store_link'])
+                        | observations['product_id'].ne(previous['product_id']))
+        starts = first_of_key | _differs(observations, previous)
+        observations['segment'] = starts.cumsum()
+        segments = observations.groupby('segment', sort=True).agg(
+            store_link=('store_link', 'first'), store_id=('store_id', 'first'),
+            product_id=('product_id', 'first'),
+            price=('price', 'first'), full_price=('full_price', 'first'), available=('available', 'first'),
+            name=('name', 'last'), started=('nw', 'first'), last_seen=('nw', 'last'),
+            observations=('nw', 'size'))
+        segments['rank'] = segments.groupby(keys).cumcount()
+        segments = segments.merge(current, on=keys, how='left', suffixes=('', '_current'))
+
+        known = segments['current_seq'].notna()
+        same_as_current = known & (segments['rank'] == 0) & ~_differs(
+            segments[list(VALUE_COLUMNS)],
+            segments[[f'{c}_current' for c in VALUE_COLUMNS]].set_axis(list(VALUE_COLUMNS), axis=1))
+        base_seq = segments['current_seq'].fillna(-1).astype('int64')
+        extensions_before = same_as_current.groupby([segments['store_link'], segments['product_id']]).transform('max')
+        segments['seq'] = base_seq + segments['rank'] + 1 - extensions_before.astype('int64')
+
+        inserted = segments[~same_as_current]
+        first = segments.groupby(keys, sort=False).head(1)
+        last = segments.groupby(keys, sort=False).tail(1)
+
+        # The previously open segment closes when a product gets a new segment; it spans any rows that extended it
+        closing = first[first['current_seq'].notna()]
+        closing = closing[closing.set_index(keys).index.isin(inserted.set_index(keys).index)]
+        closing_extended = same_as_current[closing.index]
+        closed_last_seen = closing['last_seen'].where(closing_extended, closing['last_seen_current'])
+        closed_observations = (closing['current_observations'].fillna(0)
+                               + closing['observations'].where(closing_extended, 0))
+
+        last_extended = same_as_current[last.index]
+        current_observations = last['observations'] + last['current_observations'].where(last_extended, 0).fillna(0)
+        first_seen = first.set_index(keys)['first_seen'].fillna(first.set_index(keys)['started'])
+        first_seen = first_seen.reindex(pd.MultiIndex.from_frame(last[keys])).to_numpy()
+
+        def values(series: pd.Series) -> list:
+            return series.astype(object).where(series.notna(), None).tolist()
+
+        def ints(series: pd.Series) -> list:
+            return series.astype('int64').tolist()
+
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE segments SET last_seen = ?, observations = ? "
+                "WHERE store_link = ? AND product_id = ? AND seq = ?",
+                zip(values(closed_last_seen), ints(closed_observations), values(closing['store_link']),
+                    ints(closing['product_id']), ints(closing['current_seq'])))
+            self.connection.executemany(
+                "INSERT INTO segments (store_link, store_id, product_id, seq, price, full_price, available, "
+                "started, last_seen, observations) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip(values(inserted['store_link']), ints(inserted['store_id']), ints(inserted['product_id']),
+                    ints(inserted['seq']), values(inserted['price']), values(inserted['full_price']),
+                    values(inserted['available']), values(inserted['started']), values(inserted['last_seen']),
+                    ints(inserted['observations'])))
+            self.connection.executemany(
+                "INSERT INTO products (store_link, store_id, product_id, name, current_seq, current_observations, "
+                "first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (store_link, product_id) DO UPDATE SET "
+                "name = COALESCE(excluded.name, name), current_seq = excluded.current_seq, "
+                "current_observations = excluded.current_observations, last_seen = excluded.last_seen",
+                zip(values(last['store_link']), ints(last['store_id']), ints(last['product_id']),
+                    values(last['name']), ints(last['seq']), ints(current_observations), first_seen.tolist(),
+                    values(last['last_seen'])))
+        counts['extended'] = int(same_as_current.sum())
+        counts['new_segments'] = len(inserted)
+        counts['new_products'] = int((~known & (segments['rank'] == 0)).sum())
+        return counts
+
+    def ingest_csv(self, csv_path: str) -> Dict[str, int]:
+        from everli_compaction import read_products_csv
+        return self.ingest(read_products_csv(csv_path))
+
+    def history(self, product_id: int, store_id: Optional[int] = None) -> pd.DataFrame:
+        """Segments of one product, oldest first, in one store or every store listing it"""
+        if store_id is not None:
+            where, params = "s.store_id = ? AND s.product_id = ?", (int(store_id), int(product_id))
+        else:
+            where = "s.store_link IN (SELECT store_link FROM products WHERE product_id = ?) AND s.product_id = ?"
+            params = (int(product_id), int(product_id))
+        # The open segment's last_seen and count are kept on the product row
+        return pd.read_sql_query(
+            "SELECT s.store_id, s.store_link, s.product_id, s.seq, s.price, s.full_price, s.available, s.started, "
+            "CASE WHEN s.seq = p.current_seq THEN p.last_seen ELSE s.last_seen END AS last_seen, "
+            "CASE WHEN s.seq = p.current_seq THEN p.current_observations ELSE s.observations END AS observations "
+            "FROM segments s JOIN products p ON p.store_link = s.store_link AND p.product_id = s.product_id "
+            f"WHERE {where} "
+            "ORDER BY s.store_id, s.store_link, s.seq", self.connection, params=params)
+
+    def changes(self, store_id: int, since: str, until: Optional[str] = None,
+                include_availability: bool = False) -> pd.DataFrame:
+        """Products of a store whose price (optionally availability) changed in [since, until)"""
+        conditions = ["cur.store_id = ?", "cur.started >= ?", "cur.seq > 0"]
+        params = [int(store_id), since]
+        if until:
+            conditions.append("cur.started < ?")
+            params.append(until)
+        changed = "(prev.price IS NOT cur.price OR prev.full_price IS NOT cur.full_price"
+        changed += " OR prev.available IS NOT cur.available)" if include_availability else ")"
+        conditions.append(changed)
+        return pd.read_sql_query(
+            "SELECT cur.store_id, cur.store_link, cur.product_id, p.name, prev.price AS old_price, "
+            "cur.price AS new_price, "
+            "prev.full_price AS old_full_price, cur.full_price AS new_full_price, "
+            "prev.available AS old_available, cur.available AS new_available, cur.started AS changed_at "
+            "FROM segments cur "
+            "JOIN segments prev ON prev.store_link = cur.store_link AND prev.product_id = cur.product_id "
+            "AND prev.seq = cur.seq - 1 "
+            "JOIN products p ON p.store_link = cur.store_link AND p.product_id = cur.product_id "
+            f"WHERE {' AND '.join(conditions)} ORDER BY cur.started, cur.product_id",
+            self.connection, params=params)
+
+    def seen(self, product_id: int, store_id: Optional[int] = None) -> pd.DataFrame:
+        """First and last time each store listed the product"""
+        where, params = "product_id = ?", [int(product_id)]
+        if store_id is not None:
+            where += " AND store_id = ?"
+            params.append(int(store_id))
+        return pd.read_sql_query(
+            f"SELECT store_id, store_link, product_id, name, first_seen, last_seen, current_seq + 1 AS segments "
+            f"FROM products WHERE {where} ORDER BY store_id, store_link", self.connection, params=params)
@@ -0,0 +1,220 @@
+"""Cross-store product matching and price comparison for one run's output.
+
+Products are matched across stores on their EAN when the output has one,
+and otherwise on a normalized name + brand + pack size key, where the name
+is lowercased, stripped of accents, punctuation and its own size text, and
+the size is converted to kg or litres. PriceIndex holds the run as a sparse
+product x store matrix in CSR form (numpy arrays, with scipy optional) of
+prices and prices per kg/litre, and computes per-product spreads and
+per-store price levels with segment reductions over the rows instead of
+joins.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from everli_validation import QUANTITY_PATTERN, UNIT_FACTORS, to_number
+
+EAN_COLUMNS = ('ean', 'barcode', 'gtin')
+UNIT_DIMENSIONS = {'kg': 'kg', 'g': 'kg', 'mg': 'kg', 'l': 'l', 'lt': 'l', 'cl': 'l', 'ml': 'l'}
+
+
+def _map_uniques(series: pd.Series, transform) -> pd.Series:
+    """Apply a vectorized string transform to each distinct value once"""
+    codes, uniques = pd.factorize(series.fillna('').astype(str))
+    transformed = transform(pd.Series(uniques, dtype=object)).to_numpy()
+    return pd.Series(transformed[codes], index=series.index)
+
+
+def normalize_text(series: pd.Series) -> pd.Series:
+    """Lowercase, strip accents, size text and punctuation, collapse whitespace"""
+    def transform(values: pd.Series) -> pd.Series:
+        return (values.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+                .str.lower()
+                .str.replace(QUANTITY_PATTERN, ' ', regex=True)
+                .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+                .str.strip())
+    return _map_uniques(series, transform)
+
+
+def size_key(series: pd.Series) -> pd.Series:
+    """Pack sizes as '<amount><kg|l>' in base units, so '500 g' and '0,5 kg' agree; '' when unparseable"""
+    def transform(values: pd.Series) -> pd.Series:
+        parts = values.str.lower().str.extract(QUANTITY_PATTERN)
+        amount = pd.to_numeric(parts['amount'].str.replace(',', '.', regex=False), errors='coerce')
+        count = pd.to_numeric(parts['count'], errors='coerce').fillna(1)
+        base = (amount * count * parts['unit'].map(UNIT_FACTORS)).round(6)
+        key = base.map('{:g}'.format, na_action='ignore') + parts['unit'].map(UNIT_DIMENSIONS)
+        return key.fillna('')
+    return _map_uniques(series, transform)
+
+
+def base_quantity(series: pd.Series) -> pd.Series:
+    """Pack size in kg or litres, NaN when unparseable"""
+    def transform(values: pd.Series) -> pd.Series:
+        parts = values.str.lower().str.extract(QUANTITY_PATTERN)
+        amount = pd.to_numeric(parts['amount'].str.replace(',', '.', regex=False), errors='coerce')
+        count = pd.to_numeric(parts['count'], errors='coerce').fillna(1)
+        return amount * count * parts['unit'].map(UNIT_FACTORS)
+    return _map_uniques(series, transform).astype(float)
+
+
+def normalize_ean(series: pd.Series) -> pd.Series:
+    """Digits-only EAN/UPC padded to 13 digits, '' when absent or malformed"""
+    def transform(values: pd.Series) -> pd.Series:
+        digits = values.str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True)
+        valid = digits.str.len().between(8, 14) & digits.str.strip('0').ne('')
+        return digits.str.zfill(13).str[-13:].where(valid, '')
+    return _map_uniques(series, transform)
+
+
+def match_keys(products: pd.DataFrame, name_column: str = 'name', brand_column: str = 'brand',
+               quantity_column: str = 'quantity') -> pd.Series:
+    """'ean:<13 digits>' when an EAN is present, else 'nbs:<name>|<brand>|<size>'"""
+    def column(name: str) -> pd.Series:
+        return products[name] if name in products.columns else pd.Series('', index=products.index)
+
+    fallback = ('nbs:' + normalize_text(column(name_column)) + '|' + normalize_text(column(brand_column))
+                + '|' + size_key(column(quantity_column)))
+    ean_column = next((name for name in EAN_COLUMNS if name in products.columns), None)
+    if ean_column is None:
+        return fallback
+    ean = normalize_ean(products[ean_column])
+    return ('ean:' + ean).where(ean.ne(''), fallback)
+
+
+class PriceIndex:
+    """Sparse product x store matrix of prices and prices per kg/litre for one run"""
+
+    def __init__(self, keys: np.ndarray, stores: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 price: np.ndarray, unit_price: np.ndarray, labels: Optional[pd.DataFrame] = None):
+        self.keys = keys
+        self.stores = stores
+        self.indptr = indptr
+        self.indices = indices
+        self.price = price
+        self.unit_price = unit_price
+        self.labels = labels
+        self.key_positions = {key: position for position, key in enumerate(keys)}
+
+    @property
+    def shape(self):
+        return len(self.keys), len(self.stores)
+
+    @property
+    def store_counts(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    @classmethod
+    def build(cls, products: pd.DataFrame, price_column: str = 'price', store_column: Optional[str] = None,
+              quantity_column: str = 'quantity') -> 'PriceIndex':
+        """Match products and keep the lowest price per (product key, store).
+
+        Stores are told apart by store_link when the output has it, since one
+        store id can be listed under several locations, else by store_id.
+        """
+        if store_column is None:
+            store_column = 'store_link' if 'store_link' in products.columns else 'store_id'
+        key = match_keys(products, quantity_column=quantity_column)
+        price = to_number(products[price_column])
+        if quantity_column in products.columns:
+            unit_price = price / base_quantity(products[quantity_column])
+        else:
+            unit_price = pd.Series(np.nan, index=products.index)
+        frame = pd.DataFrame({
+            'key': key, 'store': products[store_column].astype(str), 'price': price,
+            'unit_price': unit_price.replace([np.inf, -np.inf], np.nan),
+            'name': products['name'] if 'name' in products.columns else '',
+            'brand': products['brand'] if 'brand' in products.columns else '',
+            'quantity': products[quantity_column] if quantity_column in products.columns else '',
+        })
+        frame = frame[frame['price'].gt(0)]
+        key_codes, keys = pd.factorize(frame['key'], sort=True)
+        store_codes, stores = pd.factorize(frame['store'], sort=True)
+        frame = frame.assign(key_code=key_codes, store_code=store_codes)
+        labels = frame.drop_duplicates('key_code').set_index('key_code').sort_index()[['name', 'brand', 'quantity']]
+        cells = (frame.sort_values('price', kind='stable')
+                 .drop_duplicates(['key_code', 'store_code'])
+                 .sort_values(['key_code', 'store_code']))
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells['key_code'].to_numpy(), minlength=len(keys)), out=indptr[1:])
+        return cls(np.asarray(keys, dtype=str), np.asarray(stores, dtype=str), indptr,
+                   cells['store_code'].to_numpy(dtype=np.int32), cells['price'].to_numpy(dtype=float),
+                   cells['unit_price'].to_numpy(dtype=float), labels.reset_index(drop=True))
+
+    def _values(self, value: str) -> np.ndarray:
+        return self.unit_price if value == 'unit_price' else self.price
+
+    def row(self, key: str, value: str = 'price') -> pd.Series:
+        """Prices of one product across the stores that sell it"""
+        position = self.key_positions[key]
+        start, end = self.indptr[position], self.indptr[position + 1]
+        return pd.Series(self._values(value)[start:end], index=self.stores[self.indices[start:end]], name=key)
+
+    def comparison(self, min_stores: int = 2, value: str = 'unit_price') -> pd.DataFrame:
+        """Per product: stores selling it, min/max/median price, spread and cheapest store"""
+        values = self._values(value)
+        counts = self.store_counts
+        rows = np.flatnonzero(counts >= min_stores)
+        if not len(rows):
+            return pd.DataFrame(columns=['key', 'name', 'brand', 'quantity', 'stores', 'min', 'max',
+                                         'median', 'spread_pct', 'cheapest_store'])
+        row_of_cell = np.repeat(np.arange(len(counts)), counts)
+        keep = np.isin(row_of_cell, rows) & ~np.isnan(values)
+        cells = pd.DataFrame({'row': row_of_cell[keep], 'value': values[keep], 'store': self.indices[keep]})
+        grouped = cells.groupby('row', sort=True)['value']
+        summary = pd.DataFrame({
+            'stores': grouped.size(),
+            'min': grouped.min(),
+            'max': grouped.max(),
+            'median': grouped.median(),
+        })
+        cheapest = cells.loc[grouped.idxmin(), ['row', 'store']].set_index('row')['store']
+        summary['cheapest_store'] = self.stores[cheapest.reindex(summary.index).to_numpy()]
+        summary = summary[summary['stores'] >= min_stores]
+        summary['spread_pct'] = (100 * (summary['max'] - summary['min']) / summary['min']).round(2)
+        summary.insert(0, 'key', self.keys[summary.index])
+        labels = self.labels.iloc[summary.index].set_axis(summary.index)
+        summary = pd.concat([summary.iloc[:, :1], labels, summary.iloc[:, 1:]], axis=1)
+        return summary.sort_values('spread_pct', ascending=False, kind='stable').reset_index(drop=True)
+
+    def store_levels(self, min_stores: int = 2, value: str = 'unit_price') -> pd.DataFrame:
+        """Per store: median and mean of its price over the cheapest price for products sold in min_stores+ stores"""
+        values = self._values(value)
+        counts = self.store_counts
+        row_of_cell = np.repeat(np.arange(len(counts)), counts)
+        filled = np.where(np.isnan(values), np.inf, values)
+        row_min = np.minimum.reduceat(filled, self.indptr[:-1][counts > 0]) if len(filled) else np.array([])
+        cell_min = np.repeat(row_min, counts[counts > 0])
+        keep = (counts[row_of_cell] >= min_stores) & np.isfinite(cell_min) & ~np.isnan(values)
+        ratio = pd.DataFrame({'store': self.stores[self.indices[keep]], 'ratio': values[keep] / cell_min[keep]})
+        levels = ratio.groupby('store')['ratio'].agg(products='size', median_ratio='median', mean_ratio='mean')
+        return levels.sort_values('median_ratio').reset_index()
+
+    def to_scipy(self, value: str = 'price'):
+        """The matrix as scipy.sparse.csr_matrix (requires scipy)"""
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self._values(value), self.indices, self.indptr), shape=self.shape)
+
+    def save(self, path: str) -> str:
+        np.savez_compressed(path, keys=self.keys, stores=self.stores, indptr=self.indptr, indices=self.indices,
+                            price=self.price, unit_price=self.unit_price,
+                            names=self.labels['name'].astype(str).to_numpy(dtype=str),
+                            brands=self.labels['brand'].astype(str).to_numpy(dtype=str),
+                            quantities=self.labels['quantity'].astype(str).to_numpy(dtype=str))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> 'PriceIndex':
+        with np.load(path) as data:
+            labels = pd.DataFrame({'name': data['names'], 'brand': data['brands'], 'quantity': data['quantities']})
+            return cls(data['keys'], data['stores'], data['indptr'], data['indices'], data['price'],
+                       data['unit_price'], labels)
+
+
+def build_index(csv_paths: Sequence[str]) -> PriceIndex:
+    """Build the price index from one or more products CSVs or Arrow outputs of the same run"""
+    from everli_compaction import read_products
+    frames = [read_products(path) for path in csv_paths]
+    return PriceIndex.build(pd.concat(frames, ignore_index=True))
@@ -0,0 +1,124 @@
+"""Per-store profiling of selected scrape stages.
+
+StageProfiler runs cProfile only while one of the chosen stages (fetch,
+parse, normalize, validate, write, log) is executing, with one profile per
+store and stage, and optionally takes tracemalloc snapshots at the start
+and end of each store. For every store it writes .prof dumps (loadable with
+pstats or snakeviz) and a top-N hotspot summary to
+Everli_logs/profiles/<job_id>/, and at the end of the run a summary
+aggregated over all stores.
+"""
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, List, Optional
+
+PROFILE_STAGES = ('fetch', 'parse', 'normalize', 'validate', 'write', 'log')
+
+
+class StageProfiler:
+    """Profiles chosen stages per store; a profiler with no stages is a no-op"""
+
+    def __init__(self, log_dir: str, job_id: str, stages: Iterable[str] = (), top_n: int = 25,
+                 memory: bool = True):
+        self.stages = set(stages)
+        unknown = self.stages - set(PROFILE_STAGES)
+        if unknown:
+            raise ValueError(f"Unknown profile stages: {sorted(unknown)}. Choose from {PROFILE_STAGES}")
+        self.enabled = bool(self.stages)
+        self.top_n = top_n
+        self.memory = memory and self.enabled
+        self.output_dir = os.path.join(log_dir, 'profiles', str(job_id))
+        self.store_label = None
+        self.store_profiles: Dict[str, cProfile.Profile] = {}
+        self.run_stats: Dict[str, pstats.Stats] = {}
+        self.active_stage = None
+        self.memory_start = None
+        if self.enabled:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    def stage(self, name: str):
+        """Context manager profiling the block if name is a chosen stage and no stage is active"""
+        if not self.enabled or name not in self.stages or self.active_stage is not None or self.store_label is None:
+            return nullcontext()
+        return self._profile(name)
+
+    @contextmanager
+    def _profile(self, name: str) -> Iterator[None]:
+        profile = self.store_profiles.get(name)
+        if profile is None:
+            profile = self.store_profiles[name] = cProfile.Profile()
+        self.active_stage = name
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.active_stage = None
+
+    def begin_store(self, store_index: int, store_id) -> None:
+        if not self.enabled:
+            return
+        self.store_label = f"store_{store_index}_{store_id}"
+        self.store_profiles = {}
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.memory_start = tracemalloc.take_snapshot()
+
+    def _top_functions(self, stats: pstats.Stats) -> str:
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+        return stream.getvalue()
+
+    def end_store(self) -> Optional[str]:
+        """Dump this store's profiles and hotspot summary, returning the summary path"""
+        if not self.enabled or self.store_label is None:
+            return None
+        sections: List[str] = [f"Hotspots for {self.store_label}"]
+        for name, profile in sorted(self.store_profiles.items()):
+            dump_path = os.path.join(self.output_dir, f"{self.store_label}_{name}.prof")
+            profile.dump_stats(dump_path)
+            stats = pstats.Stats(profile)
+            if name in self.run_stats:
+                self.run_stats[name].add(profile)
+            else:
+                self.run_stats[name] = pstats.Stats(profile)
+            sections.append(f"\n=== stage {name} ({stats.total_tt:.3f}s profiled) ===")
+            sections.append(self._top_functions(stats))
+        if self.memory and self.memory_start is not None:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            sections.append(f"\n=== memory (current {current / 1024 / 1024:.1f} MB, "
+                            f"peak {peak / 1024 / 1024:.1f} MB since tracing started) ===")
+            for stat in snapshot.compare_to(self.memory_start, 'lineno')[:self.top_n]:
+                sections.append(str(stat))
+            tracemalloc.reset_peak()
+        summary_path = os.path.join(self.output_dir, f"{self.store_label}_hotspots.txt")
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(sections) + '\n')
+        self.store_label = None
+        self.store_profiles = {}
+        self.memory_start = None
+        return summary_path
+
+    def finish(self) -> Optional[str]:
+        """Write the run-wide hotspot summary and stop memory tracing"""
+        if not self.enabled:
+            return None
+        self.end_store()
+        sections = ["Run-wide hotspots by stage"]
+        for name, stats in sorted(self.run_stats.items()):
+            stats.dump_stats(os.path.join(self.output_dir, f"run_{name}.prof"))
+            sections.append(f"\n=== stage {name} ({stats.total_tt:.3f}s profiled) ===")
+            sections.append(self._top_functions(stats))
+        summary_path = os.path.join(self.output_dir, 'run_hotspots.txt')
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(sections) + '\n')
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return summary_path
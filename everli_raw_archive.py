@@ -0,0 +1,213 @@
+"""Compressed archive of raw API responses, for re-parsing without re-fetching.
+
+Each run writes one file per store under Everli_raw/<run_id>/, the run_id
+of the output directory's run registry, so a run resumed in a new process
+keeps appending to the same files. A file is a sequence of length-prefixed
+records:
+
+    4-byte big-endian meta length | meta JSON | 4-byte body length | body
+
+The body is the response exactly as received, compressed on its own with
+zstd when the zstandard package is installed and gzip otherwise, so any
+record can be read without decompressing the rest. The meta JSON names the
+record kind (store, tree, category), the codec, and the category and
+timestamp the scraper used. A sidecar <file>.idx.json holds the offset and
+length of every record. Reopening a file after a crash drops a record cut
+off mid-write and re-indexes the rest. reparse_run rebuilds
+Data_Products_Eveli output from these files at local-disk speed, keeping
+the latest response per category URL when a resumed run fetched one again.
+"""
+import gzip
+import json
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW_ARCHIVE_DIR = 'Everli_raw'
+LENGTH = struct.Struct('>I')
+
+
+def default_codec() -> str:
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def compress(body: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=6).compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+
+def decompress(body: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Archive was written with zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(body)
+    return gzip.decompress(body)
+
+
+class RawArchiveWriter:
+    """Appends raw responses for one store to a length-prefixed archive file"""
+
+    def __init__(self, path: str, store: Dict[str, Any], source_file_ID=None, codec: Optional[str] = None):
+        self.path = path
+        self.codec = codec or default_codec()
+        self.index: List[Dict[str, Any]] = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            # Resumed store: keep the complete records an earlier attempt wrote
+            end = self._reindex()
+            self.file = open(path, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, 'wb')
+        if not self.index:
+            self.add('store', b'', store=store, source_file_ID=source_file_ID)
+
+    def _reindex(self) -> int:
+        """Index the file's complete records, returning the offset where they end"""
+        reader = RawArchiveReader(self.path)
+        with open(self.path, 'rb') as f:
+            while True:
+                offset = f.tell()
+                record = reader._read_raw(f)
+                if record is None:
+                    return offset
+                meta, compressed = record
+                raw_bytes = len(decompress(compressed, meta['codec'])) if compressed else 0
+                self.index.append({'offset': offset, 'length': f.tell() - offset, 'kind': meta['kind'],
+                                   'raw_bytes': raw_bytes, 'compressed_bytes': len(compressed)})
+
+    def add(self, kind: str, body: bytes, **meta) -> None:
+        offset = self.file.tell()
+        meta_bytes = json.dumps({'kind': kind, 'codec': self.codec, **meta}, default=str).encode('utf-8')
+        compressed = compress(body, self.codec) if body else b''
+        self.file.write(LENGTH.pack(len(meta_bytes)))
+        self.file.write(meta_bytes)
+        self.file.write(LENGTH.pack(len(compressed)))
+        self.file.write(compressed)
+        self.index.append({'offset': offset, 'length': self.file.tell() - offset, 'kind': kind,
+                           'raw_bytes': len(body), 'compressed_bytes': len(compressed)})
+
+    def close(self) -> None:
+        self.file.close()
+        with open(self.path + '.idx.json', 'w', encoding='utf-8') as f:
+            json.dump({'codec': self.codec, 'records': self.index}, f)
+
+
+class RawArchiveReader:
+    """Reads records back, sequentially or by index offset"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read_raw(self, f) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        header = f.read(LENGTH.size)
+        if len(header) < LENGTH.size:
+            return None
+        meta_bytes = f.read(LENGTH.unpack(header)[0])
+        body_header = f.read(LENGTH.size)
+        if len(body_header) < LENGTH.size:
+            return None  # truncated by a crash mid-write
+        try:
+            meta = json.loads(meta_bytes)
+        except ValueError:
+            return None
+        body_length = LENGTH.unpack(body_header)[0]
+        body = f.read(body_length)
+        if len(body) < body_length:
+            return None
+        return meta, body
+
+    def _read_record(self, f) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        record = self._read_raw(f)
+        if record is None:
+            return None
+        meta, body = record
+        return meta, decompress(body, meta['codec']) if body else b''
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+        with open(self.path, 'rb') as f:
+            while True:
+                record = self._read_record(f)
+                if record is None:
+                    return
+                yield record
+
+    def index(self) -> List[Dict[str, Any]]:
+        with open(self.path + '.idx.json', 'r', encoding='utf-8') as f:
+            return json.load(f)['records']
+
+    def read_at(self, offset: int) -> Tuple[Dict[str, Any], bytes]:
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            record = self._read_record(f)
+        if record is None:
+            raise ValueError(f"No complete record at offset {offset} in {self.path}")
+        return record
+
+
+def store_archive_path(run_dir: str, store_index: int, store_id) -> str:
+    return os.path.join(run_dir, f"store_{store_index}_{store_id}.raw")
+
+
+def list_store_archives(run_dir: str) -> List[str]:
+    def store_index(name: str) -> int:
+        return int(name.split('_')[1])
+
+    names = [name for name in os.listdir(run_dir) if name.startswith('store_') and name.endswith('.raw')]
+    return [os.path.join(run_dir, name) for name in sorted(names, key=store_index)]
+
+
+def reparse_store(path: str):
+    """Rebuild one store's product batch from its archive, returning (store, batch or None)"""
+    import pandas as pd
+    from everli_parsing import extract_vertical_list
+    from everli_normalize import normalize_products, add_store_columns
+
+    store, source_file_ID, categories = None, None, {}
+    for meta, body in RawArchiveReader(path):
+        if meta['kind'] == 'store':
+            store = meta['store']
+            source_file_ID = meta.get('source_file_ID')
+        elif meta['kind'] == 'category':
+            # A category fetched again after a resume replaces the earlier response, in its original position
+            key = meta.get('url') or len(categories)
+            categories[key] = (meta, body)
+    frames = []
+    for meta, body in categories.values():
+        product_list = extract_vertical_list(json.loads(body))
+        frame = normalize_products(product_list, meta['cat'], meta['sub_cat'], meta['nw'])
+        if not frame.empty:
+            frames.append(frame)
+    if not frames:
+        return store, None
+    return store, add_store_columns(pd.concat(frames, ignore_index=True), store, source_file_ID)
+
+
+def reparse_run(run_dir: str, output_dir: str) -> Dict[str, int]:
+    """Rebuild Data_Products_Eveli.csv (and its quarantine file) for a whole run from the archive"""
+    from everli_normalize import append_products_csv
+    from everli_validation import ProductValidator, write_quarantine
+
+    os.makedirs(output_dir, exist_ok=True)
+    master_csv_path = os.path.join(output_dir, "Data_Products_Eveli.csv")
+    quarantine_csv_path = os.path.join(output_dir, "Data_Products_Eveli_quarantine.csv")
+    validator = ProductValidator()
+    totals = {'stores': 0, 'products': 0, 'quarantined': 0}
+    for path in list_store_archives(run_dir):
+        store, batch = reparse_store(path)
+        if batch is None:
+            continue
+        batch, quarantined, _ = validator.validate(batch)
+        write_quarantine(quarantined, quarantine_csv_path)
+        append_products_csv(batch, master_csv_path)
+        totals['stores'] += 1
+        totals['products'] += len(batch)
+        totals['quarantined'] += len(quarantined)
+    return totals
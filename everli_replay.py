@@ -0,0 +1,153 @@
+"""Record/replay harness for offline end-to-end runs.
+
+RecordingSession wraps the live requests session and stores every API
+response it sees in a zip fixture archive. ReplaySession serves those
+fixtures back through the same get() interface, so main_execution can run
+a whole store offline at full speed, without a browser login, Snowflake or
+the network. Repeated requests for the same URL are replayed in recorded
+order (a 429 followed by a 200 replays as a 429 followed by a 200).
+Both sessions expose last_recorded_at, the timestamp stored with the last
+response, and the run stamps nw from it, so a recorded run and its replay
+write the same output.
+"""
+import hashlib
+import json
+import os
+import zipfile
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+RUN_METADATA_ENTRY = 'run.json'
+
+
+class FixtureMissing(LookupError):
+    """The replay archive has no response recorded for a request"""
+
+
+def fixture_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    if not params:
+        return url
+    return f"{url}?{urlencode(sorted((str(k), str(v)) for k, v in params.items()))}"
+
+
+def _entry_name(key: str, sequence: int) -> str:
+    return f"responses/{hashlib.sha1(key.encode('utf-8')).hexdigest()}.{sequence}"
+
+
+class FixtureArchive:
+    """Zip archive of recorded responses: one .json metadata and one .body entry per response"""
+
+    def __init__(self, path: str, mode: str = 'r'):
+        self.path = path
+        self.mode = mode
+        if mode == 'w':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.zip = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self.responses: Dict[str, List[str]] = {}
+        if mode == 'r':
+            self._load_index()
+
+    def _load_index(self) -> None:
+        found = []
+        for name in self.zip.namelist():
+            if name.startswith('responses/') and name.endswith('.json'):
+                entry = name[:-len('.json')]
+                meta = json.loads(self.zip.read(name))
+                found.append((meta['key'], int(entry.rsplit('.', 1)[1]), entry))
+        for key, _, entry in sorted(found):
+            self.responses.setdefault(key, []).append(entry)
+
+    def add(self, key: str, status_code: int, headers: Dict[str, str], body: bytes, recorded_at: str) -> None:
+        sequence = len(self.responses.setdefault(key, []))
+        entry = _entry_name(key, sequence)
+        meta = {'key': key, 'status_code': status_code, 'headers': headers, 'recorded_at': recorded_at}
+        self.zip.writestr(entry + '.json', json.dumps(meta))
+        self.zip.writestr(entry + '.body', body)
+        self.responses[key].append(entry)
+
+    def get(self, key: str, sequence: int) -> Dict[str, Any]:
+        entries = self.responses.get(key)
+        if not entries:
+            raise FixtureMissing(f"No recorded response for {key}")
+        entry = entries[min(sequence, len(entries) - 1)]
+        meta = json.loads(self.zip.read(entry + '.json'))
+        meta['body'] = self.zip.read(entry + '.body')
+        return meta
+
+    def write_run_metadata(self, metadata: Dict[str, Any]) -> None:
+        self.zip.writestr(RUN_METADATA_ENTRY, json.dumps(metadata, default=str))
+
+    def read_run_metadata(self) -> Dict[str, Any]:
+        if RUN_METADATA_ENTRY not in self.zip.namelist():
+            return {}
+        return json.loads(self.zip.read(RUN_METADATA_ENTRY))
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+class RecordingSession:
+    """Pass-through session that records every response into a FixtureArchive"""
+
+    KEPT_HEADERS = ('Content-Type', 'Retry-After')
+
+    def __init__(self, session, archive: FixtureArchive, clock):
+        self.session = session
+        self.archive = archive
+        self.clock = clock
+        self.last_recorded_at = None
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs):
+        response = self.session.get(url, params=params, **kwargs)
+        headers = {name: response.headers[name] for name in self.KEPT_HEADERS if name in response.headers}
+        self.last_recorded_at = self.clock()
+        self.archive.add(fixture_key(url, params), response.status_code, headers, response.content,
+                         self.last_recorded_at)
+        return response
+
+
+class ReplaySession:
+    """Serves recorded responses as requests.Response objects"""
+
+    def __init__(self, archive: FixtureArchive):
+        self.archive = archive
+        self.served: Dict[str, int] = {}
+        self.last_recorded_at = None
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs):
+        import requests
+        key = fixture_key(url, params)
+        sequence = self.served.get(key, 0)
+        recorded = self.archive.get(key, sequence)
+        self.served[key] = sequence + 1
+        self.last_recorded_at = recorded['recorded_at']
+
+        response = requests.Response()
+        response.status_code = recorded['status_code']
+        response._content = recorded['body']
+        response.headers.update(recorded['headers'])
+        response.url = key
+        response.encoding = 'utf-8'
+        return response
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compare_outputs(dir_a: str, dir_b: str, pattern_suffix: str = '.csv') -> List[str]:
+    """Byte-for-byte comparison of the output files of two replayed runs"""
+    names = sorted({name for directory in (dir_a, dir_b) if os.path.isdir(directory)
+                    for name in os.listdir(directory) if name.endswith(pattern_suffix)})
+    differences = []
+    for name in names:
+        path_a, path_b = os.path.join(dir_a, name), os.path.join(dir_b, name)
+        if not os.path.exists(path_a) or not os.path.exists(path_b):
+            differences.append(f"{name}: only in {dir_a if os.path.exists(path_a) else dir_b}")
+        elif file_digest(path_a) != file_digest(path_b):
+            differences.append(f"{name}: contents differ")
+    return differences
@@ -0,0 +1,241 @@
+"""Retry policy shared by every Everli API call in the scrape loop.
+
+Failures are classified before anything is retried:
+
+- transient: connection errors, timeouts and 5xx responses, retried with
+  exponential backoff
+- throttled: 429 responses, retried with a longer backoff (or Retry-After)
+  and only escalated to re-authentication after repeated throttling
+- auth: 401/403 responses, which refresh the session once and retry
+- permanent: other 4xx responses and payload parsing errors, never retried
+
+A circuit breaker per host stops hammering an API that keeps failing, and a
+run-wide retry budget caps the total number of retries, the time spent
+sleeping and the number of re-authentications so one bad category cannot
+burn minutes of sleeps and browser launches.
+"""
+import random
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+TRANSIENT = 'transient'
+THROTTLED = 'throttled'
+AUTH = 'auth'
+PERMANENT = 'permanent'
+
+
+class RetryError(Exception):
+    """Raised when an operation is given up on"""
+
+    def __init__(self, message: str, error_class: str, last_error: Optional[BaseException] = None):
+        super().__init__(message)
+        self.error_class = error_class
+        self.last_error = last_error
+
+
+class RetryExhausted(RetryError):
+    """The operation kept failing until its attempts or the run budget ran out"""
+
+
+class CircuitOpenError(RetryError):
+    """The host's circuit breaker is open and waiting for it is not affordable"""
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc or url
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def classify_status(status_code: int) -> str:
+    if status_code == 429:
+        return THROTTLED
+    if status_code in (401, 403):
+        return AUTH
+    if status_code in (408, 425) or status_code >= 500:
+        return TRANSIENT
+    return PERMANENT
+
+
+def classify_error(error: BaseException) -> str:
+    """Map an exception raised by a request or its parsing to an error class"""
+    status_code = status_code_of(error)
+    if status_code is not None:
+        return classify_status(status_code)
+    try:
+        import requests
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return TRANSIENT
+        if isinstance(error, requests.exceptions.JSONDecodeError):
+            return PERMANENT
+    except ImportError:
+        pass
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    if isinstance(error, (ValueError, LookupError, TypeError)):
+        return PERMANENT
+    return TRANSIENT
+
+
+class CircuitBreaker:
+    """Opens after consecutive transient/throttled failures, half-opens after a cooldown"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def seconds_until_closed(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown_seconds - time.monotonic())
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Count a failure and return True if this opened the circuit"""
+        self.consecutive_failures += 1
+        if self.opened_at is None and self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            return True
+        if self.opened_at is not None:
+            # A failed half-open probe keeps the circuit open for another cooldown.
+            self.opened_at = time.monotonic()
+        return False
+
+
+class RetryBudget:
+    """Run-wide caps on retries, backoff sleep and re-authentications"""
+
+    def __init__(self, max_retries: int = 200, max_sleep_seconds: float = 1800.0, max_reauth: int = 5):
+        self.max_retries = max_retries
+        self.max_sleep_seconds = max_sleep_seconds
+        self.max_reauth = max_reauth
+        self.retries = 0
+        self.sleep_seconds = 0.0
+        self.reauth = 0
+
+    def can_retry(self, delay: float) -> bool:
+        return (self.retries < self.max_retries
+                and self.sleep_seconds + delay <= self.max_sleep_seconds)
+
+    def can_reauth(self) -> bool:
+        return self.reauth < self.max_reauth
+
+    def spend(self, delay: float) -> None:
+        self.retries += 1
+        self.sleep_seconds += delay
+
+    def exhausted(self) -> bool:
+        return (self.retries >= self.max_retries or self.sleep_seconds >= self.max_sleep_seconds
+                or self.reauth >= self.max_reauth)
+
+
+class RetryPolicy:
+    """Runs operations with classification, backoff, circuit breaking and a shared budget"""
+
+    def __init__(self, logger, budget: Optional[RetryBudget] = None, max_attempts: int = 4,
+                 transient_base_delay: float = 2.0, throttle_base_delay: float = 5.0,
+                 max_delay: float = 60.0, reauth_after_throttles: int = 2,
+                 failure_threshold: int = 5, cooldown_seconds: float = 60.0,
+                 sleep: Callable[[float], None] = time.sleep, metrics=None):
+        self.logger = logger
+        self.metrics = metrics
+        self.budget = budget or RetryBudget()
+        self.max_attempts = max_attempts
+        self.base_delays = {TRANSIENT: transient_base_delay, THROTTLED: throttle_base_delay, AUTH: 0.0}
+        self.max_delay = max_delay
+        self.reauth_after_throttles = reauth_after_throttles
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.sleep = sleep
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.failure_counts = {TRANSIENT: 0, THROTTLED: 0, AUTH: 0, PERMANENT: 0}
+
+    def breaker_for(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.cooldown_seconds)
+        return self.breakers[host]
+
+    def backoff_delay(self, error_class: str, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Exponential backoff with jitter, honouring Retry-After on 429 responses"""
+        if error_class == THROTTLED and error is not None:
+            retry_after = getattr(getattr(error, 'response', None), 'headers', {}).get('Retry-After')
+            if retry_after and str(retry_after).isdigit():
+                return min(float(retry_after), self.max_delay)
+        base = self.base_delays.get(error_class, 0.0)
+        delay = min(base * (2 ** attempt), self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _wait_for_circuit(self, host: str) -> None:
+        wait = self.breaker_for(host).seconds_until_closed()
+        if wait <= 0:
+            return
+        if not self.budget.can_retry(wait):
+            raise CircuitOpenError(f"Circuit open for {host} and retry budget cannot cover {wait:.0f}s wait", TRANSIENT)
+        self.logger.log_warning(f"Circuit open for {host}, waiting {wait:.0f}s before probing")
+        self.budget.spend(wait)
+        self.sleep(wait)
+
+    def execute(self, operation: Callable[[], object], url: str,
+                on_auth: Optional[Callable[[], bool]] = None, description: str = ''):
+        """Run operation until it succeeds, is classified permanent, or runs out of attempts or budget"""
+        host = host_of(url)
+        breaker = self.breaker_for(host)
+        description = description or url
+        consecutive_throttles = 0
+        for attempt in range(self.max_attempts):
+            self._wait_for_circuit(host)
+            try:
+                result = operation()
+                breaker.record_success()
+                return result
+            except Exception as e:
+                error_class = classify_error(e)
+                self.failure_counts[error_class] += 1
+                if self.metrics is not None:
+                    self.metrics.inc('request_failures_total', error_class=error_class)
+                if error_class == PERMANENT:
+                    raise RetryExhausted(f"Permanent error for {description}: {e}", error_class, e) from e
+                if error_class in (TRANSIENT, THROTTLED) and breaker.record_failure():
+                    self.logger.log_warning(f"Circuit opened for {host} after {breaker.consecutive_failures} consecutive failures")
+                if attempt == self.max_attempts - 1:
+                    raise RetryExhausted(f"Giving up on {description} after {attempt + 1} attempts: {e}", error_class, e) from e
+
+                consecutive_throttles = consecutive_throttles + 1 if error_class == THROTTLED else 0
+                needs_reauth = error_class == AUTH or (
+                    error_class == THROTTLED and consecutive_throttles >= self.reauth_after_throttles)
+                if needs_reauth and on_auth is not None:
+                    if not self.budget.can_reauth():
+                        raise RetryExhausted(f"Re-authentication budget exhausted at {description}: {e}", error_class, e) from e
+                    self.budget.reauth += 1
+                    if self.metrics is not None:
+                        self.metrics.inc('reauthentications_total')
+                    self.logger.log_warning(f"{error_class} error at {description}, refreshing authentication")
+                    if not on_auth():
+                        raise RetryExhausted(f"Failed to refresh authentication at {description}", AUTH, e) from e
+                    consecutive_throttles = 0
+
+                delay = self.backoff_delay(error_class, attempt, e)
+                if not self.budget.can_retry(delay):
+                    raise RetryExhausted(f"Retry budget exhausted at {description}: {e}", error_class, e) from e
+                self.budget.spend(delay)
+                if self.metrics is not None:
+                    self.metrics.inc('retries_total', error_class=error_class)
+                    self.metrics.inc('retry_sleep_seconds_total', delay)
+                self.logger.log_warning(f"{error_class} error at {description} (attempt {attempt + 1}/{self.max_attempts}): {e}. Retrying in {delay:.1f}s")
+                if delay:
+                    self.sleep(delay)
+        raise RetryExhausted(f"Giving up on {description}", TRANSIENT)
+
+    def summary(self) -> str:
+        return (f"Retries: {self.budget.retries}/{self.budget.max_retries}, "
+                f"backoff sleep: {self.budget.sleep_seconds:.0f}s, re-authentications: {self.budget.reauth}, "
+                f"failures by class: {self.failure_counts}")
@@ -0,0 +1,242 @@
+"""Run registry tying an output directory's checkpoint to one source file.
+
+Everli_run.json in the output directory records the run the checkpoint
+belongs to: its source_file_id, source and country ids, status and the
+stores already appended to the products CSV. main_execution asks the
+registry for the source file instead of always inserting a new SOURCE_FILE
+row: a run still marked running is resumed under its original
+source_file_id, and stores it already wrote are skipped rather than
+scraped and appended twice. A store cut short by the circuit breaker or
+the retry budget is recorded as partial instead, with the category to
+continue from and the part files its fetched categories were spilled to;
+the run then stays running, and resuming it finishes those stores before
+they are written. A new source file is created only for a fresh output
+directory or after the previous run completed, in which case that run's
+checkpoint is ignored. Live runs mirror the record into the SCRAPE_RUN
+Snowflake table.
+
+StoreLoader makes the Snowflake upload idempotent per (source_file_id,
+store_link), since one store id can be listed under several locations:
+each store's rows are written once per table and recorded in
+SCRAPE_RUN_LOAD, stores already recorded are skipped, and a store whose
+upload was interrupted is deleted before it is written again. Products
+files without a store_link column are keyed by store_id.
+"""
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+RUN_FILE = 'Everli_run.json'
+RUNS_TABLE = 'SCRAPE_RUN'
+LOADS_TABLE = 'SCRAPE_RUN_LOAD'
+
+
+def _plain(value):
+    """numpy scalars as plain Python values for JSON and SQL parameters"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+class RunRegistry:
+    """Local record of the run an output directory belongs to"""
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, RUN_FILE)
+        self.run: Optional[Dict[str, Any]] = None
+        self.previous_status = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.run = json.load(f)
+            self.previous_status = self.run.get('status')
+
+    def _save(self) -> None:
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.run, f, indent=1)
+        os.replace(self.path + '.tmp', self.path)
+
+    @property
+    def resumable(self) -> bool:
+        return self.previous_status == 'running'
+
+    def start(self, create_source_file: Callable[[], Tuple[Any, Any, Any]],
+              source: str, country: str) -> Tuple[Tuple[Any, Any, Any], bool]:
+        """(source_file_id, source_id, country_id) of the running run, or of a newly created one, and whether it resumed"""
+        if self.resumable:
+            self.run['resumes'] = self.run.get('resumes', 0) + 1
+            self.run['resumed_at'] = datetime.now().isoformat(timespec='seconds')
+            self._save()
+            return (self.run['source_file_id'], self.run['source_id'], self.run['country_id']), True
+        source_file_id, source_id, country_id = create_source_file()
+        self.run = {
+            'run_id': str(uuid.uuid4()),
+            'source_file_id': _plain(source_file_id),
+            'source_id': _plain(source_id),
+            'country_id': _plain(country_id),
+            'source': source,
+            'country': country,
+            'status': 'running',
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'finished_at': None,
+            'resumes': 0,
+            'stores': {},
+        }
+        self._save()
+        return (source_file_id, source_id, country_id), False
+
+    def _entry(self, store_index: int, store_id) -> Optional[Dict[str, Any]]:
+        entry = self.run['stores'].get(str(store_index))
+        if entry is None or str(entry['store_id']) != str(store_id):
+            return None
+        return entry
+
+    def store_written(self, store_index: int, store_id) -> bool:
+        entry = self._entry(store_index, store_id)
+        return entry is not None and entry.get('complete', True)
+
+    def partial_store(self, store_index: int, store_id) -> Optional[Dict[str, Any]]:
+        """next_category and spill_parts of a store cut short earlier in this run, None otherwise"""
+        entry = self._entry(store_index, store_id)
+        return entry if entry is not None and not entry.get('complete', True) else None
+
+    def partial_indexes(self) -> List[int]:
+        return sorted(int(index) for index, entry in self.run['stores'].items() if not entry.get('complete', True))
+
+    def mark_store_written(self, store_index: int, store_id, rows: int) -> None:
+        self.run['stores'][str(store_index)] = {'store_id': _plain(store_id), 'rows': int(rows), 'complete': True,
+                                                'written_at': datetime.now().isoformat(timespec='seconds')}
+        self._save()
+
+    def mark_store_partial(self, store_index: int, store_id, next_category: int, spill_parts: List[str]) -> None:
+        self.run['stores'][str(store_index)] = {'store_id': _plain(store_id), 'rows': 0, 'complete': False,
+                                                'next_category': int(next_category), 'spill_parts': list(spill_parts),
+                                                'written_at': None}
+        self._save()
+
+    def drop_store(self, store_index: int) -> None:
+        """Forget a store given up on, so it is neither skipped nor resumed"""
+        if self.run['stores'].pop(str(store_index), None) is not None:
+            self._save()
+
+    def finish(self) -> bool:
+        """Mark the run completed unless stores were cut short; returns whether it completed"""
+        if self.partial_indexes():
+            self._save()
+            return False
+        self.run['status'] = 'completed'
+        self.run['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        self._save()
+        return True
+
+
+def ensure_registry_tables(connection) -> None:
+    cursor = connection.cursor()
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+        RUN_ID STRING, SOURCE_FILE_ID STRING, SOURCE STRING, COUNTRY STRING, MACHINE_ID STRING,
+        STATUS STRING, STORES_WRITTEN NUMBER, RESUMES NUMBER, STARTED_AT TIMESTAMP_NTZ, FINISHED_AT TIMESTAMP_NTZ)""")
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {LOADS_TABLE} (
+        SOURCE_FILE_ID STRING, STORE_ID STRING, STORE_LINK STRING, TABLE_NAME STRING, ROWS NUMBER,
+        LOADED_AT TIMESTAMP_NTZ)""")
+    cursor.execute(f"ALTER TABLE {LOADS_TABLE} ADD COLUMN IF NOT EXISTS STORE_LINK STRING")
+
+
+def record_run(connection, run: Dict[str, Any], machine_id: str) -> None:
+    """Insert or update the run's row in SCRAPE_RUN"""
+    ensure_registry_tables(connection)
+    written = sum(entry.get('complete', True) for entry in run['stores'].values())
+    connection.cursor().execute(
+        f"""MERGE INTO {RUNS_TABLE} t USING (SELECT %s AS RUN_ID) s ON t.RUN_ID = s.RUN_ID
+            WHEN MATCHED THEN UPDATE SET STATUS = %s, STORES_WRITTEN = %s, RESUMES = %s, FINISHED_AT = %s
+            WHEN NOT MATCHED THEN INSERT (RUN_ID, SOURCE_FILE_ID, SOURCE, COUNTRY, MACHINE_ID, STATUS,
+                                          STORES_WRITTEN, RESUMES, STARTED_AT, FINISHED_AT)
+                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+        (run['run_id'], run['status'], written, run['resumes'], run['finished_at'],
+         run['run_id'], str(run['source_file_id']), run['source'], run['country'], machine_id, run['status'],
+         written, run['resumes'], run['started_at'], run['finished_at']))
+
+
+class StoreLoader:
+    """Writes products to a table at most once per (source_file_id, store_link)"""
+
+    def __init__(self, connection, table_name: str, write: Callable[[pd.DataFrame], int]):
+        self.connection = connection
+        self.table_name = table_name
+        self.write = write
+        self.loaded: Dict[str, Set[str]] = {}
+        self.current: Optional[Tuple[str, str]] = None
+        self.current_store_id: Optional[str] = None
+        self.current_rows = 0
+        self.skipped: Set[Tuple[str, str]] = set()
+        self.done: Set[Tuple[str, str]] = set()
+        self.key_column = 'STORE_LINK'
+        ensure_registry_tables(connection)
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = %s AND TABLE_SCHEMA = CURRENT_SCHEMA()",
+                       (table_name,))
+        self.table_exists = cursor.fetchone()[0] > 0
+        self.link_column_checked = False
+
+    def _loaded_stores(self, source_file_id: str) -> Set[str]:
+        if source_file_id not in self.loaded:
+            cursor = self.connection.cursor()
+            cursor.execute(f"SELECT COALESCE(STORE_LINK, STORE_ID) FROM {LOADS_TABLE} "
+                           f"WHERE SOURCE_FILE_ID = %s AND TABLE_NAME = %s",
+                           (source_file_id, self.table_name))
+            self.loaded[source_file_id] = {row[0] for row in cursor.fetchall()}
+        return self.loaded[source_file_id]
+
+    def _open(self, key: Tuple[str, str], store_id: str) -> None:
+        source_file_id, store_key = key
+        if key in self.done or store_key in self._loaded_stores(source_file_id):
+            self.skipped.add(key)
+            return
+        if self.table_exists:
+            # Rows of an upload that died before it was recorded
+            self.connection.cursor().execute(
+                f"DELETE FROM {self.table_name} WHERE SOURCE_FILE_ID = %s AND {self.key_column} = %s", key)
+        self.current, self.current_store_id, self.current_rows = key, store_id, 0
+
+    def _close(self) -> None:
+        if self.current is None:
+            return
+        store_link = self.current[1] if self.key_column == 'STORE_LINK' else None
+        self.connection.cursor().execute(
+            f"INSERT INTO {LOADS_TABLE} (SOURCE_FILE_ID, STORE_ID, STORE_LINK, TABLE_NAME, ROWS, LOADED_AT) "
+            f"VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP())",
+            (self.current[0], self.current_store_id, store_link, self.table_name, self.current_rows))
+        self.loaded.setdefault(self.current[0], set()).add(self.current[1])
+        self.done.add(self.current)
+        self.current = None
+
+    def add(self, chunk: pd.DataFrame) -> int:
+        """Write the chunk's rows of stores not loaded yet; returns the rows written"""
+        if 'SOURCE_FILE_ID' not in chunk.columns or 'STORE_ID' not in chunk.columns:
+            raise ValueError("Products need SOURCE_FILE_ID and STORE_ID columns for a per-store load")
+        # Files written before STORE_LINK existed can only be told apart by store id
+        self.key_column = 'STORE_LINK' if 'STORE_LINK' in chunk.columns else 'STORE_ID'
+        if self.key_column == 'STORE_LINK' and self.table_exists and not self.link_column_checked:
+            self.connection.cursor().execute(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS STORE_LINK STRING")
+        self.link_column_checked = True
+        source_file_ids = chunk['SOURCE_FILE_ID'].fillna('').astype(str)
+        store_ids = chunk['STORE_ID'].fillna('').astype(str)
+        store_keys = chunk[self.key_column].fillna('').astype(str)
+        # The scraper appends stores one after another, so each store is one contiguous block of rows
+        keys = source_file_ids + '\x1f' + store_keys
+        blocks = keys.ne(keys.shift()).cumsum()
+        written = 0
+        for _, rows in chunk.groupby(blocks, sort=False):
+            first = rows.index[0]
+            key = (source_file_ids[first], store_keys[first])
+            if key != self.current:
+                self._close()
+                self._open(key, store_ids[first])
+            if key == self.current:
+                written += self.write(rows)
+                self.current_rows += len(rows)
+                self.table_exists = True
+        return written
+
+    def finish(self) -> None:
+        self._close()
@@ -0,0 +1,87 @@
+"""Compiled store manifest for the seller list.
+
+The seller CSV carries large stringified-dict columns (tracking,
+store_labels, cart_preview...) that the scraper never reads. The manifest
+keeps only the columns the store loop needs, typed, in a JSON cache next to
+the CSV that is rebuilt whenever the CSV's mtime or size changes.
+"""
+import csv
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+MANIFEST_VERSION = 1
+MANIFEST_COLUMNS = {
+    'id': int,
+    'name': str,
+    'link': str,
+    'area_id': int,
+    'Url_id': int,
+    'currency_id': int,
+    'country_id': int,
+    'src_id': int,
+}
+
+
+def default_manifest_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + '.manifest.json'
+
+
+def _convert(value: str, column_type: type) -> Any:
+    if value == '':
+        return None
+    if column_type is int:
+        return int(float(value))
+    return value
+
+
+def _source_signature(csv_path: str) -> Dict[str, int]:
+    stat = os.stat(csv_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def compile_store_manifest(csv_path: str, manifest_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Parse the seller CSV into typed, column-pruned records and cache them"""
+    manifest_path = manifest_path or default_manifest_path(csv_path)
+    csv.field_size_limit(sys.maxsize)
+    records = []
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = {col: header.index(col) for col in MANIFEST_COLUMNS if col in header}
+        missing = [col for col in MANIFEST_COLUMNS if col not in positions]
+        if missing:
+            raise ValueError(f"Seller list {csv_path} is missing columns: {missing}")
+        for row in reader:
+            if not row:
+                continue
+            records.append({col: _convert(row[pos], MANIFEST_COLUMNS[col]) for col, pos in positions.items()})
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'source': _source_signature(csv_path),
+        'columns': list(MANIFEST_COLUMNS),
+        'records': records,
+    }
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
+    return records
+
+
+def load_store_manifest(csv_path: str, manifest_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Return store records, recompiling the manifest only when the CSV changed"""
+    manifest_path = manifest_path or default_manifest_path(csv_path)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if (manifest.get('version') == MANIFEST_VERSION
+                    and manifest.get('columns') == list(MANIFEST_COLUMNS)
+                    and manifest.get('source') == _source_signature(csv_path)):
+                return manifest['records']
+        except (ValueError, KeyError, OSError):
+            pass
+    return compile_store_manifest(csv_path, manifest_path)
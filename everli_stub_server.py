@@ -0,0 +1,225 @@
+"""Local stub of the Everli API for load and failure testing.
+
+Implements the three endpoints the scraper calls:
+
+- /sm/api/v3/locations/<loc>/stores/<store>/categories/tree
+- /sm/api/v3/locations/<loc>/stores/<store>/categories/<category>/<sub>
+- /sm/api/v3/stores (the keep-alive request)
+
+with a configurable catalog size, log-normal latency, 429 and 5xx rates
+and bearer-token expiry (401 once a token is older than token_ttl
+seconds). run_load_test drives main_execution against it and reports
+throughput, retry overhead and how the run recovered.
+"""
+import csv
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from everli_fixtures import make_listing_payload, make_tree_payload
+
+API_PREFIX = '/sm/api/v3'
+CATEGORY_PATH = re.compile(r'^/sm/api/v3/locations/(\d+)/stores/(\d+)/categories/(.+)$')
+
+
+class StubConfig:
+    """Catalog shape and failure injection settings for the stub server"""
+
+    def __init__(self, products_per_store: int = 5000, categories: int = 10, branches: int = 5,
+                 latency_median_ms: float = 20.0, latency_sigma: float = 0.5,
+                 rate_429: float = 0.0, rate_5xx: float = 0.0, token_ttl: Optional[float] = None,
+                 seed: Optional[int] = None):
+        self.products_per_store = products_per_store
+        self.categories = categories
+        self.branches = branches
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.token_ttl = token_ttl
+        self.random = random.Random(seed)
+
+    @property
+    def leaf_categories(self) -> int:
+        return self.categories * self.branches
+
+    def products_in_category(self, index: int) -> int:
+        base, extra = divmod(self.products_per_store, self.leaf_categories)
+        return base + (1 if index < extra else 0)
+
+
+class StubEverliServer:
+    """Threaded HTTP server serving synthetic Everli responses"""
+
+    def __init__(self, config: StubConfig, host: str = '127.0.0.1', port: int = 0):
+        self.config = config
+        self.lock = threading.Lock()
+        self.token_issued: Dict[str, float] = {}
+        self.stats: Dict[str, int] = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self) -> 'StubEverliServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _latency(self) -> float:
+        with self.lock:
+            return self.config.random.lognormvariate(math.log(self.config.latency_median_ms / 1000.0),
+                                                     self.config.latency_sigma)
+
+    def _injected_failure(self) -> Optional[int]:
+        with self.lock:
+            draw = self.config.random.random()
+        if draw < self.config.rate_429:
+            return 429
+        if draw < self.config.rate_429 + self.config.rate_5xx:
+            return 503
+        return None
+
+    def _token_expired(self, authorization: str, refresh: bool = False) -> bool:
+        if self.config.token_ttl is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            issued = self.token_issued.setdefault(authorization, now)
+            if refresh:
+                self.token_issued[authorization] = now
+                return False
+            return now - issued > self.config.token_ttl
+
+    def tree_payload(self, location_id: str, store_id: str) -> Dict[str, Any]:
+        return make_tree_payload(self.config.categories, self.config.branches, location_id, store_id)
+
+    def listing_payload(self, store_id: str, category_path: str) -> Optional[Dict[str, Any]]:
+        parts = category_path.split('/')
+        if len(parts) != 2 or not all(part.isdigit() for part in parts):
+            return None
+        index = int(parts[0]) * self.config.branches + int(parts[1])
+        if index >= self.config.leaf_categories:
+            return None
+        first_id = int(store_id) * 10000000 + index * 100000
+        return make_listing_payload(self.config.products_in_category(index), first_id=first_id)
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload: Optional[Dict[str, Any]] = None) -> None:
+                body = json.dumps(payload if payload is not None else {}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(body)
+                stub.count(f'status_{status}')
+
+            def do_GET(self):
+                time.sleep(stub._latency())
+                path = re.sub(r'/+', '/', urlsplit(self.path).path)
+                authorization = self.headers.get('authorization', '')
+                stub.count('requests')
+                if path == f'{API_PREFIX}/stores':
+                    stub.count('keep_alive')
+                    stub._token_expired(authorization, refresh=True)
+                    return self._send(200, {'data': []})
+                if stub._token_expired(authorization):
+                    return self._send(401, {'message': 'Unauthenticated'})
+                failure = stub._injected_failure()
+                if failure:
+                    return self._send(failure, {'message': 'injected failure'})
+                match = CATEGORY_PATH.match(path)
+                if not match:
+                    return self._send(404, {'message': 'not found'})
+                location_id, store_id, category_path = match.groups()
+                if category_path == 'tree':
+                    return self._send(200, stub.tree_payload(location_id, store_id))
+                listing = stub.listing_payload(store_id, category_path)
+                if listing is None:
+                    return self._send(404, {'message': 'unknown category'})
+                return self._send(200, listing)
+
+        return Handler
+
+
+def write_seller_list(path: str, num_stores: int) -> str:
+    """Write a minimal seller list CSV with num_stores synthetic stores"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['src_id', 'country_id', 'area_id', 'currency_id', 'Url_id', 'id', 'name', 'link'])
+        for n in range(num_stores):
+            store_id = 9000 + n
+            writer.writerow([22, 4, 1, 4, 15716, store_id, f'Stub Store {n}',
+                             f'everli://app/locations/11331/stores/{store_id}'])
+    return path
+
+
+def run_load_test(config: StubConfig, num_stores: int = 3, request_pause: float = 0.0,
+                  output_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Run the scraper against a local stub server and summarize how it behaved"""
+    from Automated_everli import main_execution
+
+    server = StubEverliServer(config).start()
+    output_dir = output_dir or tempfile.mkdtemp(prefix='everli_loadtest_')
+    os.makedirs(output_dir, exist_ok=True)
+    seller_list_path = write_seller_list(os.path.join(output_dir, 'stub_seller_list.csv'), num_stores)
+    started = time.time()
+    try:
+        metrics = main_execution(output_dir=output_dir, api_base=server.api_base, request_pause=request_pause,
+                                 stub_services=True, seller_list_path=seller_list_path)
+    finally:
+        server.stop()
+    elapsed = time.time() - started
+
+    def counter(name: str, **labels) -> float:
+        if metrics is None:
+            return 0
+        series = metrics.counters.get(name, {})
+        wanted = set((k, str(v)) for k, v in labels.items())
+        return sum(value for key, value in series.items() if wanted <= set(key))
+
+    products = counter('products_total')
+    retry_sleep = counter('retry_sleep_seconds_total')
+    return {
+        'elapsed_seconds': round(elapsed, 2),
+        'products': int(products),
+        'expected_products': config.products_per_store * num_stores,
+        'products_per_second': round(products / elapsed, 1) if elapsed else None,
+        'server': dict(server.stats),
+        'retries': int(counter('retries_total')),
+        'retry_sleep_seconds': round(retry_sleep, 2),
+        'retry_overhead_pct': round(100 * retry_sleep / elapsed, 1) if elapsed else None,
+        'reauthentications': int(counter('reauthentications_total')),
+        'categories_skipped': int(counter('categories_total', status='skipped')),
+        'stores_ok': int(counter('stores_total', status='ok')),
+        'stores_failed': int(counter('stores_total', status='failed')),
+        'output_dir': output_dir,
+    }
@@ -0,0 +1,158 @@
+"""Multi-target runs: several (source, country, seller list) targets in one process.
+
+A job config is a JSON file:
+
+    {
+      "defaults": {"requests_per_minute": 40},
+      "targets": [
+        {"name": "everli-it", "country": "ITALY", "api_country": "ITA",
+         "whitelabel": "it.everli.com", "seller_list": "Everli_Italy_Seller_List_Needed.csv"},
+        {"name": "everli-fr", "country": "FRANCE", "api_country": "FRA",
+         "whitelabel": "fr.everli.com", "seller_list": "Everli_France_Seller_List.csv",
+         "requests_per_minute": 20}
+      ]
+    }
+
+run_targets logs in once and runs the targets one after another through
+main_execution, sharing the bot (its requests.Session connection pool,
+token and StructuredLogger), one RunMetrics and one Snowflake connection
+opened on first use. Each target keeps its own output directory and
+checkpoint, its own retry budget, and a RequestPacer that spaces its
+requests by its requests_per_minute. Requests carry the target's
+x-s24-country and x-s24-whitelabel headers, and log rows its whitelabel
+as their source.
+"""
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from everli_parsing import API_BASE
+
+TARGET_FIELDS = ('name', 'source', 'country', 'api_country', 'whitelabel', 'seller_list', 'output_dir',
+                 'api_base', 'scraper_id', 'scraper_number', 'requests_per_minute')
+
+
+class ScrapeTarget:
+    """One (source, country, seller list) combination to scrape"""
+
+    def __init__(self, name: str, source: str = 'Everli', country: str = 'ITALY', api_country: str = 'ITA',
+                 whitelabel: str = 'it.everli.com', seller_list: str = 'Everli_Italy_Seller_List_Needed.csv',
+                 output_dir: Optional[str] = None, api_base: str = API_BASE, scraper_id: str = '0',
+                 scraper_number: str = '1', requests_per_minute: Optional[float] = None):
+        self.name = name
+        self.source = source
+        self.country = country
+        self.api_country = api_country
+        self.whitelabel = whitelabel
+        self.seller_list = seller_list
+        self.output_dir = output_dir or os.path.join('runs', name)
+        self.api_base = api_base
+        self.scraper_id = str(scraper_id)
+        self.scraper_number = str(scraper_number)
+        self.requests_per_minute = requests_per_minute
+
+    def request_interval(self, default: float) -> float:
+        """Seconds between requests: from requests_per_minute, else default"""
+        if self.requests_per_minute:
+            return 60.0 / self.requests_per_minute
+        return default
+
+    def __repr__(self) -> str:
+        return f'ScrapeTarget({self.name!r}, {self.source!r}, {self.country!r}, {self.whitelabel!r})'
+
+
+class RequestPacer:
+    """Spaces requests at least interval seconds apart, sleeping only for what remains"""
+
+    def __init__(self, interval: float, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self.sleep = sleep
+        self.clock = clock
+        self.last = None
+
+    def wait(self) -> None:
+        if self.interval > 0 and self.last is not None:
+            remaining = self.last + self.interval - self.clock()
+            if remaining > 0:
+                self.sleep(remaining)
+        self.last = self.clock()
+
+
+class SharedResources:
+    """Bot, metrics and Snowflake connection reused by every target of a run"""
+
+    def __init__(self, bot, metrics, connect: Optional[Callable[[], Any]] = None):
+        self.bot = bot
+        self.metrics = metrics
+        self.connect = connect
+        self.connection = None
+        self.total_data_size = 0
+
+    def snowflake_connection(self):
+        """The run's Snowflake connection, opened on first use"""
+        if self.connection is None:
+            self.connection = self.connect()
+        return self.connection
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def load_job_config(path: str) -> List[ScrapeTarget]:
+    """Targets from a job config, each with the config's defaults applied"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    defaults = config.get('defaults', {})
+    targets = []
+    for entry in config.get('targets', []):
+        fields = {**defaults, **entry}
+        unknown = set(fields) - set(TARGET_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown target settings in {path}: {sorted(unknown)}")
+        if 'name' not in fields:
+            raise ValueError(f"Target without a name in {path}: {entry}")
+        targets.append(ScrapeTarget(**fields))
+    if not targets:
+        raise ValueError(f"No targets in {path}")
+    for attribute in ('name', 'output_dir'):
+        values = [os.path.normpath(str(getattr(target, attribute))) for target in targets]
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            raise ValueError(f"Targets in {path} share {attribute}: {duplicates}")
+    return targets
+
+
+def run_targets(targets: List[ScrapeTarget], stub_services: bool = False, **options) -> Dict[str, str]:
+    """Run targets in order in this process; returns 'ok' or 'failed' per target name"""
+    from Automated_everli import EverliRegistrationBot, get_snowflake_connection, main_execution
+    from everli_metrics import RunMetrics
+
+    bot = EverliRegistrationBot()
+    bot.logger.log_job_start()
+    metrics = RunMetrics(bot.LOG_DIR, bot.job_id)
+    shared = SharedResources(bot, metrics, connect=get_snowflake_connection)
+    statuses = {}
+    try:
+        for target in targets:
+            bot.logger.log_info(f"Starting target {target.name}: {target.source} {target.country} "
+                                f"({target.whitelabel}) into {target.output_dir}")
+            products_before = metrics.counter_total('products_total')
+            try:
+                ran = main_execution(target=target, shared=shared, stub_services=stub_services, **options)
+                statuses[target.name] = 'ok' if ran is not None else 'failed'
+            except Exception as e:
+                bot.logger.log_error(f"Target {target.name} failed: {e}")
+                statuses[target.name] = 'failed'
+            metrics.inc('targets_total', status=statuses[target.name])
+            metrics.inc('target_products_total', metrics.counter_total('products_total') - products_before,
+                        target=target.name)
+    finally:
+        shared.close()
+        metrics.export()
+        bot.logger.log_info(f"Run metrics exported to {metrics.json_path} and {metrics.prometheus_path}")
+        bot.logger.log_job_end(shared.total_data_size)
+    return statuses
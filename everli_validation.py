@@ -0,0 +1,102 @@
+"""Column-wise data-quality checks for a store's product batch.
+
+Every check is a vectorized boolean mask over the whole batch, so the
+stage costs a few milliseconds per thousand products. Rows failing any
+check are split off with a quarantine_reason column so they can be written
+to a side file instead of the main output.
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+QUANTITY_PATTERN = r'(?:(?P<count>\d+)\s*[xX]\s*)?(?P<amount>\d+(?:[.,]\d+)?)\s*(?P<unit>kg|g|mg|l|lt|cl|ml)\b'
+UNIT_FACTORS = {'kg': 1.0, 'g': 0.001, 'mg': 0.000001, 'l': 1.0, 'lt': 1.0, 'cl': 0.01, 'ml': 0.001}
+
+
+def to_number(series: pd.Series) -> pd.Series:
+    """Coerce prices such as 1.99, '1,99' or '1,99 €' to floats, NaN when unparseable"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    cleaned = (series.astype(str)
+               .str.replace(r'[^\d,.\-]', '', regex=True)
+               .str.replace(',', '.', regex=False))
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def quantity_in_base_units(series: pd.Series) -> pd.Series:
+    """Parse pack sizes like '500 g' or '6 x 33 cl' into kg / litres"""
+    # Pack sizes repeat heavily within a store, so parse each distinct value once.
+    codes, uniques = pd.factorize(series.astype(str).str.lower())
+    parts = pd.Series(uniques).str.extract(QUANTITY_PATTERN)
+    amount = pd.to_numeric(parts['amount'].str.replace(',', '.', regex=False), errors='coerce')
+    count = pd.to_numeric(parts['count'], errors='coerce').fillna(1)
+    factor = parts['unit'].map(UNIT_FACTORS)
+    parsed = (amount * count * factor).to_numpy()
+    return pd.Series(parsed[codes], index=series.index)
+
+
+class ProductValidator:
+    """Vectorized validation of products before they are written out"""
+
+    def __init__(self, id_column: str = 'id', price_column: str = 'price',
+                 unit_price_column: str = 'unit_price', quantity_column: str = 'quantity',
+                 unit_price_tolerance: float = 0.05, sub_category_column: str = 'sub_cat_name_org'):
+        self.id_column = id_column
+        self.sub_category_column = sub_category_column
+        self.price_column = price_column
+        self.unit_price_column = unit_price_column
+        self.quantity_column = quantity_column
+        self.unit_price_tolerance = unit_price_tolerance
+
+    def check(self, batch: pd.DataFrame) -> Dict[str, pd.Series]:
+        """Return one boolean mask per failed check, skipping checks whose columns are absent"""
+        checks = {}
+        price = None
+        if self.price_column in batch.columns:
+            price = to_number(batch[self.price_column])
+            checks['missing_price'] = price.isna()
+            checks['non_positive_price'] = price.le(0)
+        if self.id_column in batch.columns:
+            ids = batch[self.id_column]
+            checks['missing_id'] = ids.isna()
+            # A product listed under several subcategories is a legitimate row per subcategory
+            keys = [self.id_column] + ([self.sub_category_column] if self.sub_category_column in batch.columns else [])
+            checks['duplicate_id'] = batch.duplicated(subset=keys, keep='first') & ids.notna()
+        if (price is not None and self.unit_price_column in batch.columns
+                and self.quantity_column in batch.columns):
+            unit_price = to_number(batch[self.unit_price_column])
+            expected = price / quantity_in_base_units(batch[self.quantity_column])
+            relative_gap = (unit_price - expected).abs() / expected
+            checks['unit_price_mismatch'] = relative_gap.gt(self.unit_price_tolerance)
+        return checks
+
+    def validate(self, batch: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, int]]:
+        """Split batch into (valid, quarantined, counts per check)"""
+        batch = batch.reset_index(drop=True)
+        checks = self.check(batch)
+        counts = {name: int(mask.sum()) for name, mask in checks.items()}
+        if not checks:
+            return batch, batch.iloc[0:0], counts
+        failed = pd.concat(checks, axis=1).fillna(False).astype(bool)
+        bad_rows = failed.any(axis=1)
+        quarantined = batch[bad_rows].copy()
+        if not quarantined.empty:
+            reasons = pd.Series('', index=quarantined.index)
+            for name in failed.columns:
+                reasons = reasons + failed.loc[bad_rows, name].map({True: name + ';', False: ''})
+            quarantined['quarantine_reason'] = reasons.str.rstrip(';')
+        return batch[~bad_rows], quarantined, counts
+
+
+def write_quarantine(quarantined: pd.DataFrame, quarantine_csv_path: str) -> Optional[str]:
+    """Append quarantined rows to the side CSV, returning its path when written"""
+    if quarantined.empty:
+        return None
+    quarantined.to_csv(
+        quarantine_csv_path,
+        mode='a',
+        index=False,
+        header=not os.path.exists(quarantine_csv_path)
+    )
+    return quarantine_csv_path
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from everli_compaction import compact, load_manifest, query
+
+MILAN = 'everli://app/locations/11331/stores/4426'
+SESTO = 'everli://app/locations/25078/stores/4426'
+
+
+def products(rows):
+    return pd.DataFrame([{'id': 7, 'name': 'Latte', 'price': price, 'nw': '2025-01-01 08:00:00',
+                          'store_id': 4426, 'store_link': link} for link, price in rows])
+
+
+def test_locations_scraped_in_the_same_second_keep_their_rows(tmp_path):
+    csv_path = tmp_path / 'Data_Products_Eveli.csv'
+    products([(MILAN, 1.29), (SESTO, 1.09)]).to_csv(csv_path, index=False)
+
+    totals = compact([str(csv_path)], str(tmp_path / 'dataset'))
+
+    assert totals['partitions_written'] == 2
+    assert sorted(load_manifest(str(tmp_path / 'dataset'))['files']) == [
+        'date=2025-01-01/store_id=4426/location_id=11331/part.parquet',
+        'date=2025-01-01/store_id=4426/location_id=25078/part.parquet',
+    ]
+    rows = query(str(tmp_path / 'dataset'), store_ids=[4426]).sort_values('price')
+    assert rows['store_link'].tolist() == [SESTO, MILAN]
+
+
+def test_rows_under_the_wrong_column_names_are_refused(tmp_path):
+    csv_path = tmp_path / 'Data_Products_Eveli.csv'
+    first = products([(MILAN, 1.29)])
+    # A later store of the same width with name and price swapped, appended under the first header
+    later = products([(SESTO, 1.09)])[['id', 'price', 'name', 'nw', 'store_id', 'store_link']]
+    first.to_csv(csv_path, index=False)
+    later.to_csv(csv_path, mode='a', header=False, index=False)
+
+    with pytest.raises(ValueError, match='line 3'):
+        compact([str(csv_path)], str(tmp_path / 'dataset'))
+
+
+def test_store_columns_out_of_order_are_refused(tmp_path):
+    csv_path = tmp_path / 'Data_Products_Eveli.csv'
+    products([(MILAN, 1.29)])[['id', 'name', 'price', 'store_id', 'nw', 'store_link']].to_csv(csv_path, index=False)
+
+    with pytest.raises(ValueError, match='not in the order'):
+        compact([str(csv_path)], str(tmp_path / 'dataset'))
@@ -0,0 +1,50 @@
+import os
+
+import pandas as pd
+
+from everli_memory import MemoryBudget, current_rss
+
+
+def test_batches_match_a_single_concat(tmp_path):
+    frames = [
+        pd.DataFrame({'id': [1, 2], 'price': [1.5, 2.0], 'name': ['a', 'b']}),
+        pd.DataFrame({'id': [3], 'price': [4], 'brand': ['x']}),
+        pd.DataFrame({'id': [4, 5], 'price': [0.5, None], 'name': ['c', None]}),
+    ]
+    budget = MemoryBudget(str(tmp_path / 'spill'), limit_bytes=1)
+    budget.begin_store(0)
+    assert budget.add(frames[0]) and budget.add(frames[1])
+    budget.limit_bytes = None
+    budget.add(frames[2])
+
+    batches = list(budget.batches())
+
+    assert len(batches) == 3
+    assert all(list(batch.columns) == ['id', 'price', 'name', 'brand'] for batch in batches)
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), pd.concat(frames, ignore_index=True))
+    budget.end_store()
+    assert not os.path.exists(str(tmp_path / 'spill'))
+
+
+def test_spilling_keeps_the_store_peak_near_the_limit(tmp_path, monkeypatch):
+    from Automated_everli import main_execution
+    from everli_stub_server import StubConfig, StubEverliServer, write_seller_list
+
+    monkeypatch.chdir(tmp_path)
+    output_dir = str(tmp_path / 'out')
+    os.makedirs(output_dir)
+    seller_list_path = write_seller_list(os.path.join(output_dir, 'stub_seller_list.csv'), 1)
+    # The store's products take about 100 MB in memory, far more than the budget above the current RSS
+    limit_mb = current_rss() / 1024 ** 2 + 40
+    server = StubEverliServer(StubConfig(products_per_store=200000, categories=8, branches=5,
+                                         latency_median_ms=0.1, seed=1)).start()
+    try:
+        metrics = main_execution(output_dir=output_dir, api_base=server.api_base, request_pause=0,
+                                 stub_services=True, seller_list_path=seller_list_path,
+                                 memory_limit_mb=limit_mb, arrow_output=True)
+    finally:
+        server.stop()
+
+    peak_mb = metrics.gauges['peak_rss_bytes'][()] / 1024 ** 2
+    assert sum(1 for _ in open(os.path.join(output_dir, 'Data_Products_Eveli.csv'))) == 200001
+    assert peak_mb <= limit_mb * 1.15
@@ -0,0 +1,39 @@
+import pandas as pd
+
+from everli_price_history import PriceHistory
+
+MILAN = 'everli://app/locations/11331/stores/4426'
+SESTO = 'everli://app/locations/25078/stores/4426'
+
+
+def run(nw, prices, links=(MILAN, SESTO)):
+    return pd.DataFrame([{'store_id': 4426, 'store_link': link, 'id': 7, 'name': 'Latte', 'price': price,
+                          'full_price': price, 'available': True, 'nw': nw}
+                         for link, price in zip(links, prices)])
+
+
+def test_two_locations_of_one_store_keep_separate_histories(tmp_path):
+    with PriceHistory(str(tmp_path / 'history.sqlite')) as history:
+        for day in range(1, 4):
+            history.ingest(run(f'2025-01-0{day} 08:00:00', [1.19, 1.29]))
+
+        segments = history.history(7)
+        assert segments['store_link'].tolist() == [MILAN, SESTO]
+        assert segments['price'].tolist() == [1.19, 1.29]
+        assert segments['observations'].tolist() == [3, 3]
+        assert history.changes(4426, '2025-01-01').empty
+
+        history.ingest(run('2025-01-04 08:00:00', [1.19, 1.09]))
+        changes = history.changes(4426, '2025-01-01')
+        assert changes['store_link'].tolist() == [SESTO]
+        assert changes[['old_price', 'new_price']].values.tolist() == [[1.29, 1.09]]
+
+
+def test_files_without_store_link_are_keyed_by_store_id(tmp_path):
+    with PriceHistory(str(tmp_path / 'history.sqlite')) as history:
+        history.ingest(run('2025-01-01 08:00:00', [1.19], links=[MILAN]).drop(columns='store_link'))
+        history.ingest(run('2025-01-02 08:00:00', [1.19], links=[MILAN]).drop(columns='store_link'))
+
+        seen = history.seen(7)
+        assert seen['store_link'].tolist() == ['4426']
+        assert seen['segments'].tolist() == [1]
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from everli_price_index import PriceIndex
+
+MILAN = 'everli://app/locations/11331/stores/4426'
+SESTO = 'everli://app/locations/25078/stores/4426'
+
+
+def test_locations_of_one_store_id_are_separate_stores():
+    products = pd.DataFrame({
+        'store_id': [4426, 4426, 5232],
+        'store_link': [MILAN, SESTO, 'everli://app/locations/11331/stores/5232'],
+        'name': ['Latte intero'] * 3,
+        'brand': ['Granarolo'] * 3,
+        'quantity': ['1 l'] * 3,
+        'price': [1.29, 1.09, 1.19],
+    })
+
+    index = PriceIndex.build(products)
+
+    assert index.shape == (1, 3)
+    row = index.row(index.keys[0])
+    assert row[MILAN] == 1.29 and row[SESTO] == 1.09
+    assert index.comparison(value='price')['cheapest_store'].tolist() == [SESTO]
+
+
+def test_store_id_is_the_store_axis_without_store_link():
+    products = pd.DataFrame({'store_id': [4426, 5232], 'name': ['Latte'] * 2, 'brand': ['Granarolo'] * 2,
+                             'quantity': ['1 l'] * 2, 'price': [1.29, 1.19]})
+
+    assert PriceIndex.build(products).stores.tolist() == ['4426', '5232']
@@ -0,0 +1,39 @@
+import itertools
+import os
+from datetime import datetime, timedelta
+
+from everli_replay import compare_outputs
+
+
+class TickingDatetime(datetime):
+    """A clock that moves one second per reading, so any two readings differ"""
+
+    ticks = itertools.count()
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(2026, 1, 1, tzinfo=tz) + timedelta(seconds=next(cls.ticks))
+
+
+def test_replay_reproduces_the_recorded_run_byte_for_byte(tmp_path, monkeypatch):
+    import Automated_everli
+    from everli_stub_server import StubConfig, StubEverliServer, write_seller_list
+
+    monkeypatch.chdir(tmp_path)
+    seller_list = write_seller_list('sellers.csv', 2)
+    os.makedirs('recorded')
+    server = StubEverliServer(StubConfig(products_per_store=300, categories=2, branches=3,
+                                         latency_median_ms=1, seed=1)).start()
+    try:
+        with monkeypatch.context() as patched:
+            patched.setattr(Automated_everli, 'datetime', TickingDatetime)
+            Automated_everli.main_execution(record_path='fixtures.zip', output_dir='recorded',
+                                            api_base=server.api_base, request_pause=0, stub_services=True,
+                                            seller_list_path=seller_list)
+    finally:
+        server.stop()
+    Automated_everli.main_execution(replay_path='fixtures.zip', output_dir='replayed', api_base=server.api_base,
+                                    seller_list_path=seller_list)
+
+    assert os.path.getsize('recorded/Data_Products_Eveli.csv') > 0
+    assert compare_outputs('recorded', 'replayed') == []
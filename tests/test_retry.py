@@ -0,0 +1,51 @@
+import json
+
+import pytest
+import requests
+
+from everli_retry import RetryBudget, RetryExhausted, RetryPolicy
+
+
+class QuietLogger:
+    def log_warning(self, message):
+        pass
+
+
+def unauthorized():
+    response = requests.Response()
+    response.status_code = 401
+    raise requests.HTTPError('401 Unauthorized', response=response)
+
+
+def test_reauth_cap_exhausts_the_budget():
+    budget = RetryBudget(max_reauth=2)
+    policy = RetryPolicy(QuietLogger(), budget=budget, sleep=lambda delay: None)
+
+    with pytest.raises(RetryExhausted):
+        policy.execute(unauthorized, 'http://stub/categories/0', on_auth=lambda: True)
+
+    assert budget.reauth == 2
+    assert budget.exhausted()
+
+
+def test_store_is_cut_short_when_reauth_runs_out(tmp_path, monkeypatch):
+    from everli_stub_server import StubConfig, run_load_test
+
+    monkeypatch.chdir(tmp_path)
+    output_dir = str(tmp_path / 'out')
+    # Tokens outlive fewer requests than the run makes, so the re-auth cap is reached mid-store
+    config = StubConfig(products_per_store=600, categories=3, branches=4, latency_median_ms=2,
+                        token_ttl=0.05, seed=1)
+    result = run_load_test(config, num_stores=2, request_pause=0.03, output_dir=output_dir)
+
+    run = json.load(open(tmp_path / 'out' / 'Everli_run.json'))
+    assert result['categories_skipped'] == 0
+    assert run['status'] == 'running'
+    assert run['stores']['0']['complete'] is False
+
+    # Resuming without token expiry finishes the store instead of leaving it short
+    run_load_test(StubConfig(products_per_store=600, categories=3, branches=4, latency_median_ms=2, seed=1),
+                  num_stores=2, output_dir=output_dir)
+    run = json.load(open(tmp_path / 'out' / 'Everli_run.json'))
+    assert run['status'] == 'completed'
+    assert [entry['rows'] for entry in run['stores'].values()] == [600, 600]
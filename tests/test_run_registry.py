@@ -0,0 +1,110 @@
+import re
+
+import pandas as pd
+
+from everli_run_registry import StoreLoader
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        self.db.statements.append((sql, params))
+        if sql.startswith('SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES'):
+            self.result = [(int(params[0] in self.db.tables),)]
+        elif sql.startswith('SELECT COALESCE(STORE_LINK, STORE_ID)'):
+            self.result = [(link or store_id,) for source_file_id, store_id, link, table, _ in self.db.loads
+                           if (source_file_id, table) == tuple(params)]
+        elif sql.startswith('INSERT INTO SCRAPE_RUN_LOAD'):
+            self.db.loads.append(tuple(params))
+        elif sql.startswith('DELETE FROM'):
+            column = re.search(r'AND (\w+) = %s', sql).group(1)
+            rows = self.db.tables['PRODUCTS']
+            keep = ~((rows['SOURCE_FILE_ID'] == params[0]) & (rows[column] == params[1]))
+            self.db.tables['PRODUCTS'] = rows[keep]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self):
+        self.tables = {}
+        self.loads = []
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def write(self, rows):
+        self.tables['PRODUCTS'] = pd.concat([self.tables.get('PRODUCTS'), rows], ignore_index=True)
+        return len(rows)
+
+
+def products(blocks):
+    return pd.DataFrame([{'SOURCE_FILE_ID': '7', 'STORE_ID': store_id, 'STORE_LINK': link, 'ID': str(n)}
+                         for store_id, link, count in blocks for n in range(count)])
+
+
+def load(connection, chunk):
+    loader = StoreLoader(connection, 'PRODUCTS', connection.write)
+    written = loader.add(chunk)
+    loader.finish()
+    return loader, written
+
+
+def test_same_store_id_in_two_locations_loads_both_blocks():
+    connection = FakeConnection()
+    chunk = products([('4426', 'everli://app/locations/11331/stores/4426', 3),
+                      ('5232', 'everli://app/locations/11331/stores/5232', 2),
+                      ('4426', 'everli://app/locations/25078/stores/4426', 4)])
+
+    loader, written = load(connection, chunk)
+
+    assert written == 9
+    assert not loader.skipped
+    assert len(connection.tables['PRODUCTS']) == 9
+    assert [(store_id, link, rows) for _, store_id, link, _, rows in connection.loads] == [
+        ('4426', 'everli://app/locations/11331/stores/4426', 3),
+        ('5232', 'everli://app/locations/11331/stores/5232', 2),
+        ('4426', 'everli://app/locations/25078/stores/4426', 4),
+    ]
+
+    # A rerun skips both locations and leaves their rows in place
+    loader, written = load(connection, chunk)
+    assert written == 0
+    assert len(loader.skipped) == 3
+    assert len(connection.tables['PRODUCTS']) == 9
+
+
+def test_interrupted_location_is_reloaded_without_touching_the_other():
+    connection = FakeConnection()
+    first = products([('4426', 'everli://app/locations/11331/stores/4426', 3)])
+    second = products([('4426', 'everli://app/locations/25078/stores/4426', 4)])
+    load(connection, first)
+    # The second location's upload died before it was recorded
+    connection.write(second.head(2))
+
+    _, written = load(connection, pd.concat([first, second], ignore_index=True))
+
+    assert written == 4
+    counts = connection.tables['PRODUCTS']['STORE_LINK'].value_counts()
+    assert counts['everli://app/locations/11331/stores/4426'] == 3
+    assert counts['everli://app/locations/25078/stores/4426'] == 4
+
+
+def test_files_without_store_link_are_keyed_by_store_id():
+    connection = FakeConnection()
+    chunk = products([('4426', None, 3), ('5232', None, 2)]).drop(columns='STORE_LINK')
+
+    _, written = load(connection, chunk)
+    assert written == 5
+    loader, written = load(connection, chunk)
+    assert written == 0
+    assert len(loader.skipped) == 2